@@ -1,39 +1,270 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify
-from utils.auth import create_user, authenticate_user, validate_email, validate_password
-from utils.filemanager import FileManager
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, g, send_file
+from utils.auth import create_user, authenticate_user, validate_email, validate_password, init_database
+from utils.passwords import HasherBusy, hashing_pool
+from utils.filemanager import FileManager, DUPLICATE_NAME
+from utils.db import pool_health
+from utils.uploads import ChunkedUploads
+from utils.purger import TrashPurger
+from utils.admission import UploadAdmission, UploadRejected
+from utils.assets import AssetManifest
+from utils.sessions import ServerSideSessionInterface, get_session_store
+from utils.deployment import check_deployment, deployment_info, load_secret_key
+from utils.http_files import send_stored_file, SERVE_MODES
+from utils.quotas import is_quota_error
+from utils.zipstream import stream_zip
+from utils import config, metrics
 import os
+import time
+from datetime import datetime
+from functools import partial
+from urllib.parse import unquote
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator, FileWrapper
+
+# Refuse to start with a deployment the databases cannot support
+problems = check_deployment()
+if problems:
+    raise RuntimeError("Invalid deployment configuration:\n  " + "\n  ".join(problems))
 
 app = Flask(__name__)
-app.secret_key = 'my_secret_key'  # Change this to a more secure key in production
+app.secret_key = load_secret_key()
+app.config['SESSION_COOKIE_SECURE'] = config.SESSION_COOKIE_SECURE
+
+# Apply pending schema migrations once at startup
+init_database()
+
+# Server-side sessions can be revoked and are shared by every worker
+session_store = get_session_store()
+if session_store is not None:
+    app.session_interface = ServerSideSessionInterface(session_store)
 
 # Initialize file manager
 file_manager = FileManager()
 
 # Configure upload settings
-UPLOAD_FOLDER = 'uploads'
-MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB max file size
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+UPLOAD_FOLDER = config.UPLOAD_FOLDER
+MAX_FILE_SIZE = config.MAX_FILE_SIZE  # 16MB max for single-request uploads
+app.config['MAX_CONTENT_LENGTH'] = max(MAX_FILE_SIZE, config.MAX_CHUNK_SIZE)
 
 # Create upload directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Resumable uploads for files larger than a single request allows
+chunked_uploads = ChunkedUploads()
+
+# Trashed files are purged in the background once past the retention period
+trash_purger = TrashPurger(file_manager)
+
+# Uploads are admitted (or refused) before their body is read
+upload_admission = UploadAdmission()
+
+# Endpoints whose request bodies are file uploads
+UPLOAD_ENDPOINTS = ('upload_file', 'upload_batch', 'upload_chunk')
+
+# Fingerprinted static assets; templates link them with asset_url('css/file.css')
+assets = AssetManifest(os.path.join(app.root_path, config.ASSET_FOLDER))
+app.add_template_global(assets.url, 'asset_url')
+
+# How file bodies are sent: directly, or handed off to the reverse proxy
+if config.FILE_SERVE_MODE not in SERVE_MODES:
+    raise RuntimeError(f"LOCALDRIVE_FILE_SERVE_MODE must be one of {', '.join(SERVE_MODES)}")
+
+# Endpoints whose response bodies count as file downloads
+DOWNLOAD_ENDPOINTS = ('download_file', 'preview_file', 'download_zip')
+
+def _count_bytes(body, counter):
+    """Pass a streamed body through, tallying its size into ``counter``."""
+    try:
+        for chunk in body:
+            counter[0] += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+def _on_body_closed(response, callback):
+    """Run ``callback`` once the server has finished sending the body."""
+    empty = request.method == 'HEAD' or response.status_code in (204, 304)
+    if not response.direct_passthrough or empty:
+        response.call_on_close(callback)
+        return
+    # Passthrough bodies bypass Response.close(); hook the iterable itself
+    body = response.response
+    if isinstance(body, request.environ.get('wsgi.file_wrapper', FileWrapper)):
+        # Keep the server's file wrapper type so sendfile() still applies
+        close = body.close
+        def close_and_record():
+            try:
+                close()
+            finally:
+                callback()
+        body.close = close_and_record
+    else:
+        response.response = ClosingIterator(body, callback)
+
+@app.before_request
+def start_background_jobs():
+    trash_purger.ensure_started()
+
+@app.before_request
+def start_request_metrics():
+    if not config.METRICS_ENABLED:
+        return
+    g.metrics_started = time.perf_counter()
+    g.metrics_finished = False
+    metrics.HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    if not config.METRICS_ENABLED or 'metrics_started' not in g:
+        return response
+    
+    started = g.metrics_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    endpoint = request.endpoint
+    method = request.method
+    path = request.path
+    status = response.status_code
+    received = request.content_length or 0
+    sent = [response.content_length or 0]
+    if response.content_length is None and response.is_streamed and not response.direct_passthrough:
+        # Size unknown until the body has been sent (e.g. ZIP archives)
+        response.response = _count_bytes(response.response, sent)
+    
+    def finish():
+        # Runs once the server has sent the whole body
+        elapsed = time.perf_counter() - started
+        metrics.HTTP_IN_FLIGHT.dec()
+        metrics.HTTP_REQUESTS.inc(route=route, method=method, status=status)
+        metrics.HTTP_DURATION.observe(elapsed, route=route, method=method)
+        metrics.HTTP_RECEIVED_BYTES.inc(received, route=route)
+        metrics.HTTP_SENT_BYTES.inc(sent[0], route=route)
+        if endpoint in DOWNLOAD_ENDPOINTS and status in (200, 206) and sent[0]:
+            metrics.record_transfer('download', sent[0])
+        if config.SLOW_REQUEST_MS and elapsed * 1000 >= config.SLOW_REQUEST_MS:
+            print(f"Slow request ({elapsed * 1000:.1f} ms): {method} {path} -> {status}")
+        metrics.REGISTRY.flush()
+    
+    g.metrics_finished = True
+    _on_body_closed(response, finish)
+    return response
+
+@app.teardown_request
+def abandon_request_metrics(error):
+    # A request that never produced a response still leaves the in-flight gauge
+    if 'metrics_started' in g and not g.metrics_finished:
+        g.metrics_finished = True
+        metrics.HTTP_IN_FLIGHT.dec()
+
+@app.before_request
+def admit_upload():
+    if request.endpoint not in UPLOAD_ENDPOINTS or 'user' not in session:
+        return None
+    
+    # Anything decidable from the headers is refused before the body is read;
+    # chunks were checked when their upload was created
+    if request.endpoint != 'upload_chunk':
+        response = precheck_upload(session['user'], request.headers.get('X-Upload-Filename'),
+                                   request.content_length or 0)
+        if response is not None:
+            return response
+    
+    try:
+        g.upload_ticket = upload_admission.admit(session['user'], request.content_length or 0)
+    except UploadRejected as e:
+        return upload_rejected(e)
+
+@app.teardown_request
+def release_upload(error):
+    ticket = g.pop('upload_ticket', None)
+    if ticket is not None:
+        ticket.release()
+
+def upload_rejected(error):
+    return jsonify({'error': str(error)}), error.status, {'Retry-After': str(error.retry_after)}
+
+def precheck_upload(user_email, filename, size):
+    """Reject an upload by type, duplicate name or quota, from metadata alone.
+
+    ``filename`` is the client's name (None if it did not send one); returns
+    an error response, or None if the upload may proceed.
+    """
+    if filename is not None:
+        filename = unquote(filename)
+        if not allowed_file(filename):
+            upload_admission.record_rejection('type')
+            return jsonify({'error': 'Only PDF files are allowed'}), 400
+        if file_manager.filename_taken(user_email, secure_filename(filename)):
+            upload_admission.record_rejection('duplicate')
+            return jsonify({'error': DUPLICATE_NAME}), 409
+    
+    allowed, message = file_manager.quotas.precheck(user_email, size)
+    if not allowed:
+        upload_admission.record_rejection('quota')
+        return jsonify({'error': message}), 413
+    return None
+
+def add_error_status(message):
+    """HTTP status for a file ``add_files`` refused: a name clash or quota is the client's to fix."""
+    if message == DUPLICATE_NAME:
+        return 409
+    if is_quota_error(message):
+        return 413
+    return 500
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
 @app.route('/')
 def home():
     if 'user' in session:
-        # Get user's PDFs
-        user_pdfs = file_manager.get_user_files(session['user'])
-        return render_template('home.html', user=session['user'], pdfs=user_pdfs)
+        # Render the first page; the rest is fetched from /api/files on scroll
+        sort = request.args.get('sort', 'date_desc')
+        if sort not in FileManager.SORT_ORDERS:
+            sort = 'date_desc'
+        # Taken before the listing, so the change feed covers anything it misses
+        changes_seq = file_manager.latest_change()
+        user_pdfs, next_cursor = file_manager.list_files(
+            session['user'], sort=sort, limit=config.LIST_PAGE_SIZE
+        )
+        usage = file_manager.quotas.usage(session['user'])
+        return render_template('home.html', user=session['user'], pdfs=user_pdfs,
+                               next_cursor=next_cursor, sort=sort, changes_seq=changes_seq,
+                               changes_poll_interval=config.CHANGES_POLL_INTERVAL,
+                               thumbnails=file_manager.documents.renderer is not None,
+                               upload_concurrency=config.UPLOAD_MAX_PER_USER,
+                               usage=usage, format_size=file_manager.format_file_size,
+                               single_upload_limit=MAX_FILE_SIZE - 64 * 1024,
+                               batch_upload_limit=min(64 * 1024 * 1024, config.MAX_BATCH_UPLOAD_SIZE // 2))
     return redirect(url_for('login'))
 
+@app.route('/api/files')
+def list_files():
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    sort = request.args.get('sort', 'date_desc')
+    cursor = request.args.get('cursor') or None
+    limit = request.args.get('limit', config.LIST_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, config.LIST_MAX_PAGE_SIZE))
+    
+    try:
+        files, next_cursor = file_manager.list_files(
+            session['user'], sort=sort, cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'files': files, 'next_cursor': next_cursor})
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'user' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
+    # Quota (and, given X-Upload-Filename, type and name) were checked by
+    # admit_upload before the body was read; the exact checks run when the
+    # row is added
     if 'file' not in request.files:
         return jsonify({'error': 'No file selected'}), 400
     
@@ -44,32 +275,215 @@ def upload_file():
     if not allowed_file(file.filename):
         return jsonify({'error': 'Only PDF files are allowed'}), 400
     
+    file_path = None
     try:
         # Secure the filename
         filename = secure_filename(file.filename)
         
-        # Save file to uploads directory
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # Stream to a staging file, hashing on the way
+        file_path, sha256, size = file_manager.blobs.write_stream(file.stream)
         
-        # Add to database
-        success, message = file_manager.add_file(
-            user_email=session['user'],
-            filename=filename,
-            file_path=file_path
-        )
+        # Add to database; the staged file moves into the blob store
+        success, message, file_id = file_manager.add_files(
+            session['user'], [(filename, file_path, sha256)]
+        )[0]
         
         if success:
-            return jsonify({'success': True, 'message': 'File uploaded successfully'})
+            metrics.record_transfer('upload', size)
+            # The new record lets the page insert the row without reloading
+            file_records = file_manager.file_records([file_id], session['user'])
+            return jsonify({'success': True, 'message': 'File uploaded successfully',
+                            'file': file_records[0] if file_records else None})
         else:
-            # Clean up file if database insertion failed
+            return jsonify({'error': message}), add_error_status(message)
+            
+    except Exception as e:
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    
+    finally:
+        # Left behind by a failed upload; an added file has been moved away
+        if file_path is not None and os.path.exists(file_path):
+            os.remove(file_path)
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    # Batches may exceed the single-file limit; each part is still capped below
+    request.max_content_length = config.MAX_BATCH_UPLOAD_SIZE
+    request.max_form_parts = config.MAX_BATCH_FILES + 10
+    
+    files = request.files.getlist('files')
+    if not files:
+        return jsonify({'error': 'No file selected'}), 400
+    if len(files) > config.MAX_BATCH_FILES:
+        return jsonify({'error': f'At most {config.MAX_BATCH_FILES} files per batch'}), 400
+    
+    results = [None] * len(files)
+    staged = []  # (index, filename, staged_path, sha256, size)
+    try:
+        for i, file in enumerate(files):
+            if file.filename == '' or not allowed_file(file.filename):
+                results[i] = {'filename': file.filename, 'success': False,
+                              'error': 'Only PDF files are allowed'}
+                continue
+            
+            filename = secure_filename(file.filename)
+            try:
+                file_path, sha256, size = file_manager.blobs.write_stream(file.stream)
+            except OSError as e:
+                results[i] = {'filename': filename, 'success': False,
+                              'error': f'Upload failed: {str(e)}'}
+                continue
+            if size > MAX_FILE_SIZE:
+                os.remove(file_path)
+                results[i] = {'filename': filename, 'success': False,
+                              'error': 'File is too large for batch upload'}
+                continue
+            staged.append((i, filename, file_path, sha256, size))
+        
+        # One transaction for every metadata row
+        outcomes = file_manager.add_files(
+            session['user'], [(filename, path, sha256) for _, filename, path, sha256, _ in staged]
+        )
+        for (i, filename, file_path, _, size), (success, message, file_id) in zip(staged, outcomes):
+            if success:
+                metrics.record_transfer('upload', size)
+                results[i] = {'filename': filename, 'success': True, 'id': file_id}
+            else:
+                # Only failed files are cleaned up
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                results[i] = {'filename': filename, 'success': False, 'error': message}
+        
+        # Records of the new files, so the page can insert them in place
+        records = {record['id']: record for record in file_manager.file_records(
+            [result['id'] for result in results if result['success']], session['user']
+        )}
+        for result in results:
+            if result['success']:
+                result['file'] = records.get(result['id'])
+    
+    except Exception as e:
+        for _, _, file_path, _, _ in staged:
             if os.path.exists(file_path):
                 os.remove(file_path)
-            return jsonify({'error': message}), 500
-            
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    
+    uploaded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': uploaded > 0,
+        'uploaded': uploaded,
+        'failed': len(results) - uploaded,
+        'results': results
+    })
+
+@app.route('/upload/chunked', methods=['POST'])
+def start_chunked_upload():
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'File size required'}), 400
+    
+    if not filename:
+        return jsonify({'error': 'Only PDF files are allowed'}), 400
+    
+    # The whole file is declared up front, so it can be refused before any chunk
+    response = precheck_upload(session['user'], filename, size)
+    if response is not None:
+        return response
+    try:
+        upload_admission.check_space(size)
+    except UploadRejected as e:
+        return upload_rejected(e)
+    
+    success, message, upload = chunked_uploads.create(
+        session['user'], secure_filename(filename), size
+    )
+    if not success:
+        return jsonify({'error': message}), 413
+    return jsonify({'success': True, **upload}), 201
+
+@app.route('/upload/chunked/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    upload = chunked_uploads.status(upload_id, session['user'])
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(upload)
+
+@app.route('/upload/chunked/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+    except ValueError:
+        return jsonify({'error': 'Upload offset required'}), 400
+    
+    status, message, upload = chunked_uploads.write_chunk(
+        upload_id, session['user'], offset, request.stream, request.content_length
+    )
+    if status == 'ok':
+        return jsonify({'success': True, **upload})
+    
+    codes = {'not_found': 404, 'conflict': 409, 'invalid': 400}
+    body = {'error': message}
+    if upload:
+        body['offset'] = upload['offset']
+    return jsonify(body), codes[status]
+
+@app.route('/upload/chunked/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    success, message, info = chunked_uploads.finalize(
+        upload_id, session['user'], data.get('sha256')
+    )
+    if not success:
+        return jsonify({'error': message}), 400
+    
+    try:
+        # The part file moves straight into the blob store
+        success, message, file_id = file_manager.add_files(
+            session['user'], [(info['filename'], info['path'], info['sha256'])]
+        )[0]
+        
+        if success:
+            chunked_uploads.discard(upload_id)
+            metrics.record_transfer('upload', info['size'])
+            file_records = file_manager.file_records([file_id], session['user'])
+            return jsonify({'success': True, 'message': 'File uploaded successfully', 'sha256': info['sha256'],
+                            'file': file_records[0] if file_records else None})
+        else:
+            # The part file is kept, so finalize can be retried once the
+            # name is free or there is room again
+            return jsonify({'error': message}), add_error_status(message)
+    
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+@app.route('/upload/chunked/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    success, message = chunked_uploads.abort(upload_id, session['user'])
+    if not success:
+        return jsonify({'error': message}), 404
+    return jsonify({'success': True, 'message': message})
+
 @app.route('/download/<int:file_id>')
 def download_file(file_id):
     if 'user' not in session:
@@ -81,12 +495,51 @@ def download_file(file_id):
         flash('File not found or access denied', 'error')
         return redirect(url_for('home'))
     
-    file_path = file_info[3]  # file_path is at index 3
-    if not os.path.exists(file_path):
+    storage, key = file_manager.storage_for(file_info[3], file_info[6])
+    
+    # The blob's SHA-256 (index 6) doubles as a strong ETag
+    response = send_stored_file(storage, key, etag=file_info[6], mimetype='application/pdf',
+                                as_attachment=True, download_name=file_info[2])
+    if response is None:
         flash('File not found on server', 'error')
         return redirect(url_for('home'))
+    return response
+
+@app.route('/download/zip', methods=['GET', 'POST'])
+def download_zip():
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
     
-    return send_file(file_path, as_attachment=True, download_name=file_info[2])
+    user_email = session['user']
+    if request.values.get('all') in ('1', 'true'):
+        file_ids = None
+    else:
+        try:
+            raw_ids = ','.join(request.values.getlist('ids'))
+            file_ids = sorted({int(part) for part in raw_ids.split(',') if part.strip()})
+        except ValueError:
+            return jsonify({'error': 'Invalid file id'}), 400
+        if not file_ids:
+            return jsonify({'error': 'No files selected'}), 400
+        if len(file_ids) > config.MAX_ZIP_FILES:
+            return jsonify({'error': f'At most {config.MAX_ZIP_FILES} files per archive'}), 400
+        
+        # One ownership check for the whole selection
+        if file_manager.count_owned(file_ids, user_email) != len(file_ids):
+            return jsonify({'error': 'File not found or access denied'}), 404
+    
+    def entries():
+        for _, filename, file_path, file_size, upload_date, sha256 in file_manager.iter_files(user_email, file_ids):
+            storage, key = file_manager.storage_for(file_path, sha256)
+            yield filename, partial(storage.open, key), file_size, upload_date
+    
+    archive_name = f"localdrive-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+    response = Response(stream_with_context(stream_zip(entries())), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{archive_name}"'
+    # Let the proxy pass bytes on as they are produced
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @app.route('/preview/<int:file_id>')
 def preview_file(file_id):
@@ -97,11 +550,52 @@ def preview_file(file_id):
     if not file_info:
         return jsonify({'error': 'File not found or access denied'}), 404
     
-    file_path = file_info[3]  # file_path is at index 3
-    if not os.path.exists(file_path):
+    storage, key = file_manager.storage_for(file_info[3], file_info[6])
+    response = send_stored_file(storage, key, etag=file_info[6], mimetype='application/pdf')
+    if response is None:
         return jsonify({'error': 'File not found on server'}), 404
+    return response
+
+@app.route('/thumbnail/<int:file_id>')
+def thumbnail(file_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    file_info = file_manager.get_file_info(file_id, session['user'])
+    if not file_info:
+        return jsonify({'error': 'File not found or access denied'}), 404
     
-    return send_file(file_path, mimetype='application/pdf')
+    sha256 = file_info[6]
+    path = file_manager.documents.thumbnail(sha256)
+    if path is None:
+        # Not rendered yet (or evicted): queue it, unless it recently failed to
+        # render; the page falls back to an icon
+        if file_manager.documents.can_render(sha256):
+            file_manager.documents.schedule(file_id, file_info[3], sha256, force=True)
+        return jsonify({'error': 'Thumbnail not available'}), 404, {'Cache-Control': 'no-store'}
+    
+    # Keyed by content, so a thumbnail never changes for a given file
+    response = send_file(path, mimetype='image/png', etag=file_manager.documents.cache.key_for(sha256),
+                         max_age=config.THUMBNAIL_MAX_AGE, conditional=True)
+    response.cache_control.private = True
+    response.cache_control.public = False
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/assets/<path:filename>')
+def assets_file(filename):
+    path, encoding = assets.path_for(filename, request.accept_encodings)
+    if path is None:
+        return jsonify({'error': 'Not found'}), 404
+    
+    # The name carries the content hash, so the file can be cached forever
+    mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = config.ASSET_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/delete/<int:file_id>', methods=['POST'])
 def delete_file(file_id):
@@ -111,10 +605,71 @@ def delete_file(file_id):
     success, message = file_manager.delete_file(file_id, session['user'])
     
     if success:
-        return jsonify({'success': True, 'message': 'File deleted successfully'})
+        file_records = file_manager.file_records([file_id], session['user'])
+        return jsonify({'success': True, 'message': message,
+                        'file': file_records[0] if file_records else None})
+    else:
+        return jsonify({'error': message}), 400
+
+@app.route('/trash')
+def trash():
+    if 'user' not in session:
+        return redirect(url_for('login'))
+    
+    try:
+        files, next_cursor = file_manager.list_trash(
+            session['user'], cursor=request.args.get('cursor') or None, limit=config.LIST_PAGE_SIZE
+        )
+    except ValueError:
+        return redirect(url_for('trash'))
+    return render_template('trash.html', user=session['user'], pdfs=files,
+                           next_cursor=next_cursor, retention_days=config.TRASH_RETENTION_DAYS)
+
+@app.route('/api/trash')
+def list_trash():
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    cursor = request.args.get('cursor') or None
+    limit = request.args.get('limit', config.LIST_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, config.LIST_MAX_PAGE_SIZE))
+    
+    try:
+        files, next_cursor = file_manager.list_trash(session['user'], cursor=cursor, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'files': files, 'next_cursor': next_cursor})
+
+@app.route('/restore/<int:file_id>', methods=['POST'])
+def restore_file(file_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    success, message = file_manager.restore_file(file_id, session['user'])
+    
+    if success:
+        file_records = file_manager.file_records([file_id], session['user'])
+        return jsonify({'success': True, 'message': message,
+                        'file': file_records[0] if file_records else None})
     else:
         return jsonify({'error': message}), 400
 
+@app.route('/changes')
+def file_changes():
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'since must be a change sequence number'}), 400
+    
+    # Open pages poll this to patch their listing in place
+    feed = file_manager.changes_since(session['user'], since)
+    if feed['changes'] or feed['reset']:
+        feed['usage'] = file_manager.quotas.usage(session['user'])
+    return jsonify(feed)
+
 @app.route('/search')
 def search_files():
     if 'user' not in session:
@@ -127,6 +682,38 @@ def search_files():
     results = file_manager.search_files(session['user'], query)
     return jsonify({'results': results})
 
+@app.route('/autocomplete')
+def autocomplete():
+    if 'user' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'suggestions': []})
+    
+    limit = request.args.get('limit', config.AUTOCOMPLETE_LIMIT, type=int)
+    limit = max(1, min(limit, config.AUTOCOMPLETE_MAX_LIMIT))
+    suggestions = file_manager.suggest_files(session['user'], query, limit)
+    return jsonify({'suggestions': suggestions})
+
+@app.route('/health')
+def health():
+    status = pool_health()
+    status['cache'] = file_manager.cache.stats()
+    status['filename_index'] = file_manager.filenames.stats()
+    status['documents'] = file_manager.documents.stats()
+    status['password_hashing'] = hashing_pool.stats()
+    status['trash_purger'] = trash_purger.stats()
+    status['uploads'] = upload_admission.stats()
+    status['deployment'] = deployment_info()
+    return jsonify(status), 200 if status['ok'] else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not config.METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
@@ -150,7 +737,11 @@ def signup():
             return render_template('signup.html', error=error, email=email)
         
         # Create user
-        success, message = create_user(email, password)
+        try:
+            success, message = create_user(email, password)
+        except HasherBusy as e:
+            return (render_template('signup.html', error=str(e), email=email),
+                    503, {'Retry-After': str(e.retry_after)})
         
         if success:
             flash("Account created successfully! Please log in.", "success")
@@ -172,10 +763,17 @@ def login():
             error = "Please fill in all fields"
             return render_template('login.html', error=error, email=email)
         
-        # Authenticate user
-        success, message = authenticate_user(email, password)
+        # Authenticate user; shed load rather than queue behind a login storm
+        try:
+            success, message = authenticate_user(email, password)
+        except HasherBusy as e:
+            return (render_template('login.html', error=str(e), email=email),
+                    503, {'Retry-After': str(e.retry_after)})
         
         if success:
+            # A fresh session id on login defeats session fixation
+            if hasattr(session, 'regenerate'):
+                session.regenerate()
             session['user'] = email
             flash(f"Welcome back, {email}!", "success")
             return redirect(url_for('home'))
@@ -189,7 +787,12 @@ def login():
 @app.route('/logout')
 def logout():
     user = session.get('user')
+    # /logout?all=1 signs the user out on every device
+    if user and request.args.get('all') in ('1', 'true') and session_store is not None:
+        session_store.revoke_user(user)
     session.pop('user', None)
+    if hasattr(session, 'regenerate'):
+        session.regenerate()
     if user:
         flash("You have been logged out successfully", "info")
     return redirect(url_for('login'))
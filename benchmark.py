@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+Benchmark and load-test suite for LocalDrive.
+
+Seeds a throwaway data directory with synthetic users and files, drives the
+main routes concurrently and reports latency percentiles and throughput.
+Results are saved as JSON so runs can be compared.
+
+Usage:
+  python benchmark.py seed --users 20 --files 100000
+  python benchmark.py run --concurrency 8 --duration 10 --output before.json
+  python benchmark.py compare before.json after.json
+
+The in-process driver uses the Flask test client. To measure a real server,
+start gunicorn against the same data directory and use the HTTP driver:
+
+  LOCALDRIVE_DATABASE=bench_data/database.db \\
+  LOCALDRIVE_USERS_DATABASE=bench_data/users.db \\
+  LOCALDRIVE_UPLOAD_FOLDER=bench_data/uploads \\
+  LOCALDRIVE_CACHE_DB=bench_data/cache.db \\
+  gunicorn -w 4 app:app
+  python benchmark.py run --driver http --url http://127.0.0.1:8000
+"""
+
+import argparse
+import hashlib
+import http.cookiejar
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime
+
+ROUTES = ('home', 'upload', 'search', 'download', 'preview', 'delete')
+
+USER_PASSWORD = 'benchmark-password'
+
+WORDS = (
+    'annual', 'report', 'invoice', 'contract', 'budget', 'summary', 'draft',
+    'final', 'meeting', 'notes', 'project', 'proposal', 'research', 'thesis',
+    'manual', 'guide', 'policy', 'review', 'statement', 'receipt', 'schedule',
+    'plan', 'design', 'spec', 'lecture', 'slides', 'paper', 'letter', 'memo',
+)
+
+def use_workdir(workdir):
+    """Point every LocalDrive setting at the benchmark data directory.
+
+    Must run before the application modules are imported, since they read
+    their configuration at import time.
+    """
+    workdir = os.path.abspath(workdir)
+    os.makedirs(workdir, exist_ok=True)
+    os.environ['LOCALDRIVE_DATABASE'] = os.path.join(workdir, 'database.db')
+    os.environ['LOCALDRIVE_USERS_DATABASE'] = os.path.join(workdir, 'users.db')
+    os.environ['LOCALDRIVE_UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.environ['LOCALDRIVE_CACHE_DB'] = os.path.join(workdir, 'cache.db')
+    return workdir
+
+def user_email(index):
+    return f'bench{index:05d}@example.com'
+
+def make_pdf(text):
+    """A minimal one-page PDF containing ``text``."""
+    stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode()
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R '
+        b'/Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return out
+
+def random_title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(4))
+
+def seed(args):
+    """Create users and file rows through the normal application code paths."""
+    workdir = use_workdir(args.workdir)
+    # Text extraction and PDF metadata/thumbnails would dominate seeding and
+    # fill the change feed; run reindex and backfill afterwards if wanted
+    os.environ['LOCALDRIVE_SEARCH_EXTRACT_ON_ADD'] = '0'
+    os.environ['LOCALDRIVE_DOCUMENT_PROCESS_ON_ADD'] = '0'
+
+    from utils.auth import init_database, create_user
+    from utils.filemanager import FileManager
+
+    init_database()
+    file_manager = FileManager()
+    # Also when utils.config was imported before the variables were set
+    file_manager.search_index.extract_on_add = False
+    file_manager.documents.process_on_add = False
+    rng = random.Random(args.seed)
+
+    for i in range(args.users):
+        create_user(user_email(i), USER_PASSWORD)
+    print(f"Users: {args.users}")
+
+    # A small set of distinct documents; the blob store deduplicates them,
+    # so a million rows cost a handful of files on disk
+    templates = []
+    template_dir = os.path.join(workdir, 'templates')
+    os.makedirs(template_dir, exist_ok=True)
+    for i in range(args.variants):
+        data = make_pdf(random_title(rng))
+        path = os.path.join(template_dir, f'{i}.pdf')
+        with open(path, 'wb') as f:
+            f.write(data)
+        templates.append((path, hashlib.sha256(data).hexdigest()))
+
+    started = time.perf_counter()
+    per_user = [args.files // args.users + (1 if i < args.files % args.users else 0)
+                for i in range(args.users)]
+    done = 0
+    for user_index, count in enumerate(per_user):
+        email = user_email(user_index)
+        for batch_start in range(0, count, args.batch_size):
+            batch = []
+            for n in range(batch_start, min(batch_start + args.batch_size, count)):
+                template_path, sha256 = rng.choice(templates)
+                staged = file_manager.blobs.staging_path()
+                try:
+                    os.link(template_path, staged)
+                except OSError:
+                    with open(template_path, 'rb') as src, open(staged, 'wb') as dst:
+                        dst.write(src.read())
+                name = '-'.join(rng.sample(WORDS, 2)) + f'-{n:07d}.pdf'
+                batch.append((name, staged, sha256))
+
+            results = file_manager.add_files(email, batch)
+            for (_, staged, _), (success, message, _) in zip(batch, results):
+                if not success:
+                    if os.path.exists(staged):
+                        os.remove(staged)
+                    print(f"\nError seeding file: {message}")
+            done += len(batch)
+            elapsed = time.perf_counter() - started
+            print(f"\rFiles: {done}/{args.files} ({done / elapsed:.0f}/s)", end='', flush=True)
+    print()
+
+    if args.index_text:
+        def progress(done, total):
+            print(f"\rIndexed {done}/{total} files", end='', flush=True)
+
+        try:
+            file_manager.search_index.reindex(progress=progress)
+        finally:
+            file_manager.search_index.shutdown()
+        print()
+
+    with open(os.path.join(workdir, 'seed.json'), 'w') as f:
+        json.dump({'users': args.users, 'files': args.files, 'variants': args.variants,
+                   'seed': args.seed, 'created': datetime.now().isoformat(timespec='seconds')}, f)
+    print(f"Seed complete in {time.perf_counter() - started:.1f}s ({workdir})")
+
+class ClientDriver:
+    """Requests through the Flask test client, in this process."""
+
+    name = 'client'
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, files=None):
+        if files:
+            data = dict(data or {})
+            for field, (filename, content) in files.items():
+                data[field] = (io.BytesIO(content), filename)
+        response = self.client.open(path, method=method, data=data)
+        try:
+            body = response.get_data()
+        finally:
+            response.close()
+        return response.status_code, body
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HttpDriver:
+    """Requests over HTTP to a running server, with a private cookie jar."""
+
+    name = 'http'
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect()
+        )
+
+    def request(self, method, path, data=None, files=None):
+        headers = {}
+        body = None
+        if files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for field, value in (data or {}).items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"'
+                             f'\r\n\r\n{value}\r\n'.encode())
+            for field, (filename, content) in files.items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                             f'filename="{filename}"\r\nContent-Type: application/pdf\r\n\r\n'.encode()
+                             + content + b'\r\n')
+            parts.append(f'--{boundary}--\r\n'.encode())
+            body = b''.join(parts)
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+class Worker:
+    """One simulated user: a logged-in session plus the ids it can touch."""
+
+    def __init__(self, driver, email, rng):
+        self.driver = driver
+        self.email = email
+        self.rng = rng
+        self.file_ids = []
+        self.uploaded = []
+        self.pdf = make_pdf(random_title(rng))
+
+    def login(self):
+        status, _ = self.driver.request('POST', '/login', data={'email': self.email, 'password': USER_PASSWORD})
+        if status not in (200, 302):
+            raise RuntimeError(f"Login failed for {self.email}: HTTP {status}")
+        status, body = self.driver.request('GET', '/api/files?limit=200')
+        if status != 200:
+            raise RuntimeError(f"Listing failed for {self.email}: HTTP {status}")
+        self.file_ids = [f['id'] for f in json.loads(body)['files']]
+
+    def call(self, route):
+        """Issue one request for ``route``; returns the HTTP status, or None if skipped."""
+        if route == 'home':
+            return self.driver.request('GET', '/')[0]
+        if route == 'search':
+            query = ' '.join(self.rng.sample(WORDS, self.rng.choice((1, 2))))
+            return self.driver.request('GET', '/search?' + urllib.parse.urlencode({'q': query}))[0]
+        if route in ('download', 'preview'):
+            if not self.file_ids:
+                return None
+            return self.driver.request('GET', f'/{route}/{self.rng.choice(self.file_ids)}')[0]
+        if route == 'upload':
+            name = f'bench-upload-{uuid.uuid4().hex}.pdf'
+            status, _ = self.driver.request('POST', '/upload', files={'file': (name, self.pdf)})
+            if status == 200:
+                self.uploaded.append(name)
+            return status
+        if route == 'delete':
+            if not self.uploaded:
+                return None
+            return self.driver.request('POST', f'/delete/{self.uploaded.pop()}')[0]
+        raise ValueError(f"Unknown route: {route}")
+
+    def prepare_delete(self):
+        """Resolve this session's uploads to ids; only those are deleted."""
+        names = set(self.uploaded)
+        self.uploaded = []
+        cursor = None
+        while names:
+            path = '/api/files?limit=200' + (f'&cursor={cursor}' if cursor else '')
+            status, body = self.driver.request('GET', path)
+            if status != 200:
+                break
+            page = json.loads(body)
+            for f in page['files']:
+                if f['filename'] in names:
+                    names.discard(f['filename'])
+                    self.uploaded.append(f['id'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    count = len(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': count,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(count / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': ms(sum(latencies) / count) if count else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if count else None,
+    }
+
+def run_phase(workers, route, duration, max_requests):
+    """Hammer one route from every worker at once for ``duration`` seconds."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    issued = [0]
+    start_gate = threading.Barrier(len(workers) + 1)
+
+    def loop(worker):
+        local = []
+        local_errors = 0
+        start_gate.wait()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and issued[0] >= max_requests:
+                    break
+                issued[0] += 1
+            began = time.perf_counter()
+            try:
+                status = worker.call(route)
+            except Exception:
+                status = 599
+            if status is None:
+                break
+            local.append(time.perf_counter() - began)
+            if status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=loop, args=(worker,), daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+    start_gate.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - began)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(args):
+    """Run every requested route phase and write the results."""
+    workdir = os.path.abspath(args.workdir)
+    try:
+        with open(os.path.join(workdir, 'seed.json')) as f:
+            dataset = json.load(f)
+    except OSError:
+        print(f"Error: no seeded data in {workdir}; run 'python benchmark.py seed' first")
+        return 1
+
+    if args.driver == 'client':
+        use_workdir(workdir)
+        from app import app
+        make_driver = lambda: ClientDriver(app)
+    else:
+        make_driver = lambda: HttpDriver(args.url)
+
+    routes = [route.strip() for route in args.routes.split(',') if route.strip()]
+    for route in routes:
+        if route not in ROUTES:
+            print(f"Error: unknown route '{route}' (choose from {', '.join(ROUTES)})")
+            return 1
+    # Deletes remove what the upload phase created, never seeded files
+    if 'delete' in routes and 'upload' not in routes:
+        print("Error: the delete phase needs the upload phase")
+        return 1
+    routes.sort(key=ROUTES.index)
+
+    rng = random.Random(args.seed)
+    workers = []
+    for i in range(args.concurrency):
+        worker = Worker(make_driver(), user_email(i % dataset['users']), random.Random(rng.random()))
+        worker.login()
+        workers.append(worker)
+
+    results = {}
+    for route in routes:
+        if route == 'delete':
+            for worker in workers:
+                worker.prepare_delete()
+        if args.warmup and route not in ('upload', 'delete'):
+            run_phase(workers, route, args.warmup, 0)
+        print(f"{route:>9}: ", end='', flush=True)
+        stats = run_phase(workers, route, args.duration, args.requests)
+        results[route] = stats
+        print(f"{stats['rps']:>9.1f} req/s  p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  "
+              f"p99 {stats['p99_ms']} ms  errors {stats['errors']}/{stats['requests']}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'driver': args.driver,
+            'url': args.url if args.driver == 'http' else None,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'max_requests': args.requests,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dataset': dataset,
+        },
+        'routes': results,
+    }
+    output = args.output or os.path.join(workdir, f"results-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+def compare(args):
+    """Print per-route deltas between two result files."""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    metrics = ('rps', 'p50_ms', 'p95_ms', 'p99_ms')
+    print(f"{'route':<10}" + ''.join(f"{metric:>26}" for metric in metrics))
+    for route, new in candidate['routes'].items():
+        old = baseline['routes'].get(route)
+        if not old:
+            continue
+        cells = []
+        for metric in metrics:
+            before, after = old.get(metric), new.get(metric)
+            if not before or after is None:
+                cells.append(f"{'-':>26}")
+                continue
+            change = (after - before) / before * 100
+            cells.append(f"{before:>9} -> {after:<9} {change:+6.1f}%")
+        print(f"{route:<10}" + ''.join(cells))
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='LocalDrive benchmark and load-test suite')
+    parser.add_argument('--workdir', default='bench_data', help='data directory (default: bench_data)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='create synthetic users and files')
+    seed_parser.add_argument('--users', type=int, default=10)
+    seed_parser.add_argument('--files', type=int, default=1000, help='total file rows (1k to 1M)')
+    seed_parser.add_argument('--variants', type=int, default=32, help='distinct PDF contents')
+    seed_parser.add_argument('--batch-size', type=int, default=1000, help='rows per transaction')
+    seed_parser.add_argument('--index-text', action='store_true', help='extract PDF text after seeding')
+    seed_parser.add_argument('--seed', type=int, default=1)
+
+    run_parser = commands.add_parser('run', help='drive the routes and record latency')
+    run_parser.add_argument('--driver', choices=('client', 'http'), default='client')
+    run_parser.add_argument('--url', default='http://127.0.0.1:8000', help='server for the http driver')
+    run_parser.add_argument('--routes', default=','.join(ROUTES), help='comma-separated subset of routes')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='concurrent sessions')
+    run_parser.add_argument('--duration', type=float, default=10.0, help='seconds per route')
+    run_parser.add_argument('--requests', type=int, default=0, help='cap on requests per route (0 = none)')
+    run_parser.add_argument('--warmup', type=float, default=1.0, help='untimed seconds before read routes')
+    run_parser.add_argument('--output', help='results file (default: <workdir>/results-<time>.json)')
+    run_parser.add_argument('--seed', type=int, default=1)
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        if args.users < 1 or args.files < 0 or args.variants < 1:
+            parser.error('--users and --variants must be positive')
+        seed(args)
+        return 0
+    if args.command == 'run':
+        return run(args)
+    return compare(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
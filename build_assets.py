@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Static asset build for LocalDrive.
+
+Minifies the CSS and JavaScript under static/ (with rcssmin and rjsmin;
+without them the files are copied as they are), writes content-hashed copies
+with gzip (and brotli, if installed) variants to LOCALDRIVE_ASSET_FOLDER
+(default static/dist) and a manifest the templates' asset_url() reads.
+Run it after every change to static/ and before starting the server:
+
+  python build_assets.py
+  python build_assets.py --clean    # back to serving static/ directly
+"""
+
+import argparse
+import os
+import shutil
+import sys
+
+from utils import config
+from utils.assets import available_encodings, build_assets, missing_minifiers
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def main():
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets')
+    parser.add_argument('--static', default=os.path.join(ROOT, 'static'), help='source folder (default: static)')
+    parser.add_argument('--output', default=os.path.join(ROOT, config.ASSET_FOLDER),
+                        help='output folder (default: LOCALDRIVE_ASSET_FOLDER)')
+    parser.add_argument('--clean', action='store_true', help='remove the build instead')
+    args = parser.parse_args()
+
+    if args.clean:
+        shutil.rmtree(args.output, ignore_errors=True)
+        print(f"Removed {args.output}")
+        return 0
+
+    encodings = [encoding for encoding, _ in available_encodings()]
+    if 'br' not in encodings:
+        print("brotli not installed, writing gzip variants only (pip install brotli)")
+    missing = missing_minifiers()
+    if missing:
+        print(f"{', '.join(missing)} not installed, copying those assets unminified "
+              f"(pip install {' '.join(missing)})")
+
+    def progress(source, built, sizes):
+        compressed = ' '.join(f"{encoding} {size:>7,}" for encoding, size in zip(encodings, sizes[2:]))
+        print(f"{source:<20} -> {built:<32} {sizes[0]:>7,} -> {sizes[1]:>7,}  {compressed}")
+
+    manifest = build_assets(args.static, args.output, progress=progress)
+    print(f"Built {len(manifest)} asset(s) into {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,11 +4,18 @@ Database management script for the Flask authentication system.
 Run this script to perform database operations.
 """
 
+import os
+import sqlite3
 import sys
+from datetime import datetime
 from utils.auth import (
-    init_database, create_user, delete_user, get_all_users, 
-    get_user_info, update_password, validate_email, validate_password
+    init_database, create_user, delete_user, iter_users,
+    get_user_info, update_password, validate_email, validate_password,
+    DATABASE_FILE
 )
+from utils import config
+from utils.db import get_pool
+from utils.migrations import FILES_MIGRATIONS, USERS_MIGRATIONS, migrate, status
 
 def show_help():
     """Display help information."""
@@ -20,17 +27,59 @@ Usage: python db_manager.py [command] [arguments]
 
 Commands:
   init              Initialize the database
+  migrate           Apply pending schema migrations to both databases
+  status            Show schema version and pending migrations
+  cleanup-uploads   Remove stale partial (resumable) uploads
+  reindex           Rebuild the full-text search index
+  backfill [--metadata-only]
+                    Extract PDF metadata and render missing thumbnails
+  kdf-bench [ms]    Pick a password hashing cost for a target latency (default 250 ms)
+  quota <email> <size|default> [files|default]
+                    Set a user's storage quota (e.g. 5GB; 0 = unlimited)
+  usage [email]     Show storage usage and quotas
+  recompute-usage   Rebuild usage counters from the files table
+  purge [--all] [--user EMAIL]
+                    Permanently delete trashed files past the retention
+                    period (--all empties the trash regardless of age)
+                    and prune the listing change feed
+  fsck [options]    Check stored files against the database
+                      --repair          remove orphans, fix reference counts
+                      --prune-missing   delete file rows whose bytes are gone
+                      --verify          re-hash every blob
+                      --incremental     resume from the last checkpoint
+                      --time-limit N    stop after N seconds (with --incremental)
+                      --report FILE     write every finding as JSON lines
+  sessions <email>  List a user's active sessions
+  revoke <email>    Sign a user out everywhere
   create <email>    Create a new user (will prompt for password)
   delete <email>    Delete a user
   list              List all users
+  import <users.csv|.jsonl> [options]
+                    Create users in bulk (email + password or password_hash)
+                      --files FILE      also add files (email, path[, filename])
+                      --format csv|jsonl
+                      --batch-size N    rows per transaction (default 1000
+                                        users, 100 files)
+                      --workers N       parallel password hashing / file copies
+  export users|files [--output FILE] [--format csv|jsonl]
+                    Stream users (--with-hashes for host migration) or
+                    file metadata (--include-deleted)
+  backup [DIR]      Snapshot users.db and database.db while the app runs
+                    (default backups/<timestamp>)
   info <email>      Show user information
   password <email>  Update user password
   help              Show this help message
 
 Examples:
   python db_manager.py init
+  python db_manager.py migrate
   python db_manager.py create user@example.com
+  python db_manager.py quota user@example.com 5GB 10000
+  python db_manager.py fsck --incremental --time-limit 300
   python db_manager.py list
+  python db_manager.py import users.csv --files files.jsonl
+  python db_manager.py export users --with-hashes --output users.jsonl
+  python db_manager.py backup
   python db_manager.py delete user@example.com
     """)
 
@@ -73,18 +122,18 @@ def delete_user_confirm(email):
         print("Operation cancelled")
 
 def list_users():
-    """List all users."""
-    users = get_all_users()
-    if not users:
-        print("No users found")
-        return
-    
-    print("\nRegistered Users:")
-    print("-" * 50)
-    for email, created_at in users:
+    """List all users (streamed, newest first)."""
+    count = 0
+    for email, created_at in iter_users(newest_first=True):
+        if count == 0:
+            print("\nRegistered Users:")
+            print("-" * 50)
         print(f"Email: {email}")
         print(f"Created: {created_at}")
         print("-" * 50)
+        count += 1
+    if count == 0:
+        print("No users found")
 
 def show_user_info(email):
     """Show detailed user information."""
@@ -120,6 +169,357 @@ def update_user_password(email):
     else:
         print(f"Error: {message}")
 
+def migrate_databases():
+    """Apply pending migrations to the users and files databases."""
+    applied = init_database()
+    applied += migrate(get_pool(config.DATABASE_PATH), FILES_MIGRATIONS)
+    if not applied:
+        print("Schema is up to date")
+        return
+    for migration in applied:
+        print(f"Applied migration {migration.version}: {migration.description}")
+
+def show_schema_status():
+    """Show schema version and pending migrations for each database."""
+    databases = [
+        (get_pool(DATABASE_FILE), USERS_MIGRATIONS),
+        (get_pool(config.DATABASE_PATH), FILES_MIGRATIONS),
+    ]
+    for pool, migrations in databases:
+        info = status(pool, migrations)
+        print(f"\n{info['db_path']}: version {info['version']} (latest {info['latest']})")
+        if not info['pending']:
+            print("  No pending migrations")
+        for version, description in info['pending']:
+            print(f"  Pending {version}: {description}")
+
+def cleanup_uploads():
+    """Garbage-collect abandoned chunked uploads."""
+    from utils.uploads import ChunkedUploads
+    
+    removed = ChunkedUploads().cleanup_stale()
+    print(f"Removed {removed} stale partial upload(s)")
+
+def reindex_files():
+    """Rebuild the full-text index from every stored PDF."""
+    from utils.filemanager import FileManager
+    
+    def progress(done, total):
+        print(f"\rIndexed {done}/{total} files", end='', flush=True)
+    
+    index = FileManager().search_index
+    try:
+        count = index.reindex(progress=progress)
+    finally:
+        index.shutdown()
+    print(f"\nReindex complete: {count} file(s)")
+
+def backfill_documents(args):
+    """Extract metadata and render thumbnails for files that lack them."""
+    from utils.filemanager import FileManager
+    
+    def progress(checked, total, processed):
+        print(f"\rChecked {checked}/{total} files, processed {processed}", end='', flush=True)
+    
+    file_manager = FileManager()
+    if file_manager.documents.renderer is None and '--metadata-only' not in args:
+        print("No thumbnail renderer found (pip install pymupdf, or install poppler-utils); "
+              "extracting metadata only")
+    try:
+        count = file_manager.backfill_documents(
+            thumbnails='--metadata-only' not in args, progress=progress
+        )
+    finally:
+        file_manager.documents.shutdown()
+    print(f"\nBackfill complete: {count} file(s) processed")
+
+def kdf_bench(target_ms):
+    """Measure the password KDF and suggest a cost for the target latency."""
+    from utils.passwords import calibrate
+    
+    scheme = config.PASSWORD_SCHEME
+    print(f"Calibrating {scheme} for ~{target_ms} ms per hash...")
+    params, elapsed = calibrate(target_ms, scheme)
+    print(f"Measured {elapsed:.1f} ms with {params}")
+    
+    if scheme == 'scrypt':
+        print(f"  LOCALDRIVE_SCRYPT_N={params['n']}")
+        print(f"  LOCALDRIVE_SCRYPT_R={params['r']}")
+        print(f"  LOCALDRIVE_SCRYPT_P={params['p']}")
+        print(f"Memory per hash: {128 * params['n'] * params['r'] // (1024 * 1024)} MB "
+              f"(x LOCALDRIVE_KDF_WORKERS={config.KDF_WORKERS} per process)")
+    else:
+        print(f"  LOCALDRIVE_PBKDF2_ITERATIONS={params['i']}")
+    per_second = config.KDF_WORKERS * 1000 / elapsed if elapsed else 0
+    print(f"Capacity: about {per_second:.0f} logins/s per process")
+    print("Existing hashes are upgraded to the new cost on each user's next login.")
+
+def _parse_limit(text, parse):
+    """Parse a quota argument; 'default' means fall back to the configured default."""
+    if text.lower() == 'default':
+        return None
+    return parse(text)
+
+def set_user_quota(email, size_text, files_text=None):
+    """Set a user's byte and file-count limits."""
+    from utils.filemanager import FileManager
+    from utils.quotas import parse_size
+    
+    try:
+        max_bytes = _parse_limit(size_text, parse_size)
+        max_files = _parse_limit(files_text, int) if files_text else None
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    
+    file_manager = FileManager()
+    file_manager.quotas.set_quota(email, max_bytes, max_files)
+    show_usage(email, file_manager)
+
+def show_usage(email=None, file_manager=None):
+    """Print usage against quota for one user or all users with files."""
+    if file_manager is None:
+        from utils.filemanager import FileManager
+        file_manager = FileManager()
+    
+    if email:
+        emails = [email]
+    else:
+        with file_manager.pool.connection() as conn:
+            emails = [row[0] for row in conn.execute(
+                'SELECT user_email FROM user_usage ORDER BY bytes DESC'
+            )]
+        if not emails:
+            print("No stored files")
+            return
+    
+    fmt = file_manager.format_file_size
+    for user_email in emails:
+        usage = file_manager.quotas.usage(user_email)
+        max_bytes = fmt(usage['max_bytes']) if usage['max_bytes'] else 'unlimited'
+        max_files = usage['max_files'] or 'unlimited'
+        print(f"{user_email}: {fmt(usage['bytes'])} of {max_bytes}, "
+              f"{usage['files']} of {max_files} files")
+
+def recompute_usage():
+    """Rebuild every user's usage counters from the files table."""
+    from utils.filemanager import FileManager
+    
+    def progress(done):
+        print(f"\rRecomputed {done} user(s)", end='', flush=True)
+    
+    count = FileManager().quotas.recompute(progress=progress)
+    print(f"\nUsage recomputed for {count} user(s)")
+
+def purge_trash(args):
+    """Permanently delete trashed files, in batches."""
+    from utils.filemanager import FileManager
+    
+    older_than_days = 0 if '--all' in args else None
+    file_manager = FileManager()
+    count = file_manager.purge_deleted(older_than_days, user_email=_option_value(args, '--user'))
+    print(f"Purged {count} file(s) from the trash")
+    pruned = file_manager.prune_changes()
+    if pruned:
+        print(f"Pruned {pruned} old change feed entries")
+
+def show_sessions(email):
+    """List a user's active server-side sessions."""
+    from utils.sessions import get_session_store
+    
+    store = get_session_store()
+    if store is None:
+        print("Sessions are stored in cookies and cannot be listed")
+        return
+    sessions = store.list_user(email)
+    if not sessions:
+        print(f"No active sessions for {email}")
+        return
+    for sid, created_at, expires_at in sessions:
+        print(f"{sid[:12]}  created {datetime.fromtimestamp(created_at):%Y-%m-%d %H:%M}  "
+              f"expires {datetime.fromtimestamp(expires_at):%Y-%m-%d %H:%M}")
+
+def revoke_sessions(email):
+    """End every session of a user."""
+    from utils.sessions import get_session_store
+    
+    store = get_session_store()
+    if store is None:
+        print("Error: Cookie sessions cannot be revoked; use a server-side session backend")
+        return
+    print(f"Revoked {store.revoke_user(email)} session(s) for {email}")
+
+def _option_value(args, name):
+    """Value following ``name`` in ``args``, or None."""
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return None
+
+def run_fsck(args):
+    """Check storage consistency, optionally repairing and checkpointing."""
+    from utils.filemanager import FileManager
+    from utils.fsck import StorageChecker, load_state, save_state
+    
+    try:
+        time_limit = _option_value(args, '--time-limit')
+        time_limit = float(time_limit) if time_limit else None
+    except ValueError:
+        print("Error: --time-limit must be a number of seconds")
+        return
+    incremental = '--incremental' in args
+    report_path = _option_value(args, '--report')
+    
+    state = load_state(config.FSCK_STATE_PATH) if incremental else {}
+    if incremental and state.get('phase'):
+        print(f"Resuming at phase '{state['phase']}'")
+    
+    report = open(report_path, 'w') if report_path else None
+    checker = StorageChecker(
+        FileManager(),
+        verify='--verify' in args,
+        repair='--repair' in args,
+        prune_missing='--prune-missing' in args,
+        report=report
+    )
+    
+    def progress(phase, checked):
+        print(f"\r[{phase}] checked {checked}", end='', flush=True)
+    
+    try:
+        summary = checker.run(state, time_limit=time_limit, progress=progress)
+    finally:
+        if report:
+            report.close()
+    print()
+    if incremental:
+        save_state(config.FSCK_STATE_PATH, state)
+    
+    if not summary['findings']:
+        print("No problems found")
+    for kind, count in sorted(summary['findings'].items()):
+        print(f"  {kind}: {count}")
+    for kind, examples in sorted(summary['examples'].items()):
+        for example in examples[:3]:
+            detail = {k: v for k, v in example.items() if k not in ('kind', 'repaired')}
+            print(f"    {kind}: {detail}")
+    if summary['complete']:
+        print(f"Check complete ({summary['checked']} items, {summary['elapsed_s']}s)")
+    else:
+        print(f"Stopped after {summary['elapsed_s']}s; run again with --incremental to continue")
+
+def _int_option(args, name):
+    """Positive integer following ``name`` in ``args``, or None; raises ValueError."""
+    value = _option_value(args, name)
+    if value is None:
+        return None
+    number = int(value)
+    if number < 1:
+        raise ValueError(name)
+    return number
+
+def import_records(args):
+    """Create users, and optionally add files, from CSV or JSON-lines files."""
+    from utils.bulk import FileImporter, UserImporter, read_records
+    
+    if not args or args[0].startswith('--'):
+        print("Error: Input file required")
+        print("Usage: python db_manager.py import <users.csv|users.jsonl> [--files FILE]")
+        return
+    try:
+        batch_size = _int_option(args, '--batch-size')
+        workers = _int_option(args, '--workers')
+    except ValueError:
+        print("Error: --batch-size and --workers must be positive numbers")
+        return
+    fmt = _option_value(args, '--format')
+    files_path = _option_value(args, '--files')
+    
+    def report(line, message):
+        print(f"\n  line {line}: {message}")
+    
+    def user_progress(counts):
+        print(f"\rUsers: read {counts['read']}, created {counts['created']}, "
+              f"existing {counts['existing']}, invalid {counts['invalid']}", end='', flush=True)
+    
+    try:
+        counts = UserImporter(batch_size, workers, on_error=report).run(
+            read_records(args[0], fmt), progress=user_progress
+        )
+        print(f"\nUser import complete: {counts['created']} created")
+        if not files_path:
+            return
+        
+        from utils.filemanager import FileManager
+        file_manager = FileManager()
+        # Text and thumbnails are cheaper in one pass afterwards
+        file_manager.search_index.extract_on_add = False
+        file_manager.documents.process_on_add = False
+        
+        def file_progress(counts):
+            print(f"\rFiles: read {counts['read']}, added {counts['added']}, "
+                  f"failed {counts['failed']}", end='', flush=True)
+        
+        counts = FileImporter(file_manager, batch_size, workers, on_error=report).run(
+            read_records(files_path, fmt), progress=file_progress
+        )
+        print(f"\nFile import complete: {counts['added']} added")
+        if counts['added']:
+            print("Run 'python db_manager.py reindex' and 'python db_manager.py backfill' "
+                  "to index text and render thumbnails")
+    except (OSError, ValueError) as e:
+        print(f"\nError: {e}")
+
+def export_records(args):
+    """Stream users or file metadata as CSV or JSON lines."""
+    from utils.bulk import detect_format, export_files, export_users
+    
+    if not args or args[0] not in ('users', 'files'):
+        print("Error: Specify what to export")
+        print("Usage: python db_manager.py export users|files [--output FILE] [--format csv|jsonl]")
+        return
+    output = _option_value(args, '--output')
+    fmt = _option_value(args, '--format')
+    try:
+        # Standard output defaults to JSON lines
+        fmt = detect_format(output, fmt) if output else detect_format('-', fmt or 'jsonl')
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    
+    f = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        if args[0] == 'users':
+            count = export_users(f, fmt, with_hashes='--with-hashes' in args)
+        else:
+            count = export_files(f, fmt, include_deleted='--include-deleted' in args)
+    finally:
+        if output:
+            f.close()
+    # Keep stdout clean for piping
+    print(f"Exported {count} {args[0]}", file=sys.stderr)
+
+def backup_databases(target_dir=None):
+    """Snapshot both databases with SQLite's online backup API."""
+    target_dir = target_dir or os.path.join('backups', datetime.now().strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(target_dir, exist_ok=True)
+    
+    for db_path in (config.USERS_DATABASE_PATH, config.DATABASE_PATH):
+        dest_path = os.path.join(target_dir, os.path.basename(db_path))
+        
+        def progress(status, remaining, total):
+            print(f"\r{db_path}: {total - remaining}/{total} pages", end='', flush=True)
+        
+        try:
+            size = get_pool(db_path).backup(dest_path, progress=progress)
+        except (OSError, sqlite3.Error) as e:
+            print(f"\nError backing up {db_path}: {e}")
+            return
+        print(f"\r{db_path} -> {dest_path} ({size:,} bytes)")
+    print(f"Backup complete. Stored files in {config.UPLOAD_FOLDER} are not included; "
+          "blobs never change once written, so copy them with rsync or similar.")
+
 def main():
     """Main function to handle command line arguments."""
     if len(sys.argv) < 2:
@@ -128,11 +528,54 @@ def main():
     
     command = sys.argv[1].lower()
     
+    # Every command except the read-only ones needs an up-to-date schema
+    if command not in ('help', 'status', 'migrate', 'kdf-bench'):
+        init_database()
+    
     if command == 'help':
         show_help()
     elif command == 'init':
-        init_database()
         print("Database initialized successfully")
+    elif command == 'migrate':
+        migrate_databases()
+    elif command == 'status':
+        show_schema_status()
+    elif command == 'cleanup-uploads':
+        cleanup_uploads()
+    elif command == 'reindex':
+        reindex_files()
+    elif command == 'backfill':
+        backfill_documents(sys.argv[2:])
+    elif command == 'kdf-bench':
+        try:
+            target_ms = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+        except ValueError:
+            print("Error: Target must be a number of milliseconds")
+            return
+        kdf_bench(target_ms)
+    elif command == 'quota':
+        if len(sys.argv) < 4:
+            print("Error: Email and size required")
+            print("Usage: python db_manager.py quota <email> <size|default> [files|default]")
+            return
+        set_user_quota(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None)
+    elif command == 'usage':
+        show_usage(sys.argv[2] if len(sys.argv) > 2 else None)
+    elif command == 'recompute-usage':
+        recompute_usage()
+    elif command == 'purge':
+        purge_trash(sys.argv[2:])
+    elif command == 'fsck':
+        run_fsck(sys.argv[2:])
+    elif command in ('sessions', 'revoke'):
+        if len(sys.argv) < 3:
+            print("Error: Email required")
+            print(f"Usage: python db_manager.py {command} <email>")
+            return
+        if command == 'sessions':
+            show_sessions(sys.argv[2])
+        else:
+            revoke_sessions(sys.argv[2])
     elif command == 'create':
         if len(sys.argv) < 3:
             print("Error: Email required")
@@ -147,6 +590,12 @@ def main():
         delete_user_confirm(sys.argv[2])
     elif command == 'list':
         list_users()
+    elif command == 'import':
+        import_records(sys.argv[2:])
+    elif command == 'export':
+        export_records(sys.argv[2:])
+    elif command == 'backup':
+        backup_databases(sys.argv[2] if len(sys.argv) > 2 else None)
     elif command == 'info':
         if len(sys.argv) < 3:
             print("Error: Email required")
@@ -0,0 +1,774 @@
+// Server-provided settings (see the pageConfig block in home.html)
+const PAGE = JSON.parse(document.getElementById('pageConfig').textContent);
+
+// Global variables
+const fileInput = document.getElementById('fileInput');
+const uploadArea = document.getElementById('uploadArea');
+const searchInput = document.getElementById('searchInput');
+const filesList = document.getElementById('filesList');
+const alert = document.getElementById('alert');
+let dragCounter = 0;
+let searchTimeout;
+let suggestTimeout;
+let suggestController = null;
+const searchSuggestions = document.getElementById('searchSuggestions');
+let allFiles = []; // Store all files for client-side search fallback
+const SINGLE_UPLOAD_LIMIT = PAGE.single_upload_limit;
+const CHUNK_RETRIES = 5;
+const UPLOAD_CONCURRENCY = PAGE.upload_concurrency;
+const BATCH_MAX_FILES = 50;
+const BATCH_MAX_BYTES = PAGE.batch_upload_limit;
+const sortSelect = document.getElementById('sortSelect');
+const loadMore = document.getElementById('loadMore');
+let nextCursor = PAGE.next_cursor;
+let currentSort = PAGE.sort;
+let loadingPage = false;
+let changesSeq = PAGE.changes_seq;
+let syncingChanges = false;
+const CHANGES_POLL_INTERVAL = PAGE.changes_poll_interval;
+// Without a renderer on the server every thumbnail request would be a 404
+const THUMBNAILS = PAGE.thumbnails;
+
+// Initialize the application
+document.addEventListener('DOMContentLoaded', function() {
+    initializeApp();
+});
+
+function initializeApp() {
+    // Store initial file data for search functionality
+    storeFileData();
+
+    // Setup event listeners
+    setupDragAndDrop();
+    setupFileInput();
+    setupSearch();
+    setupPagination();
+    setupLiveUpdates();
+
+    console.log('Drive Clone initialized successfully');
+}
+
+// Store file data from DOM for search functionality
+function storeFileData() {
+    const fileRows = document.querySelectorAll('.file-row');
+    allFiles = Array.from(fileRows).map(fileEntry);
+}
+
+function fileEntry(row) {
+    const filename = row.querySelector('.file-name span').textContent;
+    const type = row.querySelector('.file-type').textContent;
+    const size = row.querySelector('.file-size').textContent;
+    const date = row.querySelector('.file-date').textContent;
+
+    return {
+        element: row,
+        id: Number(row.dataset.fileId),
+        filename: filename,
+        uploadDate: row.dataset.uploadDate,
+        type: type,
+        size: size,
+        date: date,
+        searchText: filename.toLowerCase()
+    };
+}
+
+// Enhanced drag and drop functionality
+function setupDragAndDrop() {
+    document.addEventListener('dragenter', handleDragEnter);
+    document.addEventListener('dragleave', handleDragLeave);
+    document.addEventListener('dragover', handleDragOver);
+    document.addEventListener('drop', handleDrop);
+}
+
+function handleDragEnter(e) {
+    e.preventDefault();
+    dragCounter++;
+    if (e.dataTransfer.types.includes('Files')) {
+        uploadArea.style.display = 'flex';
+        uploadArea.classList.add('dragover');
+    }
+}
+
+function handleDragLeave(e) {
+    e.preventDefault();
+    dragCounter--;
+    if (dragCounter === 0) {
+        uploadArea.style.display = 'none';
+        uploadArea.classList.remove('dragover');
+    }
+}
+
+function handleDragOver(e) {
+    e.preventDefault();
+}
+
+function handleDrop(e) {
+    e.preventDefault();
+    dragCounter = 0;
+    uploadArea.style.display = 'none';
+    uploadArea.classList.remove('dragover');
+
+    const files = Array.from(e.dataTransfer.files).filter(file => 
+        file.type === 'application/pdf'
+    );
+
+    if (files.length > 0) {
+        uploadFiles(files);
+    } else if (e.dataTransfer.files.length > 0) {
+        showAlert('Please drop only PDF files', 'error');
+    }
+}
+
+// File input setup
+function setupFileInput() {
+    fileInput.addEventListener('change', (e) => {
+        const files = Array.from(e.target.files);
+        if (files.length > 0) {
+            uploadFiles(files);
+        }
+    });
+}
+
+// Enhanced search functionality
+function setupSearch() {
+    searchInput.addEventListener('input', handleSearch);
+    searchInput.addEventListener('keydown', (e) => {
+        if (e.key === 'Escape') {
+            clearSearch();
+        }
+    });
+}
+
+function handleSearch(e) {
+    clearTimeout(searchTimeout);
+    const query = e.target.value.trim();
+    suggestFilenames(query);
+
+    if (query.length === 0) {
+        clearSearch();
+        return;
+    }
+
+    searchTimeout = setTimeout(() => {
+        performSearch(query);
+    }, 300);
+}
+
+function performSearch(query) {
+    const searchTerm = query.toLowerCase();
+
+    // Try server-side search first
+    if (typeof window.fetch !== 'undefined') {
+        serverSearch(query)
+            .then(results => {
+                if (results && results.length !== undefined) {
+                    displaySearchResults(results, query);
+                } else {
+                    // Fallback to client-side search
+                    clientSideSearch(searchTerm);
+                }
+            })
+            .catch(() => {
+                // Fallback to client-side search
+                clientSideSearch(searchTerm);
+            });
+    } else {
+        // Client-side search only
+        clientSideSearch(searchTerm);
+    }
+}
+
+// Typo-tolerant filename suggestions while typing
+function suggestFilenames(query) {
+    clearTimeout(suggestTimeout);
+    if (suggestController) suggestController.abort();
+    if (query.length < 2 || typeof window.fetch === 'undefined') {
+        searchSuggestions.replaceChildren();
+        return;
+    }
+
+    suggestTimeout = setTimeout(async () => {
+        suggestController = new AbortController();
+        try {
+            const response = await fetch(`/autocomplete?q=${encodeURIComponent(query)}`,
+                                         { signal: suggestController.signal });
+            if (!response.ok) return;
+            const data = await response.json();
+            searchSuggestions.replaceChildren(...(data.suggestions || []).map(s => {
+                const option = document.createElement('option');
+                option.value = s.filename;
+                return option;
+            }));
+        } catch (error) {
+            // Aborted by a newer keystroke, or offline; suggestions are optional
+        }
+    }, 120);
+}
+
+async function serverSearch(query) {
+    try {
+        const response = await fetch(`/search?q=${encodeURIComponent(query)}`);
+        if (!response.ok) throw new Error('Search failed');
+        const data = await response.json();
+        return data.results || [];
+    } catch (error) {
+        console.warn('Server search failed, using client-side search');
+        throw error;
+    }
+}
+
+function clientSideSearch(searchTerm) {
+    const filteredFiles = allFiles.filter(file => 
+        file.searchText.includes(searchTerm)
+    );
+
+    displayClientSearchResults(filteredFiles, searchTerm);
+}
+
+function displayClientSearchResults(filteredFiles, query) {
+    if (filteredFiles.length === 0) {
+        showNoSearchResults(query);
+        return;
+    }
+
+    // Hide all files first
+    allFiles.forEach(file => {
+        file.element.style.display = 'none';
+    });
+
+    // Show matching files
+    filteredFiles.forEach(file => {
+        file.element.style.display = 'grid';
+        highlightSearchTerm(file.element, query);
+    });
+}
+
+function displaySearchResults(results, query) {
+    if (!results || results.length === 0) {
+        showNoSearchResults(query);
+        return;
+    }
+
+    filesList.innerHTML = results.map(pdf => renderFileRow(pdf, query)).join('');
+}
+
+function renderFileRow(pdf, query) {
+    return `
+        <div class="file-row" data-file-id="${pdf.id}" data-filename="${escapeHtml(pdf.filename)}" data-upload-date="${escapeHtml(pdf.upload_date || '')}">
+            <div class="file-name"${pdf.title ? ` title="${escapeHtml(pdf.title)}"` : ''}>
+                <div class="file-icon">${THUMBNAILS ? `<img class="file-thumb" src="/thumbnail/${pdf.id}" alt="" loading="lazy" onload="this.parentNode.classList.add('has-thumb')" onerror="this.remove()">` : ''}📄</div>
+                <span>${highlightText(pdf.filename, query)}</span>
+                ${pdf.snippet ? `<div class="file-snippet">${pdf.snippet}</div>` : ''}
+            </div>
+            <div class="file-type">application/pdf${pdf.page_count ? ` · ${pdf.page_count} page${pdf.page_count === 1 ? '' : 's'}` : ''}</div>
+            <div class="file-size">${escapeHtml(pdf.file_size || 'Unknown')}</div>
+            <div class="file-date">${escapeHtml(pdf.upload_date ? pdf.upload_date.split(' ')[0] : 'Unknown')}</div>
+            <div class="file-actions">
+                <button class="action-btn" title="Download" onclick="downloadFile(${pdf.id})">
+                    ⬇️
+                </button>
+                <button class="action-btn" title="Share" onclick="shareFile(${pdf.id})">
+                    🔗
+                </button>
+                <button class="action-btn danger" title="Delete" onclick="deleteFile(${pdf.id}, '${escapeHtml(pdf.filename)}')">
+                    🗑️
+                </button>
+                <button class="action-btn" title="Preview" onclick="previewFile(${pdf.id})">
+                    👁️
+                </button>
+            </div>
+        </div>
+    `;
+}
+
+// Keyset pagination: fetch the next page when the sentinel scrolls into view
+function setupPagination() {
+    sortSelect.addEventListener('change', () => {
+        currentSort = sortSelect.value;
+        searchInput.value = '';
+        reloadFiles();
+    });
+
+    if ('IntersectionObserver' in window) {
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        }, { rootMargin: '400px' });
+        observer.observe(loadMore);
+    } else {
+        window.addEventListener('scroll', () => {
+            if (window.innerHeight + window.scrollY >= document.body.offsetHeight - 400) {
+                loadNextPage();
+            }
+        });
+    }
+}
+
+async function fetchPage(cursor) {
+    const params = new URLSearchParams({ sort: currentSort });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`/api/files?${params}`);
+    if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+    return response.json();
+}
+
+async function loadNextPage() {
+    if (!nextCursor || loadingPage || searchInput.value.trim()) return;
+    loadingPage = true;
+    try {
+        const page = await fetchPage(nextCursor);
+        appendFiles(page.files);
+        nextCursor = page.next_cursor;
+    } catch (error) {
+        console.warn('Failed to load more files', error);
+    } finally {
+        loadingPage = false;
+    }
+}
+
+async function reloadFiles() {
+    loadingPage = true;
+    try {
+        const page = await fetchPage(null);
+        filesList.innerHTML = '';
+        allFiles = [];
+        appendFiles(page.files);
+        nextCursor = page.next_cursor;
+        if (allFiles.length === 0) clearSearch();
+    } catch (error) {
+        showAlert('Failed to load files', 'error');
+    } finally {
+        loadingPage = false;
+    }
+}
+
+function appendFiles(files) {
+    if (files.length === 0) return;
+    const emptyState = filesList.querySelector('.empty-state');
+    if (emptyState) emptyState.remove();
+    filesList.insertAdjacentHTML('beforeend', files.map(pdf => renderFileRow(pdf, '')).join(''));
+    storeFileData();
+}
+
+// Live updates: patch the listing from the per-user change feed
+function setupLiveUpdates() {
+    if (CHANGES_POLL_INTERVAL <= 0 || typeof window.fetch === 'undefined') return;
+    setInterval(() => {
+        if (document.visibilityState === 'visible') syncChanges();
+    }, CHANGES_POLL_INTERVAL * 1000);
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') syncChanges();
+    });
+}
+
+async function syncChanges() {
+    if (syncingChanges) return;
+    syncingChanges = true;
+    try {
+        let more = true;
+        while (more) {
+            const response = await fetch(`/changes?since=${changesSeq}`);
+            if (!response.ok) return;
+            const feed = await response.json();
+            changesSeq = feed.seq;
+            if (feed.usage) updateUsage(feed.usage);
+            if (feed.reset) {
+                await reloadFiles();
+                return;
+            }
+            applyFileChanges(feed.changes);
+            more = feed.more;
+        }
+    } catch (error) {
+        console.warn('Failed to fetch file changes', error);
+    } finally {
+        syncingChanges = false;
+    }
+}
+
+// Each change is {id, file}; a null file means it left the listing
+function applyFileChanges(changes) {
+    if (!changes.length) return;
+    const searching = searchInput.value.trim() !== '';
+    changes.forEach(change => {
+        const index = allFiles.findIndex(file => file.id === change.id);
+        if (index !== -1) {
+            allFiles[index].element.remove();
+            allFiles.splice(index, 1);
+        }
+        if (change.file) insertFileRow(change.file, searching);
+    });
+    if (searching) return;
+
+    const emptyState = filesList.querySelector('.empty-state');
+    if (allFiles.length && emptyState) {
+        emptyState.remove();
+    } else if (!allFiles.length && !emptyState) {
+        clearSearch();
+    }
+}
+
+function insertFileRow(pdf, searching) {
+    const template = document.createElement('template');
+    template.innerHTML = renderFileRow(pdf, '').trim();
+    const entry = fileEntry(template.content.firstElementChild);
+    const position = allFiles.findIndex(file => compareFiles(entry, file) < 0);
+    if (position === -1) {
+        // Past the loaded rows: a later page will bring it
+        if (nextCursor) return;
+        allFiles.push(entry);
+        if (!searching) filesList.appendChild(entry.element);
+    } else {
+        if (!searching) filesList.insertBefore(entry.element, allFiles[position].element);
+        allFiles.splice(position, 0, entry);
+    }
+}
+
+// Same order as the server's keyset listing: sort key, then id
+function compareFiles(a, b) {
+    const byName = currentSort.startsWith('name');
+    const keyA = byName ? a.filename : a.uploadDate;
+    const keyB = byName ? b.filename : b.uploadDate;
+    const order = keyA < keyB ? -1 : keyA > keyB ? 1 : a.id - b.id;
+    return currentSort.endsWith('desc') ? -order : order;
+}
+
+function updateUsage(usage) {
+    const storageUsage = document.getElementById('storageUsage');
+    let text = `${formatSize(usage.bytes)}${usage.max_bytes ? ` of ${formatSize(usage.max_bytes)}` : ''} used`;
+    text += ` · ${usage.files}${usage.max_files ? ` / ${usage.max_files}` : ''} files`;
+    storageUsage.textContent = text;
+}
+
+function formatSize(bytes) {
+    if (bytes === 0) return '0 B';
+    const units = ['B', 'KB', 'MB', 'GB'];
+    let i = 0;
+    let size = bytes;
+    while (size >= 1024 && i < units.length - 1) {
+        size /= 1024;
+        i++;
+    }
+    return `${size.toFixed(1)} ${units[i]}`;
+}
+
+function showNoSearchResults(query) {
+    filesList.innerHTML = `
+        <div class="empty-state">
+            <div class="empty-icon">🔍</div>
+            <h3>No files found</h3>
+            <p>No PDF files match "${escapeHtml(query)}". Try a different search term.</p>
+            <button onclick="clearSearch()" style="margin-top: 16px; padding: 8px 16px; background: #1a73e8; color: white; border: none; border-radius: 4px; cursor: pointer;">Clear Search</button>
+        </div>
+    `;
+}
+
+function clearSearch() {
+    searchInput.value = '';
+
+    // Server results replace the list, so put the loaded rows back
+    filesList.replaceChildren(...allFiles.map(file => file.element));
+
+    // Show all files again
+    allFiles.forEach(file => {
+        file.element.style.display = 'grid';
+        removeHighlights(file.element);
+    });
+
+    // If no files exist, show empty state
+    if (allFiles.length === 0) {
+        filesList.innerHTML = `
+            <div class="empty-state">
+                <div class="empty-icon">📁</div>
+                <h3>No files in Drive</h3>
+                <p>Upload your first PDF file to get started</p>
+            </div>
+        `;
+    }
+}
+
+function highlightSearchTerm(element, term) {
+    const nameSpan = element.querySelector('.file-name span');
+    const originalText = nameSpan.textContent;
+    nameSpan.innerHTML = highlightText(originalText, term);
+}
+
+function removeHighlights(element) {
+    const nameSpan = element.querySelector('.file-name span');
+    const originalText = nameSpan.textContent;
+    nameSpan.innerHTML = escapeHtml(originalText);
+}
+
+function highlightText(text, term) {
+    if (!term) return escapeHtml(text);
+
+    const regex = new RegExp(`(${escapeRegex(term)})`, 'gi');
+    return escapeHtml(text).replace(regex, '<mark style="background: #fff2cc; padding: 1px 2px; border-radius: 2px;">$1</mark>');
+}
+
+// Upload files: small ones share batch requests, large ones go chunked
+async function uploadFiles(files) {
+    fileInput.value = '';
+
+    const large = files.filter(file => file.size > SINGLE_UPLOAD_LIMIT);
+    const batches = [];
+    let batch = [];
+    let batchBytes = 0;
+    files.filter(file => file.size <= SINGLE_UPLOAD_LIMIT).forEach(file => {
+        if (batch.length && (batch.length >= BATCH_MAX_FILES || batchBytes + file.size > BATCH_MAX_BYTES)) {
+            batches.push(batch);
+            batch = [];
+            batchBytes = 0;
+        }
+        batch.push(file);
+        batchBytes += file.size;
+    });
+    if (batch.length) batches.push(batch);
+
+    let successful = 0;
+    let failed = 0;
+    const added = [];
+    const batchResults = await runLimited(batches, uploadBatch);
+    batchResults.forEach((result, i) => {
+        if (result.status === 'fulfilled') {
+            successful += result.value.uploaded;
+            failed += result.value.failed;
+            result.value.results.forEach(r => {
+                if (r.success && r.file) added.push(r.file);
+            });
+        } else {
+            failed += batches[i].length;
+        }
+    });
+
+    const chunkedResults = await runLimited(large, uploadFileChunked);
+    chunkedResults.forEach(result => {
+        if (result.status === 'fulfilled') {
+            successful++;
+            if (result.value.file) added.push(result.value.file);
+        } else {
+            failed++;
+        }
+    });
+
+    if (successful > 0) {
+        showAlert(`${successful} file(s) uploaded successfully!`, 'success');
+        // Insert the new rows now; the feed then brings usage and other tabs' changes
+        applyFileChanges(added.map(file => ({ id: file.id, file: file })));
+        syncChanges();
+    }
+
+    if (failed > 0) {
+        showAlert(`${failed} file(s) failed to upload`, 'error');
+    }
+}
+
+// Like Promise.allSettled(items.map(task)), but at most UPLOAD_CONCURRENCY
+// at a time: the server refuses a user's uploads beyond its limit
+async function runLimited(items, task) {
+    const results = new Array(items.length);
+    let next = 0;
+    async function worker() {
+        while (next < items.length) {
+            const i = next++;
+            try {
+                results[i] = { status: 'fulfilled', value: await task(items[i]) };
+            } catch (reason) {
+                results[i] = { status: 'rejected', reason: reason };
+            }
+        }
+    }
+    await Promise.all(Array.from({ length: Math.min(UPLOAD_CONCURRENCY, items.length) }, worker));
+    return results;
+}
+
+// Milliseconds to wait before retrying a refused upload, or null if it should not be retried
+function retryDelay(response, attempt) {
+    if (![429, 503, 507].includes(response.status) || attempt > CHUNK_RETRIES) return null;
+    const seconds = parseInt(response.headers.get('Retry-After'), 10);
+    return 1000 * (Number.isFinite(seconds) ? seconds : attempt);
+}
+
+async function uploadBatch(files) {
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+
+    for (let attempt = 1; ; attempt++) {
+        const response = await fetch('/upload/batch', {
+            method: 'POST',
+            body: formData
+        });
+
+        const data = await response.json();
+        if (response.ok) {
+            return data;
+        }
+        const delay = retryDelay(response, attempt);
+        if (delay === null) {
+            throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        }
+        await new Promise(resolve => setTimeout(resolve, delay));
+    }
+}
+
+// Resumable upload for files too large for a single request
+async function uploadFileChunked(file) {
+    const initResponse = await fetch('/upload/chunked', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    const upload = await initResponse.json();
+    if (!initResponse.ok) {
+        throw new Error(upload.error || 'Upload failed');
+    }
+
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        try {
+            const response = await fetch(`/upload/chunked/${upload.upload_id}`, {
+                method: 'PUT',
+                headers: { 'Upload-Offset': String(offset) },
+                body: chunk
+            });
+            const data = await response.json();
+            if (response.ok || response.status === 409) {
+                offset = data.offset;
+                retries = 0;
+                continue;
+            }
+            const error = new Error(data.error || 'Upload failed');
+            error.delay = retryDelay(response, retries + 1);
+            throw error;
+        } catch (error) {
+            if (++retries > CHUNK_RETRIES) {
+                throw error;
+            }
+            // Ask the server how much arrived, then resume from there
+            await new Promise(resolve => setTimeout(resolve, error.delay || 1000 * retries));
+            const status = await fetch(`/upload/chunked/${upload.upload_id}`);
+            if (status.ok) {
+                offset = (await status.json()).offset;
+            }
+        }
+    }
+
+    const response = await fetch(`/upload/chunked/${upload.upload_id}/finalize`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: '{}'
+    });
+    const data = await response.json();
+    if (!response.ok || !data.success) {
+        throw new Error(data.error || 'Upload failed');
+    }
+    return data;
+}
+
+// File action functions
+function downloadFile(fileId) {
+    window.open(`/download/${fileId}`, '_blank');
+}
+
+function downloadAll() {
+    window.location.href = '/download/zip?all=1';
+}
+
+function shareFile(fileId) {
+    const shareUrl = `${window.location.origin}/preview/${fileId}`;
+
+    if (navigator.clipboard && navigator.clipboard.writeText) {
+        navigator.clipboard.writeText(shareUrl)
+            .then(() => {
+                showAlert('Share link copied to clipboard!', 'success');
+            })
+            .catch(() => {
+                promptCopyLink(shareUrl);
+            });
+    } else {
+        promptCopyLink(shareUrl);
+    }
+}
+
+function promptCopyLink(url) {
+    const textArea = document.createElement('textarea');
+    textArea.value = url;
+    document.body.appendChild(textArea);
+    textArea.select();
+
+    try {
+        document.execCommand('copy');
+        showAlert('Share link copied to clipboard!', 'success');
+    } catch (err) {
+        prompt('Copy this link:', url);
+    }
+
+    document.body.removeChild(textArea);
+}
+
+function previewFile(fileId) {
+    window.open(`/preview/${fileId}`, '_blank');
+}
+
+async function deleteFile(fileId, filename) {
+    if (!confirm(`Move "${filename}" to the trash?\n\nIt can be restored from the trash until it is purged.`)) {
+        return;
+    }
+
+    try {
+        const response = await fetch(`/delete/${fileId}`, {
+            method: 'POST'
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const data = await response.json();
+
+        if (data.success) {
+            showAlert(`${filename} moved to trash`, 'success');
+            applyFileChanges([{ id: Number(fileId), file: null }]);
+            syncChanges();
+        } else {
+            throw new Error(data.error || 'Delete failed');
+        }
+    } catch (error) {
+        showAlert(`Error deleting file: ${error.message}`, 'error');
+    }
+}
+
+// Utility functions
+function showAlert(message, type) {
+    alert.className = `alert ${type}`;
+    alert.textContent = message;
+    alert.style.display = 'block';
+
+    setTimeout(() => {
+        alert.style.display = 'none';
+    }, 4000);
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function escapeRegex(string) {
+    return string.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+}
+
+// Error handling
+window.addEventListener('error', function(e) {
+    console.error('JavaScript error:', e.error);
+    showAlert('An error occurred. Please refresh the page.', 'error');
+});
+
+window.addEventListener('unhandledrejection', function(e) {
+    console.error('Unhandled promise rejection:', e.reason);
+    showAlert('An error occurred. Please try again.', 'error');
+});
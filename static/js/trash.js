@@ -0,0 +1,29 @@
+const alert = document.getElementById('alert');
+
+async function restoreFile(fileId) {
+    try {
+        const response = await fetch(`/restore/${fileId}`, {
+            method: 'POST'
+        });
+        const data = await response.json();
+
+        if (data.success) {
+            document.getElementById(`file-${fileId}`).remove();
+            showAlert('File restored', 'success');
+        } else {
+            throw new Error(data.error || 'Restore failed');
+        }
+    } catch (error) {
+        showAlert(`Error restoring file: ${error.message}`, 'error');
+    }
+}
+
+function showAlert(message, type) {
+    alert.className = `alert ${type}`;
+    alert.textContent = message;
+    alert.style.display = 'block';
+
+    setTimeout(() => {
+        alert.style.display = 'none';
+    }, 4000);
+}
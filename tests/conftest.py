@@ -0,0 +1,72 @@
+import io
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Configuration is read at import time, so point every path at a scratch
+# directory before the app is imported
+DATA_DIR = tempfile.mkdtemp(prefix='localdrive-tests-')
+os.environ.update({
+    'LOCALDRIVE_DATABASE': os.path.join(DATA_DIR, 'database.db'),
+    'LOCALDRIVE_USERS_DATABASE': os.path.join(DATA_DIR, 'users.db'),
+    'LOCALDRIVE_UPLOAD_FOLDER': os.path.join(DATA_DIR, 'uploads'),
+    'LOCALDRIVE_CACHE_DB': os.path.join(DATA_DIR, 'cache.db'),
+    'LOCALDRIVE_SECRET_KEY': 'test-secret-key',
+    # In-process stand-in for a shared session store (sqlite or Redis)
+    'LOCALDRIVE_SESSION_BACKEND': 'memory',
+    'LOCALDRIVE_ASSET_FOLDER': os.path.join(DATA_DIR, 'dist'),
+    'LOCALDRIVE_SCRYPT_N': '1024',
+    'LOCALDRIVE_PURGE_INTERVAL': '0',
+    'LOCALDRIVE_SEARCH_EXTRACT_ON_ADD': '0',
+    'LOCALDRIVE_DOCUMENT_PROCESS_ON_ADD': '0',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'Passw0rd!'
+_users = itertools.count()
+
+def make_pdf(text='hello'):
+    """A small, valid one-page PDF."""
+    stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode()
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R >>',
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+    ]
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return out
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    app.app.config['TESTING'] = True
+    return app
+
+@pytest.fixture
+def client(app_module):
+    """A test client logged in as a fresh user."""
+    client = app_module.app.test_client()
+    email = f'user{next(_users)}@example.com'
+    client.post('/signup', data={'email': email, 'password': PASSWORD, 'confirm_password': PASSWORD})
+    response = client.post('/login', data={'email': email, 'password': PASSWORD})
+    assert response.status_code == 302
+    client.email = email
+    return client
+
+def upload(client, data=None, filename='document.pdf'):
+    """Upload a file through /upload and return its id."""
+    response = client.post('/upload', data={'file': (io.BytesIO(data or make_pdf()), filename)})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['file']['id']
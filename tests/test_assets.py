@@ -0,0 +1,35 @@
+import json
+import os
+import sys
+
+import pytest
+
+from utils.assets import build_assets, minify_css, minify_js
+
+CSS = '.a::before { content: "a: b ; }"; }\n/* note */\n'
+JS = "const s = `a\n  // not a comment\n`;\nconst t = '`';\n// comment\n"
+
+@pytest.fixture
+def no_minifiers(monkeypatch):
+    # A None entry makes the import raise ImportError
+    monkeypatch.setitem(sys.modules, 'rcssmin', None)
+    monkeypatch.setitem(sys.modules, 'rjsmin', None)
+
+def test_fallback_copies_css_unchanged(no_minifiers):
+    assert minify_css(CSS) == CSS
+
+def test_fallback_copies_js_unchanged(no_minifiers):
+    assert minify_js(JS) == JS
+
+def test_build_writes_fingerprinted_assets(no_minifiers, tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'site.css').write_text(CSS)
+    (static / 'logo.png').write_bytes(b'png')
+
+    manifest = build_assets(str(static), str(static / 'dist'))
+    assert list(manifest) == ['css/site.css']
+    built = static / 'dist' / manifest['css/site.css']
+    assert built.read_text() == CSS
+    assert os.path.exists(str(built) + '.gz')
+    assert json.loads((static / 'dist' / 'manifest.json').read_text()) == manifest
@@ -0,0 +1,90 @@
+import io
+import os
+import sqlite3
+
+from conftest import make_pdf, upload
+from utils import config
+
+def blob_row(file_manager, sha256):
+    with file_manager.pool.connection() as conn:
+        return conn.execute('SELECT ref_count FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+
+def file_blob(file_manager, file_id):
+    with file_manager.pool.connection() as conn:
+        return conn.execute('SELECT blob_sha256 FROM files WHERE id = ?', (file_id,)).fetchone()[0]
+
+def test_purging_last_reference_removes_blob(app_module, client):
+    fm = app_module.file_manager
+    file_id = upload(client, make_pdf('only copy'))
+    sha256 = file_blob(fm, file_id)
+    assert fm.blobs.exists(sha256)
+
+    assert fm.purge_file(file_id, client.email)[0]
+    assert blob_row(fm, sha256) is None
+    assert not fm.blobs.exists(sha256)
+
+def test_shared_blob_survives_one_purge(app_module, client):
+    fm = app_module.file_manager
+    data = make_pdf('shared')
+    first = upload(client, data, filename='first.pdf')
+    upload(client, data, filename='second.pdf')
+    sha256 = file_blob(fm, first)
+
+    assert fm.purge_file(first, client.email)[0]
+    assert blob_row(fm, sha256) == (1,)
+    assert fm.blobs.exists(sha256)
+
+def test_blob_removed_without_write_lock(app_module, client, monkeypatch):
+    fm = app_module.file_manager
+    file_id = upload(client, make_pdf('no lock'))
+    remove = fm.blobs.remove
+    locked = []
+
+    def checking_remove(sha256):
+        conn = sqlite3.connect(config.DATABASE_PATH, timeout=0)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.rollback()
+        except sqlite3.OperationalError:
+            locked.append(sha256)
+        finally:
+            conn.close()
+        remove(sha256)
+
+    monkeypatch.setattr(fm.blobs, 'remove', checking_remove)
+    assert fm.purge_file(file_id, client.email)[0]
+    assert locked == []
+
+def test_blob_being_removed_is_not_re_referenced(app_module, client):
+    fm = app_module.file_manager
+    data = make_pdf('claimed')
+    file_id = upload(client, data, filename='claimed.pdf')
+    sha256 = file_blob(fm, file_id)
+    # As remove_unreferenced_blobs leaves it while deleting the bytes
+    with fm.pool.connection() as conn:
+        conn.execute('UPDATE blobs SET ref_count = -1 WHERE sha256 = ?', (sha256,))
+        conn.commit()
+
+    path, digest, _ = fm.blobs.write_stream(io.BytesIO(data))
+    success, message, _ = fm.add_files(client.email, [('again.pdf', path, digest)])[0]
+    assert not success
+    assert 'try again' in message
+
+    with fm.pool.connection() as conn:
+        conn.execute('UPDATE blobs SET ref_count = 1 WHERE sha256 = ?', (sha256,))
+        conn.commit()
+    os.remove(path)
+
+def test_sweep_removes_unreferenced_blobs(app_module, client):
+    fm = app_module.file_manager
+    file_id = upload(client, make_pdf('leftover'))
+    sha256 = file_blob(fm, file_id)
+    # A purge that stopped between its commit and the storage call
+    with fm.pool.connection() as conn:
+        conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        conn.execute('UPDATE blobs SET ref_count = 0 WHERE sha256 = ?', (sha256,))
+        conn.commit()
+
+    assert fm.remove_unreferenced_blobs() == 1
+    assert blob_row(fm, sha256) is None
+    assert not fm.blobs.exists(sha256)
@@ -0,0 +1,66 @@
+import os
+
+from utils import config
+from utils.deployment import check_deployment
+
+def test_single_host_is_accepted(monkeypatch):
+    monkeypatch.setattr(config, 'MULTI_NODE', False)
+    assert check_deployment() == []
+
+def test_multi_node_is_refused(monkeypatch):
+    monkeypatch.setattr(config, 'MULTI_NODE', True)
+    problems = check_deployment()
+    assert len(problems) == 1
+    assert 'LOCALDRIVE_MULTI_NODE' in problems[0]
+
+def test_workers_default_to_one():
+    assert config.gunicorn_workers({}, ['python']) == 1
+
+def test_workers_from_environment():
+    assert config.gunicorn_workers({'WEB_CONCURRENCY': '4'}, ['python']) == 4
+    assert config.gunicorn_workers({'GUNICORN_CMD_ARGS': '--bind :80 --workers=3',
+                                    'WEB_CONCURRENCY': '4'}, ['python']) == 3
+
+def test_workers_from_gunicorn_command_line():
+    argv = ['/usr/local/bin/gunicorn', '-w', '6', 'app:app']
+    assert config.gunicorn_workers({'WEB_CONCURRENCY': '2'}, argv) == 6
+    # Only gunicorn's own command line counts
+    assert config.gunicorn_workers({}, ['db_manager.py', '-w', '6']) == 1
+
+def test_secret_key_file_is_created_once(monkeypatch, tmp_path):
+    from utils.deployment import load_secret_key
+
+    monkeypatch.setattr(config, 'SECRET_KEY', '')
+    path = str(tmp_path / 'secret')
+    key = load_secret_key(path)
+    assert len(key) == 64
+    assert load_secret_key(path) == key
+    assert os.listdir(tmp_path) == ['secret']
+
+def test_secret_key_race_reads_winner(monkeypatch, tmp_path):
+    from utils import deployment
+
+    monkeypatch.setattr(config, 'SECRET_KEY', '')
+    path = str(tmp_path / 'secret')
+    link = os.link
+
+    def lose_race(source, target):
+        # Another worker links its complete key first
+        with open(target, 'w') as f:
+            f.write('winner')
+        link(source, target)
+
+    monkeypatch.setattr(deployment.os, 'link', lose_race)
+    assert deployment.load_secret_key(path) == 'winner'
+    assert os.listdir(tmp_path) == ['secret']
+
+def test_concurrent_secret_key_loads_agree(monkeypatch, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from utils.deployment import load_secret_key
+
+    monkeypatch.setattr(config, 'SECRET_KEY', '')
+    path = str(tmp_path / 'secret')
+    with ThreadPoolExecutor(8) as executor:
+        keys = set(executor.map(lambda _: load_secret_key(path), range(32)))
+    assert len(keys) == 1
@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import Future
+
+from conftest import upload
+from utils.documents import DocumentProcessor, ThumbnailCache
+
+METADATA = {'page_count': 1, 'title': None, 'author': None}
+
+def change_count(file_manager, file_id):
+    with file_manager.pool.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM file_changes WHERE file_id = ?', (file_id,)).fetchone()[0]
+
+def test_unchanged_metadata_records_no_change(app_module, client):
+    fm = app_module.file_manager
+    file_id = upload(client)
+    fm.set_document_info(file_id, METADATA)
+    count = change_count(fm, file_id)
+
+    fm.set_document_info(file_id, METADATA)
+    assert change_count(fm, file_id) == count
+    fm.set_document_info(file_id, dict(METADATA, title='Report'))
+    assert change_count(fm, file_id) == count + 1
+
+def test_failed_marker_expires(tmp_path):
+    cache = ThumbnailCache(root=str(tmp_path), retry_after=60)
+    assert not cache.failed('ab' * 32)
+    cache.mark_failed('ab' * 32)
+    assert cache.failed('ab' * 32)
+
+    path = cache._failed_path('ab' * 32)
+    os.utime(path, (0, 0))
+    assert not cache.failed('ab' * 32)
+    assert not os.path.exists(path)
+
+def test_failed_render_is_remembered(tmp_path):
+    processor = DocumentProcessor(lambda path, sha256: (path, None), renderer='none',
+                                  cache=ThumbnailCache(root=str(tmp_path)))
+    processor.renderer = 'pdftoppm'
+    future = Future()
+    future.set_result((METADATA, None))
+
+    processor._store(1, 'cd' * 32, future)
+    assert not processor.can_render('cd' * 32)
+    assert processor.can_render('ef' * 32)
+
+def test_thumbnail_404_does_not_requeue_failed_render(app_module, client, monkeypatch):
+    documents = app_module.file_manager.documents
+    file_id = upload(client)
+    with app_module.file_manager.pool.connection() as conn:
+        sha256 = conn.execute('SELECT blob_sha256 FROM files WHERE id = ?', (file_id,)).fetchone()[0]
+    scheduled = []
+    monkeypatch.setattr(documents, 'renderer', 'pdftoppm')
+    monkeypatch.setattr(documents, 'schedule', lambda *args, **kwargs: scheduled.append(args))
+
+    assert client.get(f'/thumbnail/{file_id}').status_code == 404
+    assert len(scheduled) == 1
+
+    documents.cache.mark_failed(sha256)
+    assert client.get(f'/thumbnail/{file_id}').status_code == 404
+    assert len(scheduled) == 1
+
+def test_home_omits_thumbnails_without_renderer(app_module, client, monkeypatch):
+    upload(client)
+    monkeypatch.setattr(app_module.file_manager.documents, 'renderer', None)
+    page = client.get('/').get_data(as_text=True)
+    assert 'file-thumb' not in page
+    assert '"thumbnails": false' in page
+
+    monkeypatch.setattr(app_module.file_manager.documents, 'renderer', 'pdftoppm')
+    page = client.get('/').get_data(as_text=True)
+    assert 'file-thumb' in page
+    assert '"thumbnails": true' in page
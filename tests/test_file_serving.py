@@ -0,0 +1,108 @@
+import hashlib
+
+import pytest
+
+from conftest import make_pdf, upload
+from utils import config
+
+@pytest.fixture
+def serve_mode(monkeypatch):
+    def set_mode(mode):
+        monkeypatch.setattr(config, 'FILE_SERVE_MODE', mode)
+    return set_mode
+
+@pytest.fixture
+def document(client):
+    data = make_pdf('served')
+    file_id = upload(client, data, 'served.pdf')
+    return file_id, data
+
+@pytest.mark.parametrize('route', ['download', 'preview'])
+def test_x_accel_hands_the_body_to_the_proxy(client, document, serve_mode, route):
+    file_id, data = document
+    serve_mode('x-accel')
+    response = client.get(f'/{route}/{file_id}')
+
+    assert response.status_code == 200
+    assert response.data == b''
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert response.headers['X-Accel-Redirect'].startswith(config.ACCEL_REDIRECT_PREFIX)
+    assert response.headers['X-Accel-Redirect'].endswith(sha256)
+    assert 'X-Sendfile' not in response.headers
+    assert response.headers['Content-Type'] == 'application/pdf'
+    assert response.headers['ETag'] == f'"{sha256}"'
+    if route == 'download':
+        assert response.headers['Content-Disposition'] == 'attachment; filename="served.pdf"'
+    else:
+        assert 'Content-Disposition' not in response.headers
+
+@pytest.mark.parametrize('route', ['download', 'preview'])
+def test_x_sendfile_hands_the_body_to_the_proxy(client, document, serve_mode, route):
+    file_id, data = document
+    serve_mode('x-sendfile')
+    response = client.get(f'/{route}/{file_id}')
+
+    assert response.status_code == 200
+    assert response.data == b''
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert response.headers['X-Sendfile'].endswith(sha256)
+    assert response.headers['X-Sendfile'].startswith('/')
+    assert 'X-Accel-Redirect' not in response.headers
+    assert response.headers['Content-Type'] == 'application/pdf'
+    assert response.headers['ETag'] == f'"{sha256}"'
+    if route == 'download':
+        assert response.headers['Content-Disposition'] == 'attachment; filename="served.pdf"'
+
+@pytest.mark.parametrize('mode', ['x-accel', 'x-sendfile'])
+def test_offload_still_answers_revalidation(client, document, serve_mode, mode):
+    file_id, _ = document
+    serve_mode(mode)
+    etag = client.get(f'/download/{file_id}').headers['ETag']
+    response = client.get(f'/download/{file_id}', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert 'X-Accel-Redirect' not in response.headers
+    assert 'X-Sendfile' not in response.headers
+
+@pytest.mark.parametrize('route', ['download', 'preview'])
+def test_direct_mode_streams_the_file(client, document, serve_mode, route):
+    file_id, data = document
+    serve_mode('direct')
+    response = client.get(f'/{route}/{file_id}')
+
+    assert response.status_code == 200
+    assert response.data == data
+    assert response.headers['Content-Type'] == 'application/pdf'
+    assert response.headers['Content-Length'] == str(len(data))
+    assert 'X-Accel-Redirect' not in response.headers
+    assert 'X-Sendfile' not in response.headers
+
+@pytest.mark.parametrize('route', ['download', 'preview'])
+def test_direct_mode_conditional_get(client, document, serve_mode, route):
+    file_id, _ = document
+    serve_mode('direct')
+    etag = client.get(f'/{route}/{file_id}').headers['ETag']
+    response = client.get(f'/{route}/{file_id}', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+@pytest.mark.parametrize('route', ['download', 'preview'])
+def test_direct_mode_byte_range(client, document, serve_mode, route):
+    file_id, data = document
+    serve_mode('direct')
+    response = client.get(f'/{route}/{file_id}', headers={'Range': 'bytes=5-14'})
+
+    assert response.status_code == 206
+    assert response.data == data[5:15]
+    assert response.headers['Content-Range'] == f'bytes 5-14/{len(data)}'
+
+@pytest.mark.parametrize('route', ['download', 'preview'])
+def test_direct_mode_unsatisfiable_range(client, document, serve_mode, route):
+    file_id, data = document
+    serve_mode('direct')
+    response = client.get(f'/{route}/{file_id}', headers={'Range': f'bytes={len(data) + 10}-'})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(data)}'
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from conftest import upload
+from utils.fuzzy import FilenameIndex, edits
+
+ROWS = [
+    (1, 'test.pdf', '2024-01-04', 100),
+    (2, 'invoice_2024.pdf', '2024-01-03', 200),
+    (3, 'testing_notes.pdf', '2024-01-02', 300),
+    (4, 'report.pdf', '2024-01-01', 400),
+]
+
+def ids(results):
+    return [result[1] for result in results]
+
+@pytest.mark.parametrize('a, b, expected', [
+    ('test', 'test', 0),
+    ('tset', 'test', 1),   # transposition
+    ('tst', 'test', 1),    # deletion
+    ('teest', 'test', 1),  # insertion
+    ('tent', 'test', 1),   # substitution
+    ('ab', 'ba', 1),
+    ('tste', 'test', None),
+    ('tes', 'tests', None),
+])
+def test_edits(a, b, expected):
+    assert edits(a, b) == expected
+    assert edits(b, a) == expected
+
+def test_transposed_short_word_finds_file():
+    assert ids(FilenameIndex(ROWS).search('tset'))[0] == 1
+
+def test_edit_fallback_matches_prefix_while_typing():
+    assert 3 in ids(FilenameIndex(ROWS).search('tset notes'))
+    assert ids(FilenameIndex(ROWS).search('rpeort')) == [4]
+
+def test_trigram_matches_rank_before_edit_matches():
+    index = FilenameIndex(ROWS + [(5, 'tset.pdf', '2023-12-31', 500)])
+    assert ids(index.search('tset'))[0] == 5
+
+def test_unrelated_query_finds_nothing():
+    assert FilenameIndex(ROWS).search('xyz') == []
+
+def test_removed_file_leaves_vocabulary():
+    index = FilenameIndex(ROWS)
+    index.remove(1)
+    assert 1 not in ids(index.search('tset'))
+    assert 'test' not in index.words
+
+def test_search_does_not_wait_for_other_users(app_module, client):
+    other = app_module.app.test_client()
+    other.post('/signup', data={'email': 'other-fuzzy@example.com', 'password': 'Passw0rd!',
+                                'confirm_password': 'Passw0rd!'})
+    other.post('/login', data={'email': 'other-fuzzy@example.com', 'password': 'Passw0rd!'})
+    upload(client, filename='test.pdf')
+    filenames = app_module.file_manager.filenames
+
+    busy = filenames.index_for('other-fuzzy@example.com')
+    results = []
+    with busy.lock:
+        thread = threading.Thread(target=lambda: results.extend(filenames.search(client.email, 'tset')))
+        thread.start()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert [result[2] for result in results] == ['test.pdf']
@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils.metrics import ARCHIVE_NAME, Registry
+
+pytest.importorskip('fcntl')
+
+def make_registry(directory):
+    registry = Registry(directory=str(directory), flush_interval=0)
+    counter = registry.counter('test_requests_total', 'Requests.', ('route',))
+    gauge = registry.gauge('test_in_flight', 'In flight.')
+    return registry, counter, gauge
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def write_snapshot(directory, pid, requests, in_flight):
+    with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+        json.dump({'test_requests_total': [[['home'], requests]],
+                   'test_in_flight': [[[], in_flight]]}, f)
+
+def test_exited_worker_is_archived_once(tmp_path):
+    registry, counter, gauge = make_registry(tmp_path)
+    counter.inc(route='home')
+    gauge.set(1)
+    pid = dead_pid()
+    write_snapshot(tmp_path, pid, 5, 7)
+
+    for _ in range(2):
+        merged = registry.collect()
+        assert merged['test_requests_total'] == {('home',): 6}
+        # Gauges of exited processes are dropped
+        assert merged['test_in_flight'] == {(): 1}
+    assert not os.path.exists(tmp_path / f'{pid}.json')
+    assert os.path.exists(tmp_path / ARCHIVE_NAME)
+
+def test_archive_accumulates(tmp_path):
+    registry, counter, _ = make_registry(tmp_path)
+    write_snapshot(tmp_path, dead_pid(), 2, 0)
+    registry.collect()
+    write_snapshot(tmp_path, dead_pid(), 3, 0)
+    assert registry.collect()['test_requests_total'] == {('home',): 5}
+
+def test_recycled_pid_file_is_archived_before_overwrite(tmp_path):
+    registry, counter, _ = make_registry(tmp_path)
+    write_snapshot(tmp_path, os.getpid(), 4, 0)
+    counter.inc(route='home')
+    registry.flush(force=True)
+    assert registry.collect()['test_requests_total'] == {('home',): 5}
@@ -0,0 +1,50 @@
+import pytest
+
+from conftest import PASSWORD
+from utils import auth, sessions
+from utils.db import get_pool
+from utils.migrations import USERS_MIGRATIONS, migrate
+
+def test_store_is_shared_per_process(app_module):
+    store = sessions.get_session_store()
+    assert store is not None
+    assert store is sessions.get_session_store()
+    assert app_module.app.session_interface.store is store
+
+def test_revoked_session_cookie_is_rejected(client):
+    assert client.get('/api/files').status_code == 200
+    assert sessions.revoke_user_sessions(client.email) == 1
+    assert client.get('/api/files').status_code == 401
+
+def test_password_change_signs_out_other_devices(app_module, client):
+    other = app_module.app.test_client()
+    assert other.post('/login', data={'email': client.email, 'password': PASSWORD}).status_code == 302
+    assert other.get('/api/files').status_code == 200
+
+    success, _ = auth.update_password(client.email, 'N3w-Passw0rd!')
+    assert success
+    assert client.get('/api/files').status_code == 401
+    assert other.get('/api/files').status_code == 401
+
+def test_logout_all_ends_every_session(app_module, client):
+    other = app_module.app.test_client()
+    other.post('/login', data={'email': client.email, 'password': PASSWORD})
+
+    client.get('/logout?all=1')
+    assert other.get('/api/files').status_code == 401
+
+@pytest.mark.parametrize('backend', ['sqlite', 'memory'])
+def test_store_revoke_user(backend, tmp_path):
+    if backend == 'sqlite':
+        path = str(tmp_path / 'users.db')
+        migrate(get_pool(path), USERS_MIGRATIONS)
+        store = sessions.SQLiteSessionStore(path)
+    else:
+        store = sessions.MemorySessionStore()
+    store.save('a', 'alice@example.com', {'user': 'alice@example.com'}, 2e9)
+    store.save('b', 'alice@example.com', {'user': 'alice@example.com'}, 2e9)
+    store.save('c', 'bob@example.com', {'user': 'bob@example.com'}, 2e9)
+
+    assert store.revoke_user('alice@example.com') == 2
+    assert store.load('a') is None and store.load('b') is None
+    assert store.load('c') is not None
@@ -0,0 +1,92 @@
+import io
+import os
+
+import pytest
+
+from utils.storage import LocalStorage, S3Storage
+
+PART_SIZE = 5 * 1024 * 1024
+
+@pytest.fixture
+def local_storage(tmp_path):
+    return LocalStorage(str(tmp_path / 'blobs'), buffer_size=64 * 1024)
+
+@pytest.fixture
+def s3_storage(monkeypatch):
+    pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        storage = S3Storage(bucket='localdrive-test', prefix='blobs/', region='us-east-1',
+                            part_size=PART_SIZE, buffer_size=64 * 1024)
+        storage.client.create_bucket(Bucket='localdrive-test')
+        yield storage
+
+@pytest.fixture(params=['local', 's3'])
+def storage(request):
+    return request.getfixturevalue(f'{request.param}_storage')
+
+def read(storage, key, start=0, end=None):
+    return b''.join(storage.get(key, start, end))
+
+def test_put_get_and_stat(storage):
+    data = os.urandom(200 * 1024)
+    assert storage.put_stream('ab/cd/object', io.BytesIO(data)) == len(data)
+
+    assert read(storage, 'ab/cd/object') == data
+    stat = storage.stat('ab/cd/object')
+    assert stat.size == len(data)
+    assert stat.mtime > 0
+
+def test_ranged_get(storage):
+    data = os.urandom(100 * 1024)
+    storage.put_stream('ab/cd/ranged', io.BytesIO(data))
+
+    assert read(storage, 'ab/cd/ranged', 10, 19) == data[10:20]
+    assert read(storage, 'ab/cd/ranged', 70000) == data[70000:]
+    with storage.open('ab/cd/ranged', 5) as f:
+        assert f.read(3) == data[5:8]
+
+def test_multipart_upload_larger_than_part_size(storage):
+    data = os.urandom(2 * PART_SIZE + 12345)
+    assert storage.put_stream('ef/gh/large', io.BytesIO(data)) == len(data)
+
+    assert storage.stat('ef/gh/large').size == len(data)
+    assert read(storage, 'ef/gh/large') == data
+    # A range spanning the part boundary
+    assert read(storage, 'ef/gh/large', PART_SIZE - 100, PART_SIZE + 99) == data[PART_SIZE - 100:PART_SIZE + 100]
+
+def test_put_file_removes_the_source(storage, tmp_path):
+    source = tmp_path / 'staged'
+    source.write_bytes(b'staged bytes')
+    storage.put_file('ij/kl/staged', str(source))
+
+    assert not source.exists()
+    assert read(storage, 'ij/kl/staged') == b'staged bytes'
+
+def test_delete_and_missing_objects(storage):
+    storage.put_stream('mn/op/doomed', io.BytesIO(b'bytes'))
+    storage.delete('mn/op/doomed')
+
+    assert storage.stat('mn/op/doomed') is None
+    with pytest.raises(FileNotFoundError):
+        read(storage, 'mn/op/doomed')
+    # Deleting again is not an error
+    storage.delete('mn/op/doomed')
+
+def test_listing(storage):
+    for key in ('aa/11/one', 'aa/11/two', 'aa/22/three'):
+        storage.put_stream(key, io.BytesIO(key.encode()))
+
+    assert storage.list_prefixes('') == ['aa']
+    assert storage.list_prefixes('aa/') == ['11', '22']
+    objects = sorted(storage.list_objects('aa/11/'))
+    assert [(info.key, info.size) for info in objects] == [('aa/11/one', 9), ('aa/11/two', 9)]
+
+def test_local_copy(storage):
+    storage.put_stream('qr/st/copy', io.BytesIO(b'copied'))
+    with storage.local_copy('qr/st/copy') as path:
+        with open(path, 'rb') as f:
+            assert f.read() == b'copied'
@@ -0,0 +1,74 @@
+import io
+import os
+
+from conftest import make_pdf, upload
+from utils import config
+
+def start_chunked(client, data, filename='chunked.pdf'):
+    response = client.post('/upload/chunked', json={'filename': filename, 'size': len(data)})
+    assert response.status_code == 201, response.get_json()
+    upload_id = response.get_json()['upload_id']
+    response = client.put(f'/upload/chunked/{upload_id}', data=data,
+                          headers={'Upload-Offset': '0'})
+    assert response.status_code == 200, response.get_json()
+    return upload_id
+
+def part_path(app_module, upload_id):
+    return os.path.join(app_module.chunked_uploads.staging_dir, upload_id + '.part')
+
+def test_chunked_upload(app_module, client):
+    upload_id = start_chunked(client, make_pdf('chunked'))
+    response = client.post(f'/upload/chunked/{upload_id}/finalize', json={})
+    assert response.status_code == 200
+    assert response.get_json()['file']['filename'] == 'chunked.pdf'
+    assert not os.path.exists(part_path(app_module, upload_id))
+
+def test_chunked_finalize_duplicate_keeps_part(app_module, client):
+    upload_id = start_chunked(client, make_pdf('second'))
+    # The name is taken after the upload started
+    upload(client, filename='chunked.pdf')
+
+    response = client.post(f'/upload/chunked/{upload_id}/finalize', json={})
+    assert response.status_code == 409
+    assert os.path.exists(part_path(app_module, upload_id))
+    assert client.get(f'/upload/chunked/{upload_id}').status_code == 200
+
+def test_chunked_finalize_over_quota_can_retry(app_module, client, monkeypatch):
+    data = make_pdf('quota')
+    upload_id = start_chunked(client, data)
+
+    monkeypatch.setattr(config, 'DEFAULT_QUOTA_BYTES', len(data) - 1)
+    response = client.post(f'/upload/chunked/{upload_id}/finalize', json={})
+    assert response.status_code == 413
+    assert os.path.exists(part_path(app_module, upload_id))
+
+    monkeypatch.setattr(config, 'DEFAULT_QUOTA_BYTES', 0)
+    response = client.post(f'/upload/chunked/{upload_id}/finalize', json={})
+    assert response.status_code == 200
+    assert not os.path.exists(part_path(app_module, upload_id))
+
+def staged_files(app_module):
+    return os.listdir(app_module.file_manager.blobs.staging_dir)
+
+def test_upload_duplicate_name_is_409(app_module, client):
+    upload(client, filename='twice.pdf')
+    before = staged_files(app_module)
+    response = client.post('/upload', data={'file': (io.BytesIO(make_pdf('other')), 'twice.pdf')})
+    assert response.status_code == 409
+    assert staged_files(app_module) == before
+
+def test_upload_error_removes_staged_file(app_module, client, monkeypatch):
+    def failing_add_files(*args, **kwargs):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(app_module.file_manager, 'add_files', failing_add_files)
+    before = staged_files(app_module)
+    response = client.post('/upload', data={'file': (io.BytesIO(make_pdf()), 'broken.pdf')})
+    assert response.status_code == 500
+    assert staged_files(app_module) == before
+
+def test_upload_refused_when_disk_floor_not_met(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module.upload_admission, 'min_free_bytes', 1 << 62)
+    response = client.post('/upload', data={'file': (io.BytesIO(make_pdf()), 'full.pdf')})
+    assert response.status_code == 507
+    assert 'Retry-After' in response.headers
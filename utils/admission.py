@@ -0,0 +1,132 @@
+import shutil
+import threading
+import time
+
+from utils import config, metrics
+
+class UploadRejected(Exception):
+    """Raised when an upload is refused before its body is read."""
+
+    def __init__(self, message, status=429, reason='busy', retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+class UploadTicket:
+    """An admitted upload; ``release`` it once the request is done."""
+
+    def __init__(self, admission, user_email):
+        self.admission = admission
+        self.user_email = user_email
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.admission._release(self.user_email)
+
+class UploadAdmission:
+    """Admission control in front of the upload endpoints.
+
+    An upload is admitted only if the disk holding staged uploads keeps
+    ``min_free_bytes`` free after it, the user has fewer than ``per_user``
+    uploads in progress, and one of ``max_concurrent`` slots frees up
+    within ``queue_timeout`` seconds. Otherwise it is refused before the
+    body is read, so bursts of uploads cannot fill the disk or take every
+    worker away from downloads and listings. Limits apply per process,
+    like the password hashing pool.
+    """
+
+    def __init__(self, max_concurrent=None, per_user=None, min_free_bytes=None,
+                 queue_timeout=None, path=None):
+        self.max_concurrent = max_concurrent or config.UPLOAD_MAX_CONCURRENT
+        self.per_user = per_user or config.UPLOAD_MAX_PER_USER
+        self.min_free_bytes = config.UPLOAD_MIN_FREE_BYTES if min_free_bytes is None else min_free_bytes
+        self.queue_timeout = (config.UPLOAD_QUEUE_TIMEOUT_MS / 1000.0
+                              if queue_timeout is None else queue_timeout)
+        self.path = path or config.UPLOAD_FOLDER
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._active = {}  # user -> uploads in progress
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+
+    def free_bytes(self):
+        """Free space on the staging disk, or None if it cannot be measured."""
+        try:
+            return shutil.disk_usage(self.path).free
+        except OSError:
+            return None
+
+    def check_space(self, size):
+        """Raise UploadRejected if ``size`` more bytes would cross the disk watermark."""
+        free = self.free_bytes()
+        if free is not None and free - size < self.min_free_bytes:
+            self._reject('disk_full', "Not enough storage space on the server, please try again later",
+                         status=507, retry_after=config.UPLOAD_RETRY_AFTER * 12)
+
+    def admit(self, user_email, size=0):
+        """Admit an upload of about ``size`` bytes or raise UploadRejected."""
+        self.check_space(size)
+
+        with self._lock:
+            if self._active.get(user_email, 0) >= self.per_user:
+                self._reject('user_limit',
+                             f"At most {self.per_user} uploads at a time, please wait for one to finish")
+            self._active[user_email] = self._active.get(user_email, 0) + 1
+
+        if not self._slots.acquire(blocking=False):
+            # Wait briefly for a slot rather than failing a short burst
+            metrics.UPLOADS_QUEUED.inc()
+            started = time.perf_counter()
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                metrics.UPLOADS_QUEUED.dec()
+                metrics.UPLOAD_QUEUE_WAIT.observe(time.perf_counter() - started)
+            if not acquired:
+                self._release_user(user_email)
+                self._reject('busy', "The server is busy with other uploads, please try again shortly")
+
+        self.admitted += 1
+        metrics.UPLOADS_ACTIVE.inc()
+        return UploadTicket(self, user_email)
+
+    def _release(self, user_email):
+        self._slots.release()
+        metrics.UPLOADS_ACTIVE.dec()
+        self._release_user(user_email)
+
+    def _release_user(self, user_email):
+        with self._lock:
+            count = self._active.get(user_email, 0) - 1
+            if count > 0:
+                self._active[user_email] = count
+            else:
+                self._active.pop(user_email, None)
+
+    def _reject(self, reason, message, status=429, retry_after=None):
+        self.record_rejection(reason)
+        raise UploadRejected(message, status=status, reason=reason,
+                             retry_after=retry_after or config.UPLOAD_RETRY_AFTER)
+
+    def record_rejection(self, reason):
+        """Count a refused upload (also for type, name and quota checks made by callers)."""
+        self.rejected += 1
+        metrics.UPLOADS_REJECTED.inc(reason=reason)
+
+    def stats(self):
+        with self._lock:
+            in_progress = sum(self._active.values())
+            users = len(self._active)
+        return {
+            'max_concurrent': self.max_concurrent,
+            'per_user': self.per_user,
+            'in_progress': in_progress,
+            'users': users,
+            'free_bytes': self.free_bytes(),
+            'min_free_bytes': self.min_free_bytes,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from flask import url_for
+
+# Asset types the build step processes; everything else is served as is
+MINIFIED_EXTENSIONS = ('.css', '.js')
+
+# Precompressed variants, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+MANIFEST_NAME = 'manifest.json'
+
+# Minifier module per asset type; without it the file is copied unminified,
+# since stripping CSS or JavaScript safely needs a real tokenizer
+MINIFIERS = {'.css': 'rcssmin', '.js': 'rjsmin'}
+
+def minify_css(text):
+    """Comments and insignificant whitespace removed, if rcssmin is installed."""
+    try:
+        import rcssmin
+    except ImportError:
+        return text
+    return rcssmin.cssmin(text)
+
+def minify_js(text):
+    """Comments and insignificant whitespace removed, if rjsmin is installed."""
+    try:
+        import rjsmin
+    except ImportError:
+        return text
+    return rjsmin.jsmin(text)
+
+def missing_minifiers():
+    """Minifier modules that are not installed (their assets are copied as is)."""
+    missing = []
+    for module in MINIFIERS.values():
+        try:
+            __import__(module)
+        except ImportError:
+            missing.append(module)
+    return missing
+
+def compress(data, encoding):
+    if encoding == 'gzip':
+        # mtime=0 keeps builds reproducible
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(data, quality=11)
+    raise ValueError(f"Unknown encoding: {encoding}")
+
+def available_encodings():
+    """Precompressed encodings the build can produce (brotli is optional)."""
+    encodings = []
+    for encoding, suffix in ENCODINGS:
+        if encoding == 'br':
+            try:
+                import brotli  # noqa: F401
+            except ImportError:
+                continue
+        encodings.append((encoding, suffix))
+    return encodings
+
+def build_assets(static_folder, output_folder, progress=None):
+    """Minify, fingerprint and precompress the CSS and JS under ``static_folder``.
+
+    Each asset is written to ``output_folder`` as ``<name>.<hash>.<ext>``
+    alongside ``.gz`` (and, with ``pip install brotli``, ``.br``) copies,
+    and ``manifest.json`` maps source paths to the fingerprinted ones.
+    Files from earlier builds are removed. Returns the manifest.
+    """
+    encodings = available_encodings()
+    output_folder = os.path.abspath(output_folder)
+    staging = output_folder + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != output_folder)
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext not in MINIFIED_EXTENSIONS:
+                continue
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, encoding='utf-8') as f:
+                text = f.read()
+            data = (minify_css(text) if ext == '.css' else minify_js(text)).encode('utf-8')
+
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            built = f'{os.path.dirname(logical)}/{stem}.{digest}{ext}'.lstrip('/')
+            target = os.path.join(staging, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            sizes = [len(text.encode('utf-8')), len(data)]
+            for encoding, suffix in encodings:
+                compressed = compress(data, encoding)
+                with open(target + suffix, 'wb') as f:
+                    f.write(compressed)
+                sizes.append(len(compressed))
+            manifest[logical] = built
+            if progress:
+                progress(logical, built, sizes)
+
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    shutil.rmtree(output_folder, ignore_errors=True)
+    os.replace(staging, output_folder)
+    return manifest
+
+class AssetManifest:
+    """Maps static paths to their fingerprinted builds for ``asset_url``.
+
+    Without a build (e.g. during development) assets are served from
+    ``static/`` under their own names. The manifest is re-read when a new
+    build replaces it, so ``build_assets.py`` can run next to a live app.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._mtime = None
+        self._manifest = {}
+
+    def _load(self):
+        path = os.path.join(self.folder, MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self._mtime, self._manifest = None, {}
+            return self._manifest
+        if mtime != self._mtime:
+            try:
+                with open(path) as f:
+                    self._manifest = json.load(f)
+                self._mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"Error loading asset manifest: {e}")
+        return self._manifest
+
+    def lookup(self, filename):
+        """Fingerprinted path of a static file, or None if it was not built."""
+        return self._load().get(filename)
+
+    def url(self, filename):
+        built = self.lookup(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('assets_file', filename=built)
+
+    def path_for(self, filename, accept_encodings=None):
+        """Path and content encoding of a built asset for a request.
+
+        Prefers a precompressed variant the client accepts. Returns
+        ``(None, None)`` for names that are not fingerprinted builds.
+        """
+        path = os.path.abspath(os.path.join(self.folder, filename))
+        if not path.startswith(os.path.abspath(self.folder) + os.sep) or filename == MANIFEST_NAME:
+            return None, None
+        if accept_encodings is not None:
+            for encoding, suffix in ENCODINGS:
+                if accept_encodings.quality(encoding) > 0 and os.path.isfile(path + suffix):
+                    return path + suffix, encoding
+        if os.path.isfile(path):
+            return path, None
+        return None, None
@@ -1,43 +1,61 @@
-import hashlib
 import sqlite3
 import os
 from contextlib import contextmanager
 
-DATABASE_FILE = 'users.db'
+from utils import config, passwords
+from utils.db import get_pool
+from utils.migrations import USERS_MIGRATIONS, migrate
+from utils.passwords import HasherBusy, hashing_pool
+from utils.sessions import revoke_user_sessions
+
+DATABASE_FILE = config.USERS_DATABASE_PATH
 
 def init_database():
-    """Initialize the SQLite database with users table."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
+    """Bring the users database schema up to date."""
+    return migrate(get_pool(DATABASE_FILE), USERS_MIGRATIONS)
 
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections."""
-    conn = sqlite3.connect(DATABASE_FILE)
-    try:
+    """Context manager for pooled database connections."""
+    with get_pool(DATABASE_FILE).connection() as conn:
         yield conn
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
 
 def hash_password(password):
-    """Hash password using SHA-256."""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash a password with the configured KDF.
+
+    Runs on the bounded hashing pool; raises HasherBusy under overload.
+    """
+    return hashing_pool.run(passwords.hash_password, password)
 
 def verify_password(password, hashed_password):
-    """Verify if password matches the hashed password."""
-    return hash_password(password) == hashed_password
+    """Verify if password matches the hashed password (any supported format)."""
+    return hashing_pool.run(passwords.verify_password, password, hashed_password)
+
+_dummy_hash = None
+
+def _verify_unknown_user(password):
+    """Spend the same KDF time as a real check so unknown emails are not revealed."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(os.urandom(16).hex())
+    verify_password(password, _dummy_hash)
+
+def _rehash(email, password, old_hash):
+    """Upgrade a legacy or outdated hash after a successful login."""
+    try:
+        new_hash = hash_password(password)
+    except HasherBusy:
+        return  # Try again on the next login
+    try:
+        with get_db_connection() as conn:
+            # Only replace the hash we verified against
+            conn.execute(
+                "UPDATE users SET password_hash = ? WHERE email = ? AND password_hash = ?",
+                (new_hash, email, old_hash)
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Error upgrading password hash for {email}: {e}")
 
 def user_exists(email):
     """Check if user exists in the database."""
@@ -50,21 +68,20 @@ def user_exists(email):
         return False
 
 def create_user(email, password):
-    """Create a new user account."""
-    # Initialize database if it doesn't exist
-    init_database()
+    """Create a new user account.
+
+    Raises HasherBusy if password hashing is overloaded.
+    """
+    if user_exists(email):
+        return False, "User already exists"
     
+    # Hash before borrowing a connection; the KDF is the slow part
+    password_hash = hash_password(password)
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # Check if user already exists
-            cursor.execute("SELECT 1 FROM users WHERE email = ?", (email,))
-            if cursor.fetchone():
-                return False, "User already exists"
-            
             # Insert new user
-            password_hash = hash_password(password)
             cursor.execute(
                 "INSERT INTO users (email, password_hash) VALUES (?, ?)",
                 (email, password_hash)
@@ -78,7 +95,11 @@ def create_user(email, password):
         return False, f"Database error: {str(e)}"
 
 def authenticate_user(email, password):
-    """Authenticate user with email and password."""
+    """Authenticate user with email and password.
+
+    Legacy or outdated hashes are upgraded transparently on success.
+    Raises HasherBusy if password hashing is overloaded.
+    """
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -87,18 +108,20 @@ def authenticate_user(email, password):
                 (email,)
             )
             result = cursor.fetchone()
-            
-            if not result:
-                return False, "User not found"
-            
-            stored_hash = result[0]
-            if verify_password(password, stored_hash):
-                return True, "Authentication successful"
-            else:
-                return False, "Invalid password"
-                
     except sqlite3.Error:
         return False, "Database error occurred"
+    
+    if not result:
+        _verify_unknown_user(password)
+        return False, "User not found"
+    
+    stored_hash = result[0]
+    if not verify_password(password, stored_hash):
+        return False, "Invalid password"
+    
+    if passwords.needs_rehash(stored_hash):
+        _rehash(email, password, stored_hash)
+    return True, "Authentication successful"
 
 def get_user_info(email):
     """Get user information by email."""
@@ -131,6 +154,7 @@ def delete_user(email):
             
             if cursor.rowcount > 0:
                 conn.commit()
+                revoke_user_sessions(email)
                 return True, "User deleted successfully"
             else:
                 return False, "User not found"
@@ -139,11 +163,14 @@ def delete_user(email):
         return False, f"Database error: {str(e)}"
 
 def update_password(email, new_password):
-    """Update user password."""
+    """Update user password.
+
+    Raises HasherBusy if password hashing is overloaded.
+    """
+    new_hash = hash_password(new_password)
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            new_hash = hash_password(new_password)
             cursor.execute(
                 "UPDATE users SET password_hash = ? WHERE email = ?",
                 (new_hash, email)
@@ -151,6 +178,8 @@ def update_password(email, new_password):
             
             if cursor.rowcount > 0:
                 conn.commit()
+                # Signed-in devices must log in again with the new password
+                revoke_user_sessions(email)
                 return True, "Password updated successfully"
             else:
                 return False, "User not found"
@@ -168,6 +197,17 @@ def get_all_users():
     except sqlite3.Error:
         return []
 
+def iter_users(with_hashes=False, newest_first=False):
+    """Yield ``(email, created_at[, password_hash])`` rows.
+
+    Rows are streamed from a cursor, so memory use does not grow with the
+    number of users. Raises sqlite3.Error.
+    """
+    columns = 'email, created_at, password_hash' if with_hashes else 'email, created_at'
+    order = 'created_at DESC' if newest_first else 'id'
+    with get_db_connection() as conn:
+        yield from conn.execute(f"SELECT {columns} FROM users ORDER BY {order}")
+
 def validate_email(email):
     """Basic email validation."""
     import re
@@ -180,7 +220,4 @@ def validate_password(password):
         return False, "Password must be at least 6 characters long"
     if len(password) > 128:
         return False, "Password is too long"
-    return True, "Password is valid"
-
-# Initialize database when module is imported
-init_database()
\ No newline at end of file
+    return True, "Password is valid"
\ No newline at end of file
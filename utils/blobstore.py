@@ -0,0 +1,119 @@
+import hashlib
+import os
+import uuid
+
+from utils import config
+from utils.storage import LocalStorage, get_storage
+
+class BlobStore:
+    """Content-addressed file storage.
+
+    Blobs are named by their SHA-256 and spread over a two-level fan-out
+    (``ab/cd/abcd...``) so no directory grows past a few hundred entries.
+    Identical uploads share one blob; reference counting lives in the
+    ``blobs`` table and is maintained by FileManager. The bytes live in a
+    StorageBackend (local directory or S3 bucket); uploads are always
+    staged on local disk under ``root/.tmp`` first.
+    """
+
+    def __init__(self, root=None, buffer_size=None, storage=None):
+        self.root = root or config.BLOB_FOLDER
+        self.buffer_size = buffer_size or config.CHUNK_BUFFER_SIZE
+        if storage is None:
+            storage = LocalStorage(self.root) if root else get_storage()
+        self.storage = storage
+        self.staging_dir = os.path.join(self.root, '.tmp')
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    @property
+    def remote(self):
+        """Whether blobs live somewhere other than the local filesystem."""
+        return self.storage.local_path('') is None
+
+    def key_for(self, sha256):
+        """Storage key of the blob with the given digest."""
+        return f'{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+    def path_for(self, sha256):
+        """Location of the blob, as recorded in ``files.file_path``."""
+        return self.storage.describe(self.key_for(sha256))
+
+    def staging_path(self):
+        """A fresh temporary path on the same filesystem as the staging area."""
+        return os.path.join(self.staging_dir, uuid.uuid4().hex)
+
+    def hash_file(self, path):
+        """Return ``(sha256, size)`` for a file, read in fixed-size buffers."""
+        hasher = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(self.buffer_size)
+                if not block:
+                    break
+                hasher.update(block)
+                size += len(block)
+        return hasher.hexdigest(), size
+
+    def hash_blob(self, sha256):
+        """Recompute ``(sha256, size)`` of a stored blob by streaming it."""
+        hasher = hashlib.sha256()
+        size = 0
+        for block in self.storage.get(self.key_for(sha256)):
+            hasher.update(block)
+            size += len(block)
+        return hasher.hexdigest(), size
+
+    def write_stream(self, stream):
+        """Copy a stream to a staging file, hashing as it goes.
+
+        Returns ``(staging_path, sha256, size)``.
+        """
+        path = self.staging_path()
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(path, 'wb') as f:
+                while True:
+                    block = stream.read(self.buffer_size)
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    size += len(block)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return path, hasher.hexdigest(), size
+
+    def stat(self, sha256):
+        """``(size, mtime)`` of a blob, or None if it is missing."""
+        return self.storage.stat(self.key_for(sha256))
+
+    def exists(self, sha256):
+        return self.stat(sha256) is not None
+
+    def upload(self, source_path, sha256):
+        """Copy a staged file to a remote backend ahead of ``ingest``.
+
+        Lets the network transfer happen before the database write lock is
+        taken; the staged file is kept so ``ingest`` can finish the job.
+        Blobs are immutable, so uploading one that already exists is harmless.
+        """
+        if not self.remote or self.exists(sha256):
+            return
+        with open(source_path, 'rb') as f:
+            self.storage.put_stream(self.key_for(sha256), f)
+
+    def ingest(self, source_path, sha256):
+        """Move a staged file into place, or drop it if the blob already exists."""
+        if self.exists(sha256):
+            os.remove(source_path)
+        else:
+            self.storage.put_file(self.key_for(sha256), source_path)
+        return self.path_for(sha256)
+
+    def remove(self, sha256):
+        """Delete a blob; missing blobs are ignored."""
+        self.storage.delete(self.key_for(sha256))
@@ -0,0 +1,295 @@
+import csv
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from werkzeug.utils import secure_filename
+
+from utils import config, passwords
+from utils.auth import iter_users, validate_email, validate_password
+from utils.db import get_pool
+
+FORMATS = ('csv', 'jsonl')
+
+USER_FIELDS = ('email', 'created_at', 'password_hash')
+FILE_FIELDS = ('id', 'email', 'filename', 'file_size', 'upload_date', 'sha256',
+               'page_count', 'title', 'deleted_at')
+
+def detect_format(path, fmt=None):
+    """``csv`` or ``jsonl``, from ``fmt`` or the file extension."""
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format: {fmt} (use csv or jsonl)")
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    raise ValueError(f"Cannot tell the format of {path}; use --format csv or --format jsonl")
+
+def read_records(path, fmt=None):
+    """Yield ``(line_number, record)`` from a CSV file with a header row or JSON lines.
+
+    Records are dicts, or None for a line that is not valid JSON. ``-``
+    reads standard input. Rows are read one at a time.
+    """
+    fmt = detect_format(path, fmt or ('jsonl' if path == '-' else None))
+    f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+class RecordWriter:
+    """Writes dict rows as CSV or JSON lines, one at a time."""
+
+    def __init__(self, f, fields, fmt):
+        self.f = f
+        self.fields = fields
+        self.fmt = fmt
+        if fmt == 'csv':
+            self._writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            self._writer.writeheader()
+
+    def write(self, row):
+        record = dict(zip(self.fields, row))
+        if self.fmt == 'csv':
+            self._writer.writerow(record)
+        else:
+            self.f.write(json.dumps(record) + '\n')
+
+def chunked(iterable, size):
+    """Lists of up to ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _existing_emails(conn, emails):
+    # One bound parameter however large the chunk
+    return {row[0] for row in conn.execute(
+        'SELECT email FROM users WHERE email IN (SELECT value FROM json_each(?))',
+        (json.dumps(list(emails)),)
+    )}
+
+def export_users(f, fmt, with_hashes=False):
+    """Stream every user to ``f``; returns the count.
+
+    Password hashes are only included with ``with_hashes``, for moving
+    accounts to another host with UserImporter.
+    """
+    fields = USER_FIELDS if with_hashes else USER_FIELDS[:2]
+    writer = RecordWriter(f, fields, fmt)
+    count = 0
+    for row in iter_users(with_hashes=with_hashes):
+        writer.write(row)
+        count += 1
+    return count
+
+def export_files(f, fmt, include_deleted=False):
+    """Stream file metadata (not contents) to ``f``; returns the count."""
+    writer = RecordWriter(f, FILE_FIELDS, fmt)
+    count = 0
+    where = '' if include_deleted else 'WHERE deleted_at IS NULL'
+    with get_pool(config.DATABASE_PATH).connection() as conn:
+        for row in conn.execute(f'''
+            SELECT id, user_email, filename, file_size, upload_date, blob_sha256,
+                   page_count, title, deleted_at
+            FROM files {where} ORDER BY id
+        '''):
+            writer.write(row)
+            count += 1
+    return count
+
+class UserImporter:
+    """Creates users from ``(line, record)`` pairs in chunked transactions.
+
+    A record has ``email`` and either ``password`` (hashed here, in
+    parallel) or ``password_hash`` (e.g. from ``export_users``), and
+    optionally ``created_at``. Existing users are left untouched, so an
+    interrupted import can simply be run again.
+    """
+
+    def __init__(self, batch_size=None, workers=None, on_error=None):
+        self.batch_size = batch_size or 1000
+        self.workers = workers or os.cpu_count() or 1
+        self.on_error = on_error or (lambda line, message: None)
+        self.pool = get_pool(config.USERS_DATABASE_PATH)
+        self.counts = {'read': 0, 'created': 0, 'existing': 0, 'invalid': 0}
+
+    def run(self, records, progress=None):
+        # hashlib's KDFs release the GIL, so threads hash in parallel
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import-kdf') as executor:
+            for chunk in chunked(records, self.batch_size):
+                self._import_chunk(chunk, executor)
+                if progress:
+                    progress(self.counts)
+        return self.counts
+
+    def _invalid(self, line, message):
+        self.counts['invalid'] += 1
+        self.on_error(line, message)
+
+    def _validate(self, line, record):
+        """``(email, password, password_hash, created_at)``, or None after reporting."""
+        if record is None:
+            self._invalid(line, "Not a JSON object")
+            return None
+        email = (record.get('email') or '').strip()
+        if not validate_email(email):
+            self._invalid(line, f"Invalid email format: {email!r}")
+            return None
+        password = record.get('password') or None
+        password_hash = record.get('password_hash') or None
+        if password is not None:
+            valid, message = validate_password(password)
+            if not valid:
+                self._invalid(line, f"{email}: {message}")
+                return None
+        elif password_hash is not None:
+            if not passwords.is_supported_hash(password_hash):
+                self._invalid(line, f"{email}: Unsupported password hash format")
+                return None
+        else:
+            self._invalid(line, f"{email}: No password or password_hash")
+            return None
+        return email, password, password_hash, record.get('created_at') or None
+
+    def _import_chunk(self, chunk, executor):
+        self.counts['read'] += len(chunk)
+        users = OrderedDict()
+        for line, record in chunk:
+            user = self._validate(line, record)
+            if user is None:
+                continue
+            if user[0] in users:
+                self._invalid(line, f"{user[0]}: Duplicate email in input")
+                continue
+            users[user[0]] = user
+
+        # Skip existing accounts before spending KDF time on them
+        with self.pool.connection() as conn:
+            existing = _existing_emails(conn, users)
+        for email in existing:
+            del users[email]
+        self.counts['existing'] += len(existing)
+        if not users:
+            return
+
+        plain = [user for user in users.values() if user[1] is not None]
+        hashed = dict(zip((user[0] for user in plain),
+                          executor.map(passwords.hash_password, (user[1] for user in plain))))
+        rows = [(email, hashed.get(email) or password_hash, created_at)
+                for email, _, password_hash, created_at in users.values()]
+
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO users (email, password_hash, created_at)
+                VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ''', rows)
+            created = conn.total_changes - before
+            conn.commit()
+        self.counts['created'] += created
+        # Created by someone else since the check above
+        self.counts['existing'] += len(rows) - created
+
+class FileImporter:
+    """Adds files from ``(line, record)`` pairs, a transaction per user per chunk.
+
+    A record has ``email`` (an existing user), ``path`` (a PDF readable
+    here, which is copied, not moved) and optionally ``filename``. Copying
+    and hashing run on ``workers`` threads. Quotas and duplicate names are
+    checked as for uploads; failures are reported and skipped.
+    """
+
+    def __init__(self, file_manager, batch_size=None, workers=None, on_error=None):
+        self.file_manager = file_manager
+        self.batch_size = batch_size or 100
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.on_error = on_error or (lambda line, message: None)
+        self.counts = {'read': 0, 'added': 0, 'failed': 0}
+
+    def run(self, records, progress=None):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import-files') as executor:
+            for chunk in chunked(records, self.batch_size):
+                self._import_chunk(chunk, executor)
+                if progress:
+                    progress(self.counts)
+        return self.counts
+
+    def _failed(self, line, message):
+        self.counts['failed'] += 1
+        self.on_error(line, message)
+
+    def _stage(self, path):
+        """Copy a source file into the staging area: ``((path, sha256, size), error)``."""
+        try:
+            with open(path, 'rb') as f:
+                return self.file_manager.blobs.write_stream(f), None
+        except OSError as e:
+            return None, str(e)
+
+    def _import_chunk(self, chunk, executor):
+        self.counts['read'] += len(chunk)
+        entries = []  # (line, email, filename, path)
+        for line, record in chunk:
+            if record is None:
+                self._failed(line, "Not a JSON object")
+                continue
+            email = (record.get('email') or '').strip()
+            path = record.get('path') or ''
+            filename = secure_filename(record.get('filename') or os.path.basename(path))
+            if not filename.lower().endswith('.pdf'):
+                self._failed(line, f"{path}: Only PDF files are allowed")
+                continue
+            entries.append((line, email, filename, path))
+
+        with get_pool(config.USERS_DATABASE_PATH).connection() as conn:
+            users = _existing_emails(conn, {entry[1] for entry in entries})
+
+        staged = {}  # user -> [(line, filename, staged_path, sha256)]
+        known = [entry for entry in entries if entry[1] in users]
+        for line, email, _, _ in entries:
+            if email not in users:
+                self._failed(line, f"Unknown user: {email!r}")
+        for (line, email, filename, path), (result, error) in zip(
+                known, executor.map(self._stage, (entry[3] for entry in known))):
+            if result is None:
+                self._failed(line, f"{path}: {error}")
+                continue
+            staged_path, sha256, _ = result
+            staged.setdefault(email, []).append((line, filename, staged_path, sha256))
+
+        for email, files in staged.items():
+            outcomes = self.file_manager.add_files(
+                email, [(filename, staged_path, sha256) for _, filename, staged_path, sha256 in files]
+            )
+            for (line, filename, staged_path, _), (success, message, _) in zip(files, outcomes):
+                if success:
+                    self.counts['added'] += 1
+                    continue
+                if os.path.exists(staged_path):
+                    os.remove(staged_path)
+                self._failed(line, f"{email}/{filename}: {message}")
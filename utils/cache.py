@@ -0,0 +1,182 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from utils import config
+from utils.db import get_pool
+
+def estimate_size(value):
+    """Rough memory footprint of a cached value in bytes."""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class LRUCache:
+    """Thread-safe LRU cache with a TTL and a memory budget in bytes."""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = estimate_size(key) + estimate_size(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[1]
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+class LocalVersions:
+    """Per-user change counters kept in this process only."""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_email):
+        return self._versions.get(user_email, 0)
+
+    def bump(self, user_email):
+        with self._lock:
+            version = self._versions[user_email] = self._versions.get(user_email, 0) + 1
+        return version
+
+class SQLiteVersions:
+    """Per-user change counters in a small SQLite file shared by all workers.
+
+    A bump in one gunicorn worker is seen by the next lookup in every other
+    worker, so cached entries keyed on the old version stop being used.
+    """
+
+    def __init__(self, db_path):
+        self.pool = get_pool(db_path)
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_versions (
+                    user_email TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+
+    def get(self, user_email):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT version FROM cache_versions WHERE user_email = ?', (user_email,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user_email):
+        with self.pool.connection() as conn:
+            version = conn.execute('''
+                INSERT INTO cache_versions (user_email, version) VALUES (?, 1)
+                ON CONFLICT (user_email) DO UPDATE SET version = version + 1
+                RETURNING version
+            ''', (user_email,)).fetchone()[0]
+            conn.commit()
+        return version
+
+class ListingCache:
+    """Caches per-user listing and search results.
+
+    Keys include the user's current version, so ``invalidate`` is a single
+    counter bump; stale entries are never read again and age out of the LRU.
+    """
+
+    def __init__(self, max_bytes=None, ttl=None, backend=None, enabled=None):
+        self.enabled = config.CACHE_ENABLED if enabled is None else enabled
+        self.lru = LRUCache(
+            config.CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+            config.CACHE_TTL if ttl is None else ttl
+        )
+        backend = backend or config.CACHE_BACKEND
+        if backend == 'sqlite':
+            self.versions = SQLiteVersions(config.CACHE_DB_PATH)
+        elif backend == 'local':
+            self.versions = LocalVersions()
+        else:
+            raise ValueError(f"Unknown cache backend: {backend}")
+        self.backend = backend
+
+    def get_or_load(self, user_email, kind, params, loader):
+        """Return a cached result or compute and store it."""
+        if not self.enabled:
+            return loader()
+        key = (user_email, self.versions.get(user_email), kind, params)
+        value = self.lru.get(key)
+        if value is None:
+            value = loader()
+            self.lru.set(key, value)
+        return value
+
+    def invalidate(self, user_email):
+        """Bump the user's version and return it.
+
+        Versions are kept even with the cache disabled, since other
+        per-user state (the filename index) is checked against them.
+        """
+        return self.versions.bump(user_email)
+
+    def stats(self):
+        stats = self.lru.stats()
+        stats['enabled'] = self.enabled
+        stats['backend'] = self.backend
+        return stats
@@ -0,0 +1,194 @@
+import os
+import sys
+
+def _env_int(name, default):
+    """Read an integer setting from the environment."""
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return int(value)
+
+def gunicorn_workers(environ=None, argv=None):
+    """Worker processes gunicorn was configured with (1 if it cannot tell).
+
+    Looks where gunicorn does: ``-w``/``--workers`` on its command line,
+    then in ``GUNICORN_CMD_ARGS``, then ``WEB_CONCURRENCY``.
+    """
+    environ = os.environ if environ is None else environ
+    argv = sys.argv if argv is None else argv
+    sources = [environ.get('GUNICORN_CMD_ARGS', '').split()]
+    if argv and os.path.basename(argv[0]).startswith('gunicorn'):
+        sources.insert(0, argv[1:])
+    for args in sources:
+        for i, arg in enumerate(args):
+            if arg in ('-w', '--workers') and i + 1 < len(args):
+                value = args[i + 1]
+            elif arg.startswith('--workers='):
+                value = arg.split('=', 1)[1]
+            elif arg.startswith('-w') and arg[2:].isdigit():
+                value = arg[2:]
+            else:
+                continue
+            if value.isdigit():
+                return int(value)
+    value = environ.get('WEB_CONCURRENCY', '')
+    return int(value) if value.isdigit() else 1
+
+# LocalDrive runs on a single host: its databases are SQLite files, and
+# SQLite's locking is not reliable on network filesystems, so several hosts
+# writing one database can corrupt it. LOCALDRIVE_MULTI_NODE=1 is refused at
+# startup (see README, "Sessions and deployment").
+MULTI_NODE = os.environ.get('LOCALDRIVE_MULTI_NODE', '0') not in ('0', 'false', 'no')
+
+# Database files (on a local disk, never a network share)
+DATABASE_PATH = os.environ.get('LOCALDRIVE_DATABASE', 'database.db')
+USERS_DATABASE_PATH = os.environ.get('LOCALDRIVE_USERS_DATABASE', 'users.db')
+
+# SQLite connection tuning (applied to every pooled connection)
+SQLITE_JOURNAL_MODE = os.environ.get('LOCALDRIVE_SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('LOCALDRIVE_SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE = _env_int('LOCALDRIVE_SQLITE_CACHE_SIZE', -16000)  # negative = KiB
+SQLITE_MMAP_SIZE = _env_int('LOCALDRIVE_SQLITE_MMAP_SIZE', 64 * 1024 * 1024)
+SQLITE_BUSY_TIMEOUT_MS = _env_int('LOCALDRIVE_SQLITE_BUSY_TIMEOUT_MS', 5000)
+SQLITE_STATEMENT_CACHE = _env_int('LOCALDRIVE_SQLITE_STATEMENT_CACHE', 256)
+
+# Sessions: 'sqlite' (server-side, in the users database), 'redis',
+# 'memory' (one process only, for tests) or 'cookie' (signed cookie, cannot
+# be revoked). The secret key signs cookies and flashes; without
+# LOCALDRIVE_SECRET_KEY one is generated once into SECRET_KEY_FILE.
+SESSION_BACKEND = os.environ.get('LOCALDRIVE_SESSION_BACKEND', 'sqlite')
+SESSION_REDIS_URL = os.environ.get('LOCALDRIVE_SESSION_REDIS_URL', 'redis://localhost:6379/0')
+SESSION_LIFETIME = _env_int('LOCALDRIVE_SESSION_LIFETIME', 14 * 24 * 60 * 60)  # idle seconds
+SESSION_REFRESH_INTERVAL = _env_int('LOCALDRIVE_SESSION_REFRESH_INTERVAL', 60 * 60)
+SESSION_COOKIE_SECURE = os.environ.get('LOCALDRIVE_SESSION_COOKIE_SECURE', '0') not in ('0', 'false', 'no')
+SECRET_KEY = os.environ.get('LOCALDRIVE_SECRET_KEY', '')
+SECRET_KEY_FILE = os.environ.get('LOCALDRIVE_SECRET_KEY_FILE', '.secret_key')
+
+# Password hashing ('scrypt' or 'pbkdf2-sha256'); tune the cost with
+# `python db_manager.py kdf-bench`. Existing hashes are upgraded on login.
+PASSWORD_SCHEME = os.environ.get('LOCALDRIVE_PASSWORD_SCHEME', 'scrypt')
+SCRYPT_N = _env_int('LOCALDRIVE_SCRYPT_N', 2 ** 14)
+SCRYPT_R = _env_int('LOCALDRIVE_SCRYPT_R', 8)
+SCRYPT_P = _env_int('LOCALDRIVE_SCRYPT_P', 1)
+PBKDF2_ITERATIONS = _env_int('LOCALDRIVE_PBKDF2_ITERATIONS', 600000)
+# Concurrent hashes per process, how many may wait, and for how long
+KDF_WORKERS = _env_int('LOCALDRIVE_KDF_WORKERS', max(1, min(4, os.cpu_count() or 1)))
+KDF_MAX_QUEUE = _env_int('LOCALDRIVE_KDF_MAX_QUEUE', 16)
+KDF_TIMEOUT_MS = _env_int('LOCALDRIVE_KDF_TIMEOUT_MS', 2000)
+
+# File storage and uploads
+UPLOAD_FOLDER = os.environ.get('LOCALDRIVE_UPLOAD_FOLDER', 'uploads')
+MAX_FILE_SIZE = _env_int('LOCALDRIVE_MAX_FILE_SIZE', 16 * 1024 * 1024)  # single-request uploads
+MAX_BATCH_UPLOAD_SIZE = _env_int('LOCALDRIVE_MAX_BATCH_UPLOAD_SIZE', 256 * 1024 * 1024)
+MAX_BATCH_FILES = _env_int('LOCALDRIVE_MAX_BATCH_FILES', 500)
+
+# Upload admission control (per process): uploads beyond these limits, or
+# that would leave less than UPLOAD_MIN_FREE_BYTES free on the upload disk
+# (0: only uploads that do not fit), are refused with 429/507 and
+# Retry-After before their body is read
+UPLOAD_MAX_CONCURRENT = _env_int('LOCALDRIVE_UPLOAD_MAX_CONCURRENT', 8)
+UPLOAD_MAX_PER_USER = _env_int('LOCALDRIVE_UPLOAD_MAX_PER_USER', 3)
+UPLOAD_QUEUE_TIMEOUT_MS = _env_int('LOCALDRIVE_UPLOAD_QUEUE_TIMEOUT_MS', 1000)  # wait for a free slot
+UPLOAD_MIN_FREE_BYTES = _env_int('LOCALDRIVE_UPLOAD_MIN_FREE_BYTES', 0)
+UPLOAD_RETRY_AFTER = _env_int('LOCALDRIVE_UPLOAD_RETRY_AFTER', 5)  # seconds
+
+# Chunked (resumable) uploads
+CHUNK_BUFFER_SIZE = _env_int('LOCALDRIVE_CHUNK_BUFFER_SIZE', 64 * 1024)
+MAX_CHUNK_SIZE = _env_int('LOCALDRIVE_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+MAX_UPLOAD_SIZE = _env_int('LOCALDRIVE_MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024)
+STALE_UPLOAD_SECONDS = _env_int('LOCALDRIVE_STALE_UPLOAD_SECONDS', 24 * 60 * 60)
+BLOB_FOLDER = os.environ.get('LOCALDRIVE_BLOB_FOLDER', os.path.join(UPLOAD_FOLDER, 'blobs'))
+
+# Blob storage backend: 'local' keeps blobs under BLOB_FOLDER; 's3' stores
+# them in an S3-compatible bucket (requires boto3). Uploads are staged under
+# BLOB_FOLDER/.tmp either way.
+STORAGE_BACKEND = os.environ.get('LOCALDRIVE_STORAGE_BACKEND', 'local')
+S3_BUCKET = os.environ.get('LOCALDRIVE_S3_BUCKET', '')
+S3_PREFIX = os.environ.get('LOCALDRIVE_S3_PREFIX', 'blobs/')
+S3_ENDPOINT_URL = os.environ.get('LOCALDRIVE_S3_ENDPOINT_URL') or None  # MinIO, moto server, ...
+S3_REGION = os.environ.get('LOCALDRIVE_S3_REGION') or None
+S3_PART_SIZE = _env_int('LOCALDRIVE_S3_PART_SIZE', 8 * 1024 * 1024)  # multipart chunk, >= 5 MB
+
+# Storage quotas: defaults for users without their own limits (0 = unlimited);
+# set per-user limits with `python db_manager.py quota`
+DEFAULT_QUOTA_BYTES = _env_int('LOCALDRIVE_DEFAULT_QUOTA_BYTES', 0)
+DEFAULT_QUOTA_FILES = _env_int('LOCALDRIVE_DEFAULT_QUOTA_FILES', 0)
+
+# Trash: deleted files are purged by a background thread in each process
+# (or `python db_manager.py purge`) once they are older than the retention
+TRASH_RETENTION_DAYS = _env_int('LOCALDRIVE_TRASH_RETENTION_DAYS', 30)
+PURGE_INTERVAL = _env_int('LOCALDRIVE_PURGE_INTERVAL', 3600)  # seconds; 0 disables
+PURGE_BATCH_SIZE = _env_int('LOCALDRIVE_PURGE_BATCH_SIZE', 200)
+
+# Storage consistency checks (`python db_manager.py fsck`)
+FSCK_WORKERS = _env_int('LOCALDRIVE_FSCK_WORKERS', 8)  # threads for stat/hash
+FSCK_BATCH_SIZE = _env_int('LOCALDRIVE_FSCK_BATCH_SIZE', 1000)
+FSCK_STATE_PATH = os.environ.get('LOCALDRIVE_FSCK_STATE', os.path.join(UPLOAD_FOLDER, '.fsck-state.json'))
+
+# Full-text search
+SEARCH_WORKERS = _env_int('LOCALDRIVE_SEARCH_WORKERS', 2)
+SEARCH_MAX_CHARS = _env_int('LOCALDRIVE_SEARCH_MAX_CHARS', 200000)  # text indexed per document
+SEARCH_RESULT_LIMIT = _env_int('LOCALDRIVE_SEARCH_RESULT_LIMIT', 50)
+SEARCH_EXTRACT_ON_ADD = os.environ.get('LOCALDRIVE_SEARCH_EXTRACT_ON_ADD', '1') not in ('0', 'false', 'no')
+
+# PDF metadata and first-page thumbnails, produced in a process pool after
+# upload. Thumbnails need PyMuPDF (pip install pymupdf) or poppler's pdftoppm;
+# without either only page count, title and author are extracted.
+DOCUMENT_WORKERS = _env_int('LOCALDRIVE_DOCUMENT_WORKERS', 2)
+DOCUMENT_PROCESS_ON_ADD = os.environ.get('LOCALDRIVE_DOCUMENT_PROCESS_ON_ADD', '1') not in ('0', 'false', 'no')
+THUMBNAIL_RENDERER = os.environ.get('LOCALDRIVE_THUMBNAIL_RENDERER', 'auto')  # auto, pymupdf, pdftoppm, none
+THUMBNAIL_FOLDER = os.environ.get('LOCALDRIVE_THUMBNAIL_FOLDER', os.path.join(UPLOAD_FOLDER, 'thumbnails'))
+THUMBNAIL_WIDTH = _env_int('LOCALDRIVE_THUMBNAIL_WIDTH', 128)  # pixels
+THUMBNAIL_CACHE_MAX_BYTES = _env_int('LOCALDRIVE_THUMBNAIL_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+THUMBNAIL_MAX_AGE = _env_int('LOCALDRIVE_THUMBNAIL_MAX_AGE', 7 * 24 * 60 * 60)  # browser cache, seconds
+THUMBNAIL_RETRY_AFTER = _env_int('LOCALDRIVE_THUMBNAIL_RETRY_AFTER', 24 * 60 * 60)  # after a failed render, seconds
+
+# Typo-tolerant filename suggestions (in-memory trigram index per user)
+FUZZY_MAX_USERS = _env_int('LOCALDRIVE_FUZZY_MAX_USERS', 256)  # indexes kept per process
+AUTOCOMPLETE_LIMIT = _env_int('LOCALDRIVE_AUTOCOMPLETE_LIMIT', 8)
+AUTOCOMPLETE_MAX_LIMIT = _env_int('LOCALDRIVE_AUTOCOMPLETE_MAX_LIMIT', 20)
+
+# File listings
+LIST_PAGE_SIZE = _env_int('LOCALDRIVE_LIST_PAGE_SIZE', 50)
+LIST_MAX_PAGE_SIZE = _env_int('LOCALDRIVE_LIST_MAX_PAGE_SIZE', 200)
+
+# Live listing updates (`/changes?since=N`)
+CHANGES_LIMIT = _env_int('LOCALDRIVE_CHANGES_LIMIT', 500)  # changes per response
+CHANGES_RETENTION_HOURS = _env_int('LOCALDRIVE_CHANGES_RETENTION_HOURS', 24)
+CHANGES_POLL_INTERVAL = _env_int('LOCALDRIVE_CHANGES_POLL_INTERVAL', 15)  # seconds; 0 disables polling
+
+# File serving
+FILE_CACHE_CONTROL = os.environ.get('LOCALDRIVE_FILE_CACHE_CONTROL', 'private, max-age=0, must-revalidate')
+# 'direct' streams from Python; 'x-accel' (nginx) and 'x-sendfile' (Apache,
+# lighttpd) hand the transfer to the reverse proxy after authorization
+FILE_SERVE_MODE = os.environ.get('LOCALDRIVE_FILE_SERVE_MODE', 'direct').lower()
+# Internal nginx location that aliases UPLOAD_FOLDER (x-accel mode)
+ACCEL_REDIRECT_PREFIX = os.environ.get('LOCALDRIVE_ACCEL_REDIRECT_PREFIX', '/_protected/')
+MAX_ZIP_FILES = _env_int('LOCALDRIVE_MAX_ZIP_FILES', 10000)  # explicit selections only
+
+# Static assets: `python build_assets.py` writes fingerprinted, precompressed
+# copies of static/css and static/js here, served from /assets/
+ASSET_FOLDER = os.environ.get('LOCALDRIVE_ASSET_FOLDER', os.path.join('static', 'dist'))
+ASSET_CACHE_CONTROL = os.environ.get('LOCALDRIVE_ASSET_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+
+# Per-user listing/search result cache
+CACHE_ENABLED = os.environ.get('LOCALDRIVE_CACHE_ENABLED', '1') not in ('0', 'false', 'no')
+CACHE_MAX_BYTES = _env_int('LOCALDRIVE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+CACHE_TTL = _env_int('LOCALDRIVE_CACHE_TTL', 300)
+# 'local' keeps invalidation counters per process; 'sqlite' shares them
+# between gunicorn workers through CACHE_DB_PATH, and is the default as soon
+# as more than one worker is configured
+CACHE_BACKEND = os.environ.get('LOCALDRIVE_CACHE_BACKEND', 'sqlite' if gunicorn_workers() > 1 else 'local')
+CACHE_DB_PATH = os.environ.get('LOCALDRIVE_CACHE_DB', 'cache.db')
+
+# Metrics (/metrics, Prometheus text format)
+METRICS_ENABLED = os.environ.get('LOCALDRIVE_METRICS_ENABLED', '1') not in ('0', 'false', 'no')
+# Shared directory for per-process snapshots, so any gunicorn worker reports
+# totals for all of them; defaults to one under UPLOAD_FOLDER as soon as more
+# than one worker is configured ('' keeps metrics per process)
+METRICS_DIR = os.environ.get('LOCALDRIVE_METRICS_DIR',
+                             os.path.join(UPLOAD_FOLDER, '.metrics') if gunicorn_workers() > 1 else '')
+METRICS_FLUSH_INTERVAL = _env_int('LOCALDRIVE_METRICS_FLUSH_INTERVAL', 1)  # seconds
+# Opt-in slow logs; 0 disables
+SLOW_QUERY_MS = _env_int('LOCALDRIVE_SLOW_QUERY_MS', 0)
+SLOW_REQUEST_MS = _env_int('LOCALDRIVE_SLOW_REQUEST_MS', 0)
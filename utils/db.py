@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import config
+from utils.metrics import TimedConnection
+
+class ConnectionPool:
+    """Thread-local pool of SQLite connections for a single database file.
+
+    Each thread keeps one open connection and reuses it for every request it
+    serves, so the connect/pragma cost is paid once per thread instead of once
+    per query. Connections are reopened after a fork (gunicorn --preload).
+    """
+
+    def __init__(self, db_path, journal_mode=None, synchronous=None,
+                 cache_size=None, mmap_size=None, busy_timeout_ms=None,
+                 statement_cache=None):
+        self.db_path = db_path
+        self.journal_mode = journal_mode or config.SQLITE_JOURNAL_MODE
+        self.synchronous = synchronous or config.SQLITE_SYNCHRONOUS
+        self.cache_size = config.SQLITE_CACHE_SIZE if cache_size is None else cache_size
+        self.mmap_size = config.SQLITE_MMAP_SIZE if mmap_size is None else mmap_size
+        self.busy_timeout_ms = (config.SQLITE_BUSY_TIMEOUT_MS
+                                if busy_timeout_ms is None else busy_timeout_ms)
+        self.statement_cache = (config.SQLITE_STATEMENT_CACHE
+                                if statement_cache is None else statement_cache)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._connections = set()
+        self._opened = 0
+        self._closed = 0
+        self._checkouts = 0
+        self._in_use = 0
+        self._errors = 0
+
+    def _open(self):
+        """Open and configure a new connection."""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            cached_statements=self.statement_cache,
+            check_same_thread=False,
+            factory=TimedConnection if config.METRICS_ENABLED else sqlite3.Connection
+        )
+        if config.METRICS_ENABLED:
+            conn.metrics_db = os.path.basename(self.db_path)
+        conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA cache_size={int(self.cache_size)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        with self._lock:
+            self._connections.add(conn)
+            self._opened += 1
+        return conn
+
+    def _reset_after_fork(self):
+        """Drop connections inherited from a parent process."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._connections = set()
+            self._in_use = 0
+
+    @contextmanager
+    def connection(self):
+        """Borrow this thread's connection.
+
+        Nested use within one thread shares the same connection; any
+        transaction left open by the outermost block is rolled back.
+        """
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = self._open()
+            local.depth = 0
+
+        local.depth += 1
+        with self._lock:
+            self._checkouts += 1
+            if local.depth == 1:
+                self._in_use += 1
+        try:
+            yield conn
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            local.depth -= 1
+            if local.depth == 0:
+                with self._lock:
+                    self._in_use -= 1
+                if conn.in_transaction:
+                    conn.rollback()
+
+    def close_all(self):
+        """Close every connection opened by this process."""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections = set()
+            self._closed += len(connections)
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def backup(self, dest_path, pages=4096, progress=None):
+        """Snapshot the database to ``dest_path`` with SQLite's online backup API.
+
+        Copies ``pages`` pages per step so other connections can keep
+        writing in between; the copy is consistent as of the end of the
+        backup. It is written to a temporary name and renamed into place
+        when complete. Returns the size of the copy in bytes.
+        """
+        temp_path = dest_path + '.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        target = sqlite3.connect(temp_path)
+        try:
+            with self.connection() as conn:
+                conn.backup(target, pages=pages, progress=progress)
+        except Exception:
+            target.close()
+            os.remove(temp_path)
+            raise
+        target.close()
+        os.replace(temp_path, dest_path)
+        return os.path.getsize(dest_path)
+
+    def stats(self):
+        """Return pool usage counters for health checks."""
+        with self._lock:
+            return {
+                'db_path': self.db_path,
+                'pid': self._pid,
+                'open_connections': len(self._connections),
+                'in_use': self._in_use,
+                'opened': self._opened,
+                'closed': self._closed,
+                'checkouts': self._checkouts,
+                'errors': self._errors,
+                'journal_mode': self.journal_mode,
+                'synchronous': self.synchronous,
+                'cache_size': self.cache_size,
+                'mmap_size': self.mmap_size,
+                'statement_cache': self.statement_cache,
+            }
+
+    def health(self):
+        """Run a trivial query and report latency alongside pool stats."""
+        stats = self.stats()
+        start = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                conn.execute('SELECT 1').fetchone()
+            stats['ok'] = True
+        except sqlite3.Error as e:
+            stats['ok'] = False
+            stats['error'] = str(e)
+        stats['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return stats
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path):
+    """Get the shared pool for a database file, creating it on first use."""
+    key = os.path.abspath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(db_path)
+    return pool
+
+def all_pools():
+    """Return every pool created in this process."""
+    with _pools_lock:
+        return list(_pools.values())
+
+def pool_health():
+    """Health summary for every known database."""
+    databases = [pool.health() for pool in all_pools()]
+    return {
+        'ok': all(db['ok'] for db in databases),
+        'databases': databases,
+    }
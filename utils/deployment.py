@@ -0,0 +1,65 @@
+import os
+import secrets
+
+from utils import config
+
+def load_secret_key(path=None):
+    """The Flask secret key: from the environment, or a generated key file.
+
+    A new key is written to a temporary file and hard-linked into place,
+    which fails if the file already exists, so gunicorn workers starting
+    together all end up reading the same, complete key.
+    """
+    if config.SECRET_KEY:
+        return config.SECRET_KEY
+    path = path or config.SECRET_KEY_FILE
+    try:
+        with open(path) as f:
+            key = f.read().strip()
+        if key:
+            return key
+        raise RuntimeError(f"Secret key file {path} is empty")
+    except FileNotFoundError:
+        pass
+
+    key = secrets.token_hex(32)
+    temp_path = f'{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp'
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(key)
+            f.flush()
+            os.fsync(f.fileno())
+        os.link(temp_path, path)
+    except FileExistsError:
+        # Another process won the race; its key is complete once linked
+        with open(path) as f:
+            key = f.read().strip()
+    finally:
+        os.remove(temp_path)
+    return key
+
+def check_deployment():
+    """Settings the app refuses to start with.
+
+    Returns a list of problems (empty when the configuration is usable).
+    """
+    problems = []
+    if config.MULTI_NODE:
+        # Every database is an SQLite file; sharing one between hosts over
+        # NFS/SMB breaks its locking and can corrupt it under concurrent writes
+        problems.append("LOCALDRIVE_MULTI_NODE is not supported: the databases are SQLite files, "
+                        "which must not be written by several hosts over a network filesystem. "
+                        "Run a single host (with as many gunicorn workers as needed) and unset it.")
+    return problems
+
+def deployment_info():
+    """Summary for the health check."""
+    return {
+        'multi_node': config.MULTI_NODE,
+        'session_backend': config.SESSION_BACKEND,
+        'cache_backend': config.CACHE_BACKEND,
+        'workers': config.gunicorn_workers(),
+        'storage_backend': config.STORAGE_BACKEND,
+        'journal_mode': config.SQLITE_JOURNAL_MODE,
+    }
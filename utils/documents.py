@@ -0,0 +1,357 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils import config
+
+RENDERERS = ('auto', 'pymupdf', 'pdftoppm', 'none')
+
+def find_renderer(name=None):
+    """The thumbnail renderer to use, or None if none is available.
+
+    ``auto`` prefers PyMuPDF (``pip install pymupdf``) and falls back to
+    poppler's ``pdftoppm`` binary.
+    """
+    name = name or config.THUMBNAIL_RENDERER
+    if name not in RENDERERS:
+        raise ValueError(f"Unknown thumbnail renderer: {name}")
+    if name in ('auto', 'pymupdf'):
+        try:
+            import fitz  # noqa: F401
+            return 'pymupdf'
+        except ImportError:
+            if name == 'pymupdf':
+                raise RuntimeError("The pymupdf thumbnail renderer requires PyMuPDF (pip install pymupdf)")
+    if name in ('auto', 'pdftoppm') and shutil.which('pdftoppm'):
+        return 'pdftoppm'
+    if name == 'pdftoppm':
+        raise RuntimeError("The pdftoppm thumbnail renderer requires poppler-utils")
+    return None
+
+def read_pdf_metadata(path):
+    """Page count, title and author of a PDF.
+
+    An unreadable document gets a page count of 0, so it is not picked up
+    again by every backfill.
+    """
+    metadata = {'page_count': 0, 'title': None, 'author': None}
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return metadata
+    try:
+        reader = PdfReader(path)
+        metadata['page_count'] = len(reader.pages)
+        info = reader.metadata
+        if info is not None:
+            metadata['title'] = (info.title or '').strip()[:500] or None
+            metadata['author'] = (info.author or '').strip()[:500] or None
+    except Exception:
+        pass
+    return metadata
+
+def render_thumbnail(path, width, renderer):
+    """PNG bytes of the first page scaled to ``width`` pixels, or None."""
+    try:
+        if renderer == 'pymupdf':
+            import fitz
+            with fitz.open(path) as doc:
+                if doc.page_count == 0:
+                    return None
+                page = doc[0]
+                zoom = width / page.rect.width
+                return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False).tobytes('png')
+        if renderer == 'pdftoppm':
+            with tempfile.TemporaryDirectory() as temp_dir:
+                root = os.path.join(temp_dir, 'page')
+                subprocess.run(
+                    ['pdftoppm', '-png', '-f', '1', '-l', '1', '-singlefile',
+                     '-scale-to-x', str(width), '-scale-to-y', '-1', path, root],
+                    check=True, capture_output=True, timeout=60
+                )
+                with open(root + '.png', 'rb') as f:
+                    return f.read()
+    except Exception:
+        return None
+    return None
+
+def process_document(file_path, storage_key=None, width=None, renderer=None):
+    """Metadata and first-page thumbnail of a stored PDF (worker process).
+
+    Returns ``(metadata, png_bytes_or_None)``; the blob is fetched from the
+    configured storage backend when ``storage_key`` is given.
+    """
+    width = width or config.THUMBNAIL_WIDTH
+    if storage_key is None:
+        return read_pdf_metadata(file_path), render_thumbnail(file_path, width, renderer)
+    from utils.storage import get_storage
+    try:
+        with get_storage().local_copy(storage_key) as path:
+            return read_pdf_metadata(path), render_thumbnail(path, width, renderer)
+    except Exception:
+        return read_pdf_metadata(None), None
+
+class ThumbnailCache:
+    """Content-keyed thumbnails on local disk with a size budget.
+
+    Files are named after the blob digest, so identical uploads share one
+    thumbnail and an entry never goes stale. Hits refresh the file's mtime
+    (at most once a day); when the cache grows past ``max_bytes`` the
+    least recently used files are removed down to 90% of the budget.
+
+    A document that cannot be rendered (encrypted, damaged, renderer error)
+    leaves an empty ``.failed`` marker instead, shared by every worker, so
+    it is not rendered again until ``retry_after`` seconds have passed.
+    """
+
+    def __init__(self, root=None, max_bytes=None, width=None, retry_after=None):
+        self.root = root or config.THUMBNAIL_FOLDER
+        self.max_bytes = config.THUMBNAIL_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.width = width or config.THUMBNAIL_WIDTH
+        self.retry_after = config.THUMBNAIL_RETRY_AFTER if retry_after is None else retry_after
+        self._bytes = None  # measured on first write
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def key_for(self, sha256):
+        return f'{sha256}-{self.width}'
+
+    def path_for(self, sha256):
+        key = self.key_for(sha256)
+        return os.path.join(self.root, key[:2], key + '.png')
+
+    def get(self, sha256):
+        """Path of a cached thumbnail, or None."""
+        path = self.path_for(sha256)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - mtime > 86400:
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+        return path
+
+    def _failed_path(self, sha256):
+        return self.path_for(sha256)[:-len('.png')] + '.failed'
+
+    def mark_failed(self, sha256):
+        """Remember that a blob could not be rendered."""
+        path = self._failed_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+
+    def failed(self, sha256):
+        """Whether a render of this blob failed within ``retry_after`` seconds."""
+        try:
+            mtime = os.stat(self._failed_path(sha256)).st_mtime
+        except FileNotFoundError:
+            return False
+        if time.time() - mtime < self.retry_after:
+            return True
+        try:
+            os.remove(self._failed_path(sha256))
+        except FileNotFoundError:
+            pass
+        return False
+
+    def put(self, sha256, data):
+        path = self.path_for(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._scan_size()
+            else:
+                self._bytes += len(data)
+            over = self.max_bytes and self._bytes > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def _entries(self):
+        try:
+            shards = os.scandir(self.root)
+        except FileNotFoundError:
+            return
+        with shards:
+            for shard in shards:
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(shard.path) as entries:
+                    for entry in entries:
+                        if entry.name.endswith('.png'):
+                            try:
+                                st = entry.stat()
+                            except FileNotFoundError:
+                                continue
+                            yield entry.path, st.st_size, st.st_mtime
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, target=None):
+        """Remove least recently used thumbnails until under ``target`` bytes."""
+        target = int(self.max_bytes * 0.9) if target is None else target
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._bytes = total
+            self.evictions += removed
+        return removed
+
+    def stats(self):
+        return {
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'width': self.width,
+            'evictions': self.evictions,
+        }
+
+class DocumentProcessor:
+    """Extracts PDF metadata and renders thumbnails after upload.
+
+    Work runs in a process pool, like text extraction, so parsing and
+    rasterizing never block a request. ``on_processed(file_id, metadata)``
+    is called with the results once the thumbnail is in the cache.
+    """
+
+    def __init__(self, locate, on_processed=None, cache=None, workers=None, renderer=None):
+        # Maps a row's (file_path, blob_sha256) to process_document arguments
+        self.locate = locate
+        self.on_processed = on_processed
+        self.cache = cache or ThumbnailCache()
+        self.workers = workers or config.DOCUMENT_WORKERS
+        self.renderer = find_renderer(renderer)
+        # Bulk loaders turn this off and run a backfill afterwards
+        self.process_on_add = config.DOCUMENT_PROCESS_ON_ADD
+        self._pending = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so each gunicorn worker gets its own pool after fork
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _submit(self, file_path, sha256):
+        args = (*self.locate(file_path, sha256), self.cache.width, self.renderer)
+        try:
+            return self._get_executor().submit(process_document, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._reset_executor()
+            return self._get_executor().submit(process_document, *args)
+
+    def schedule(self, file_id, file_path, sha256, force=False):
+        """Process a document in the background (once at a time per file)."""
+        if not (self.process_on_add or force):
+            return None
+        with self._lock:
+            if file_id in self._pending:
+                return None
+            self._pending.add(file_id)
+        try:
+            future = self._submit(file_path, sha256)
+        except Exception:
+            with self._lock:
+                self._pending.discard(file_id)
+            raise
+        future.add_done_callback(lambda f: self._store(file_id, sha256, f))
+        return future
+
+    def _keep_thumbnail(self, sha256, thumbnail):
+        if not sha256 or self.renderer is None:
+            return
+        if thumbnail:
+            self.cache.put(sha256, thumbnail)
+        else:
+            self.cache.mark_failed(sha256)
+
+    def _store(self, file_id, sha256, future):
+        try:
+            metadata, thumbnail = future.result()
+            self._keep_thumbnail(sha256, thumbnail)
+            if self.on_processed:
+                self.on_processed(file_id, metadata)
+        except Exception as e:
+            print(f"Error processing file {file_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(file_id)
+
+    def thumbnail(self, sha256):
+        """Path of a file's cached thumbnail, or None."""
+        if not sha256 or self.renderer is None:
+            return None
+        return self.cache.get(sha256)
+
+    def can_render(self, sha256):
+        """Whether rendering a missing thumbnail is worth queueing."""
+        return bool(sha256) and self.renderer is not None and not self.cache.failed(sha256)
+
+    def backfill(self, rows):
+        """Process ``(id, file_path, blob_sha256, page_count)`` rows in the pool.
+
+        Rows that already have metadata are only re-rendered when their
+        thumbnail is missing (e.g. evicted) and did not recently fail to
+        render. Calls ``on_processed`` for each
+        processed file and returns how many there were.
+        """
+        executor = self._get_executor()
+        todo = [
+            row for row in rows
+            if row[3] is None or (self.can_render(row[2]) and self.cache.get(row[2]) is None)
+        ]
+        if not todo:
+            return 0
+        sources = [(*self.locate(row[1], row[2]), self.cache.width, self.renderer) for row in todo]
+        for (file_id, _, sha256, _), result in zip(todo, executor.map(process_document, *zip(*sources))):
+            metadata, thumbnail = result
+            self._keep_thumbnail(sha256, thumbnail)
+            if self.on_processed:
+                self.on_processed(file_id, metadata)
+        return len(todo)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['renderer'] = self.renderer
+        stats['pending'] = len(self._pending)
+        return stats
+
+    def shutdown(self):
+        self._reset_executor()
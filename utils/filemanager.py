@@ -1,77 +1,177 @@
+import base64
+import json
 import sqlite3
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from utils import config
+from utils.blobstore import BlobStore
+from utils.cache import ListingCache
+from utils.db import get_pool
+from utils.documents import DocumentProcessor
+from utils.fuzzy import FilenameSearch
+from utils.migrations import FILES_MIGRATIONS, migrate
+from utils.quotas import QuotaManager
+from utils.search import SearchIndex
+from utils.storage import LocalStorage
+
+DUPLICATE_NAME = "A file with this name already exists"
+
+class BlobRemoving(Exception):
+    """The content being added is a blob whose bytes are being deleted."""
 
 class FileManager:
-    def __init__(self, db_path='database.db'):
-        self.db_path = db_path
+    def __init__(self, db_path=None, blob_store=None, cache=None):
+        self.db_path = db_path or config.DATABASE_PATH
+        self.pool = get_pool(self.db_path)
+        self.blobs = blob_store or BlobStore()
+        # Files stored before the blob store keep their own (cwd-relative) paths
+        self.legacy_storage = LocalStorage('')
+        self.cache = cache or ListingCache()
+        self.search_index = SearchIndex(self.pool, on_indexed=self._text_indexed,
+                                        locate=self._text_source)
+        self.quotas = QuotaManager(self.pool)
+        self.filenames = FilenameSearch(self.pool, self.cache)
+        self.documents = DocumentProcessor(self._text_source, on_processed=self.set_document_info)
         self.init_db()
     
     def init_db(self):
-        """Initialize the files table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_email TEXT NOT NULL,
-                filename TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                upload_date TEXT NOT NULL,
-                file_size INTEGER NOT NULL,
-                FOREIGN KEY (user_email) REFERENCES users (email)
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        """Bring the files schema up to date"""
+        return migrate(self.pool, FILES_MIGRATIONS)
+    
+    def add_file(self, user_email, filename, file_path, sha256=None):
+        """Add a new file to the database.
+
+        ``file_path`` is a staged file that is moved into the blob store on
+        success; on failure it is left for the caller to clean up.
+        """
+        success, message, _ = self.add_files(user_email, [(filename, file_path, sha256)])[0]
+        return success, message
     
-    def add_file(self, user_email, filename, file_path):
-        """Add a new file to the database"""
+    def add_files(self, user_email, files):
+        """Add several staged files in a single transaction.
+
+        ``files`` is a list of ``(filename, file_path, sha256)`` tuples; the
+        digest may be None. Each file gets its own savepoint, so a duplicate
+        name fails only that file. Returns ``(success, message, file_id)`` per
+        input, in order. Staged files of successful entries are moved into
+        the blob store; failed ones are left for the caller to clean up.
+        """
+        results = [None] * len(files)
+        prepared = []
+        for i, (filename, file_path, sha256) in enumerate(files):
+            try:
+                if sha256 is None:
+                    sha256, file_size = self.blobs.hash_file(file_path)
+                else:
+                    file_size = os.path.getsize(file_path)
+                prepared.append((i, filename, file_path, sha256, file_size))
+            except OSError as e:
+                results[i] = (False, f"Error reading file: {str(e)}", None)
+        
+        # Remote transfers happen before the write lock is taken
+        for i, filename, file_path, sha256, file_size in list(prepared):
+            try:
+                self.blobs.upload(file_path, sha256)
+            except Exception as e:
+                prepared.remove((i, filename, file_path, sha256, file_size))
+                results[i] = (False, f"Error storing file: {str(e)}", None)
+        
+        upload_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        added = []
         try:
-            # Get file size
-            file_size = os.path.getsize(file_path)
-            upload_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if file with same name already exists for this user
-            cursor.execute(
-                'SELECT id FROM files WHERE user_email = ? AND filename = ?',
-                (user_email, filename)
-            )
-            
-            if cursor.fetchone():
-                conn.close()
-                return False, "A file with this name already exists"
-            
-            # Insert new file record
-            cursor.execute('''
-                INSERT INTO files (user_email, filename, file_path, upload_date, file_size)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_email, filename, file_path, upload_date, file_size))
-            
-            conn.commit()
-            conn.close()
-            return True, "File added successfully"
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                # Take the write lock up front so ingest and a concurrent
+                # delete of the same blob are serialized
+                cursor.execute('BEGIN IMMEDIATE')
+                
+                for i, filename, file_path, sha256, file_size in prepared:
+                    cursor.execute('SAVEPOINT add_file')
+                    try:
+                        # Checked under the write lock, against counters
+                        # that include this batch's earlier files
+                        allowed, message = self.quotas.check(cursor, user_email, file_size)
+                        if not allowed:
+                            cursor.execute('RELEASE add_file')
+                            results[i] = (False, message, None)
+                            continue
+                        file_id = self._insert_file(
+                            cursor, user_email, filename, sha256, file_size, upload_date
+                        )
+                        self.blobs.ingest(file_path, sha256)
+                        cursor.execute('RELEASE add_file')
+                        results[i] = (True, "File added successfully", file_id)
+                        added.append((file_id, filename, sha256, file_size))
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO add_file')
+                        cursor.execute('RELEASE add_file')
+                        if isinstance(e, sqlite3.IntegrityError):
+                            results[i] = (False, DUPLICATE_NAME, None)
+                        elif isinstance(e, BlobRemoving):
+                            results[i] = (False, str(e), None)
+                        else:
+                            results[i] = (False, f"Database error: {str(e)}", None)
+                
+                conn.commit()
+        
         except Exception as e:
-            return False, f"Database error: {str(e)}"
+            return [
+                result if result and not result[0] else (False, f"Database error: {str(e)}", None)
+                for result in results
+            ]
+        
+        if added:
+            self._changed(user_email, added=[
+                (file_id, filename, upload_date, file_size)
+                for file_id, filename, _, file_size in added
+            ])
+        
+        # Index the document text and render its thumbnail off the request path
+        for file_id, _, sha256, _ in added:
+            self.search_index.schedule_extraction(file_id, *self._text_source(None, sha256))
+            self.documents.schedule(file_id, None, sha256)
+        return results
+    
+    def _insert_file(self, cursor, user_email, filename, sha256, file_size, upload_date):
+        """Insert a file row and take a reference on its blob"""
+        cursor.execute('''
+            INSERT INTO blobs (sha256, size, ref_count, created_at)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (sha256) DO UPDATE SET ref_count = ref_count + 1
+            WHERE ref_count >= 0
+        ''', (sha256, file_size, upload_date))
+        if cursor.rowcount == 0:
+            # Claimed by remove_unreferenced_blobs, which is deleting the bytes
+            raise BlobRemoving("Identical content is being deleted, please try again")
+        
+        # The unique (user_email, filename) index rejects duplicates atomically
+        cursor.execute('''
+            INSERT INTO files (user_email, filename, file_path, upload_date, file_size, blob_sha256)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_email, filename, self.blobs.path_for(sha256), upload_date, file_size, sha256))
+        file_id = cursor.lastrowid
+        self.quotas.charge(cursor, user_email, file_size)
+        self.search_index.add(cursor, file_id, user_email, filename)
+        self._record_change(cursor, user_email, file_id, upload_date)
+        return file_id
     
     def get_user_files(self, user_email):
         """Get all files for a specific user"""
+        def load():
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, filename, upload_date, file_size
+                    FROM files 
+                    WHERE user_email = ? AND deleted_at IS NULL
+                    ORDER BY upload_date DESC
+                ''', (user_email,))
+                
+                return cursor.fetchall()
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, filename, upload_date, file_size
-                FROM files 
-                WHERE user_email = ?
-                ORDER BY upload_date DESC
-            ''', (user_email,))
-            
-            files = cursor.fetchall()
-            conn.close()
+            files = self.cache.get_or_load(user_email, 'all', (), load)
             
             # Convert to list of dictionaries for easier template usage
             file_list = []
@@ -89,82 +189,569 @@ class FileManager:
             print(f"Error getting user files: {e}")
             return []
     
+    # Sort orders for paginated listings: (key column, direction)
+    SORT_ORDERS = {
+        'date_desc': ('upload_date', 'DESC'),
+        'date_asc': ('upload_date', 'ASC'),
+        'name_asc': ('filename', 'ASC'),
+        'name_desc': ('filename', 'DESC'),
+    }
+    
+    def encode_cursor(self, sort, key, file_id):
+        """Opaque keyset cursor pointing just past (key, file_id)"""
+        raw = json.dumps([sort, key, file_id]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+    
+    def decode_cursor(self, cursor, sort):
+        """Decode a cursor; raises ValueError if it is malformed or for another sort"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            cursor_sort, key, file_id = json.loads(base64.urlsafe_b64decode(padded))
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if cursor_sort != sort or not isinstance(file_id, int):
+            raise ValueError("Invalid cursor")
+        return key, file_id
+    
+    def list_files(self, user_email, sort='date_desc', cursor=None, limit=50):
+        """Get one page of a user's files using keyset pagination.
+        
+        Returns ``(file_list, next_cursor)``; ``next_cursor`` is None on the
+        last page. Each page is a single index range scan regardless of how
+        deep into the listing it is. Raises ValueError for a bad sort or cursor.
+        """
+        if sort not in self.SORT_ORDERS:
+            raise ValueError("Invalid sort order")
+        column, direction = self.SORT_ORDERS[sort]
+        comparison = '<' if direction == 'DESC' else '>'
+        
+        params = [user_email]
+        where = 'user_email = ? AND deleted_at IS NULL'
+        if cursor:
+            key, file_id = self.decode_cursor(cursor, sort)
+            where += f' AND ({column}, id) {comparison} (?, ?)'
+            params += [key, file_id]
+        params.append(limit + 1)
+        
+        def load():
+            with self.pool.connection() as conn:
+                return conn.execute(f'''
+                    SELECT id, filename, upload_date, file_size, page_count, title
+                    FROM files
+                    WHERE {where}
+                    ORDER BY {column} {direction}, id {direction}
+                    LIMIT ?
+                ''', params).fetchall()
+        
+        rows = self.cache.get_or_load(user_email, 'page', (sort, cursor, limit), load)
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            key = last[2] if column == 'upload_date' else last[1]
+            next_cursor = self.encode_cursor(sort, key, last[0])
+        
+        file_list = [self._file_record(file_data) for file_data in rows]
+        return file_list, next_cursor
+    
+    def _file_record(self, row):
+        """Listing record of an ``(id, filename, upload_date, file_size, page_count, title)`` row"""
+        return {
+            'id': row[0],
+            'filename': row[1],
+            'upload_date': row[2],
+            'file_size': self.format_file_size(row[3]),
+            'page_count': row[4],
+            'title': row[5]
+        }
+    
+    def _text_indexed(self, file_id):
+        """Extracted text changes search results, so drop the owner's cache"""
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT user_email FROM files WHERE id = ?', (file_id,)).fetchone()
+        if row:
+            self._changed(row[0])
+    
+    def _changed(self, user_email, added=(), removed=()):
+        """Drop the user's cached results and update their filename index.
+
+        ``added`` holds ``(id, filename, upload_date, file_size)`` rows and
+        ``removed`` file ids that left the user's listing.
+        """
+        version = self.cache.invalidate(user_email)
+        self.filenames.changed(user_email, version, added, removed)
+    
+    def storage_for(self, file_path, sha256):
+        """``(storage, key)`` holding a file's bytes"""
+        if sha256:
+            return self.blobs.storage, self.blobs.key_for(sha256)
+        return self.legacy_storage, file_path
+    
+    def _text_source(self, file_path, sha256):
+        """Arguments for text extraction: a local path, or a storage key to fetch"""
+        storage, key = self.storage_for(file_path, sha256)
+        path = storage.local_path(key)
+        return (path, None) if path is not None else (None, key)
+    
     def get_file_info(self, file_id, user_email):
         """Get file information for a specific file and user"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, user_email, filename, file_path, upload_date, file_size
-                FROM files 
-                WHERE id = ? AND user_email = ?
-            ''', (file_id, user_email))
-            
-            file_info = cursor.fetchone()
-            conn.close()
-            return file_info
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, user_email, filename, file_path, upload_date, file_size, blob_sha256
+                    FROM files 
+                    WHERE id = ? AND user_email = ? AND deleted_at IS NULL
+                ''', (file_id, user_email))
+                
+                return cursor.fetchone()
             
         except Exception as e:
             print(f"Error getting file info: {e}")
             return None
     
+    def filename_taken(self, user_email, filename):
+        """Whether a live file already has this name (checked before an upload is read)"""
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT 1 FROM files WHERE user_email = ? AND filename = ? AND deleted_at IS NULL
+            ''', (user_email, filename)).fetchone() is not None
+    
+    def count_owned(self, file_ids, user_email):
+        """How many of ``file_ids`` belong to the user, in one query"""
+        file_ids = list(set(file_ids))
+        if not file_ids:
+            return 0
+        placeholders = ','.join('?' * len(file_ids))
+        with self.pool.connection() as conn:
+            return conn.execute(f'''
+                SELECT COUNT(*) FROM files
+                WHERE user_email = ? AND id IN ({placeholders}) AND deleted_at IS NULL
+            ''', [user_email] + file_ids).fetchone()[0]
+    
+    def file_records(self, file_ids, user_email):
+        """Listing records of a user's files (live or trashed), in the given order"""
+        if not file_ids:
+            return []
+        placeholders = ','.join('?' * len(file_ids))
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT id, filename, upload_date, file_size, page_count, title, deleted_at FROM files
+                WHERE user_email = ? AND id IN ({placeholders})
+            ''', [user_email] + list(file_ids)).fetchall()
+        records = {row[0]: dict(self._file_record(row), deleted_at=row[6]) for row in rows}
+        return [records[file_id] for file_id in file_ids if file_id in records]
+    
+    def iter_files(self, user_email, file_ids=None, batch_size=500):
+        """Yield ``(id, filename, file_path, file_size, upload_date, blob_sha256)`` rows.
+        
+        Walks the user's files (or only ``file_ids``) one keyset batch at a
+        time, so memory stays bounded for any account size.
+        """
+        if file_ids is not None:
+            file_ids = sorted(set(file_ids))
+            for start in range(0, len(file_ids), batch_size):
+                batch = file_ids[start:start + batch_size]
+                placeholders = ','.join('?' * len(batch))
+                with self.pool.connection() as conn:
+                    rows = conn.execute(f'''
+                        SELECT id, filename, file_path, file_size, upload_date, blob_sha256
+                        FROM files
+                        WHERE user_email = ? AND id IN ({placeholders}) AND deleted_at IS NULL
+                        ORDER BY id
+                    ''', [user_email] + batch).fetchall()
+                yield from rows
+            return
+        
+        # Oldest first along the (user_email, upload_date) index
+        last = ('', 0)
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute('''
+                    SELECT id, filename, file_path, file_size, upload_date, blob_sha256
+                    FROM files
+                    WHERE user_email = ? AND deleted_at IS NULL AND (upload_date, id) > (?, ?)
+                    ORDER BY upload_date, id
+                    LIMIT ?
+                ''', (user_email, last[0], last[1], batch_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = (rows[-1][4], rows[-1][0])
+    
     def delete_file(self, file_id, user_email):
-        """Delete a file from database and filesystem"""
+        """Move a file to the trash.
+
+        A single indexed UPDATE; the row, its blob and its search entry are
+        removed later by ``purge_deleted``, so the file keeps counting
+        towards the owner's quota until then.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get file info first
-            cursor.execute('''
-                SELECT file_path FROM files 
-                WHERE id = ? AND user_email = ?
-            ''', (file_id, user_email))
-            
-            result = cursor.fetchone()
-            if not result:
-                conn.close()
-                return False, "File not found or access denied"
-            
-            file_path = result[0]
-            
-            # Delete from database
-            cursor.execute('''
-                DELETE FROM files 
-                WHERE id = ? AND user_email = ?
-            ''', (file_id, user_email))
-            
+            deleted_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with self.pool.connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE files SET deleted_at = ?
+                    WHERE id = ? AND user_email = ? AND deleted_at IS NULL
+                ''', (deleted_at, file_id, user_email))
+                if cursor.rowcount == 0:
+                    return False, "File not found or access denied"
+                self._record_change(conn, user_email, file_id, deleted_at)
+                conn.commit()
+            self._changed(user_email, removed=[file_id])
+            return True, "File moved to trash"
+
+        except Exception as e:
+            return False, f"Error deleting file: {str(e)}"
+
+    def list_trash(self, user_email, cursor=None, limit=50):
+        """Get one page of a user's trash, most recently deleted first.
+
+        Returns ``(file_list, next_cursor)`` like ``list_files``.
+        """
+        params = [user_email]
+        where = 'user_email = ? AND deleted_at IS NOT NULL'
+        if cursor:
+            key, file_id = self.decode_cursor(cursor, 'trash')
+            where += ' AND (deleted_at, id) < (?, ?)'
+            params += [key, file_id]
+        params.append(limit + 1)
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT id, filename, upload_date, file_size, deleted_at
+                FROM files
+                WHERE {where}
+                ORDER BY deleted_at DESC, id DESC
+                LIMIT ?
+            ''', params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor('trash', rows[-1][4], rows[-1][0])
+
+        file_list = [{
+            'id': file_data[0],
+            'filename': file_data[1],
+            'upload_date': file_data[2],
+            'file_size': self.format_file_size(file_data[3]),
+            'deleted_at': file_data[4]
+        } for file_data in rows]
+        return file_list, next_cursor
+
+    def restore_file(self, file_id, user_email):
+        """Take a file back out of the trash"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.execute('''
+                    UPDATE files SET deleted_at = NULL
+                    WHERE id = ? AND user_email = ? AND deleted_at IS NOT NULL
+                ''', (file_id, user_email))
+                if cursor.rowcount == 0:
+                    return False, "File not found in trash"
+                row = conn.execute(
+                    'SELECT id, filename, upload_date, file_size FROM files WHERE id = ?',
+                    (file_id,)
+                ).fetchone()
+                self._record_change(conn, user_email, file_id,
+                                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                conn.commit()
+            self._changed(user_email, added=[row])
+            return True, "File restored"
+
+        except sqlite3.IntegrityError:
+            return False, DUPLICATE_NAME
+        except Exception as e:
+            return False, f"Error restoring file: {str(e)}"
+
+    def purge_file(self, file_id, user_email):
+        """Permanently delete a file, whether or not it is in the trash"""
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute('''
+                    SELECT id, user_email, file_path, blob_sha256, file_size FROM files
+                    WHERE id = ? AND user_email = ?
+                ''', (file_id, user_email)).fetchall()
+                if not rows:
+                    return False, "File not found or access denied"
+                self._purge_rows(conn, rows)
+            return True, "File deleted permanently"
+
+        except Exception as e:
+            return False, f"Error deleting file: {str(e)}"
+
+    def purge_deleted(self, older_than_days=None, batch_size=None, user_email=None):
+        """Permanently delete trashed files, one short transaction per batch.
+
+        Only files trashed more than ``older_than_days`` ago are purged
+        (``config.TRASH_RETENTION_DAYS`` by default; 0 empties the trash).
+        Returns the number of files purged.
+        """
+        if older_than_days is None:
+            older_than_days = config.TRASH_RETENTION_DAYS
+        batch_size = batch_size or config.PURGE_BATCH_SIZE
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+        where = 'deleted_at IS NOT NULL AND deleted_at <= ?'
+        params = [cutoff]
+        if user_email is not None:
+            where += ' AND user_email = ?'
+            params.append(user_email)
+        params.append(batch_size)
+
+        purged = 0
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, user_email, file_path, blob_sha256, file_size FROM files
+                    WHERE {where}
+                    ORDER BY deleted_at
+                    LIMIT ?
+                ''', params).fetchall()
+                if not rows:
+                    return purged
+                self._purge_rows(conn, rows)
+            purged += len(rows)
+
+    def _purge_rows(self, conn, rows):
+        """Delete file rows and release their blobs in one write transaction.
+
+        ``rows`` are ``(id, user_email, file_path, blob_sha256, file_size)``.
+        """
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        legacy_paths = []
+        released = []
+        removed = {}
+        purged_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for file_id, user_email, file_path, sha256, file_size in rows:
+            cursor.execute('DELETE FROM files WHERE id = ?', (file_id,))
             if cursor.rowcount == 0:
-                conn.close()
-                return False, "File not found or access denied"
-            
-            conn.commit()
-            conn.close()
-            
-            # Delete actual file
+                continue
+            self._record_change(cursor, user_email, file_id, purged_at)
+            self.quotas.charge(cursor, user_email, -file_size, -1)
+            self.search_index.remove(cursor, file_id)
+            if sha256:
+                if self._release_blob(cursor, sha256):
+                    released.append(sha256)
+            else:
+                legacy_paths.append(file_path)
+            removed.setdefault(user_email, []).append(file_id)
+        conn.commit()
+        for user_email, file_ids in removed.items():
+            self._changed(user_email, removed=file_ids)
+        
+        # Storage calls happen after the commit, never under the write lock
+        self.remove_unreferenced_blobs(released)
+
+        # Files stored before the blob store have their own path
+        for file_path in legacy_paths:
             if os.path.exists(file_path):
                 os.remove(file_path)
-            
-            return True, "File deleted successfully"
-            
+
+    def set_document_info(self, file_id, metadata):
+        """Store extracted PDF metadata; open pages pick it up from the change feed.
+
+        Re-processing a file (e.g. to render its thumbnail again) usually
+        finds the same values, and then records no change.
+        """
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute('''
+                    UPDATE files SET page_count = ?1, title = ?2, author = ?3
+                    WHERE id = ?4
+                    AND (page_count IS NOT ?1 OR title IS NOT ?2 OR author IS NOT ?3)
+                    RETURNING user_email
+                ''', (metadata['page_count'], metadata['title'], metadata['author'], file_id)).fetchone()
+                if row is None:
+                    conn.rollback()
+                    return
+                self._record_change(conn, row[0], file_id,
+                                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                conn.commit()
+            self._changed(row[0])
         except Exception as e:
-            return False, f"Error deleting file: {str(e)}"
+            print(f"Error storing metadata for file {file_id}: {e}")
+    
+    def backfill_documents(self, thumbnails=True, batch_size=200, progress=None):
+        """Process files uploaded before the pipeline existed (or with it off).
+
+        Files without metadata are always processed; with ``thumbnails``
+        every live file is checked and missing (e.g. evicted) thumbnails are
+        rendered again. Returns the number of files processed.
+        """
+        where = 'deleted_at IS NULL' if thumbnails else 'page_count IS NULL AND deleted_at IS NULL'
+        with self.pool.connection() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM files WHERE {where}').fetchone()[0]
+        
+        processed = 0
+        checked = 0
+        last_id = 0
+        while True:
+            with self.pool.connection() as conn:
+                batch = conn.execute(f'''
+                    SELECT id, file_path, blob_sha256, page_count FROM files
+                    WHERE {where} AND id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, batch_size)).fetchall()
+            if not batch:
+                return processed
+            last_id = batch[-1][0]
+            processed += self.documents.backfill(batch)
+            checked += len(batch)
+            if progress:
+                progress(checked, total, processed)
+    
+    def _record_change(self, cursor, user_email, file_id, changed_at):
+        """Append a file to its owner's change feed, in the caller's transaction"""
+        cursor.execute(
+            'INSERT INTO file_changes (user_email, file_id, changed_at) VALUES (?, ?, ?)',
+            (user_email, file_id, changed_at)
+        )
+    
+    def _latest_change(self, conn):
+        row = conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'file_changes'"
+        ).fetchone()
+        return row[0] if row else 0
+    
+    def latest_change(self):
+        """Sequence number of the newest change.
+
+        Read it before listing files; ``changes_since`` it then covers
+        everything the listing might have missed.
+        """
+        with self.pool.connection() as conn:
+            return self._latest_change(conn)
+    
+    def changes_since(self, user_email, since, limit=None):
+        """Files of a user that changed after sequence number ``since``.
+
+        Returns a dict with ``changes``, a list of ``{'id', 'file'}`` where
+        ``file`` is the current listing record or None if the file left the
+        listing; ``seq``, to pass as ``since`` next time; ``more``, if the
+        limit cut the list short; and ``reset``, if changes after ``since``
+        were already pruned and the listing must be reloaded instead.
+        """
+        limit = limit or config.CHANGES_LIMIT
+        with self.pool.connection() as conn:
+            # One read transaction, so the rows and sequence numbers agree
+            conn.execute('BEGIN')
+            try:
+                oldest = conn.execute('SELECT MIN(seq) FROM file_changes').fetchone()[0]
+                latest = self._latest_change(conn)
+                rows = conn.execute('''
+                    SELECT c.seq, c.file_id, f.id, f.filename, f.upload_date, f.file_size,
+                           f.page_count, f.title
+                    FROM file_changes c
+                    LEFT JOIN files f ON f.id = c.file_id AND f.deleted_at IS NULL
+                    WHERE c.user_email = ? AND c.seq > ?
+                    ORDER BY c.seq
+                    LIMIT ?
+                ''', (user_email, since, limit + 1)).fetchall()
+            finally:
+                conn.rollback()
+        
+        if since > latest or (since < latest and (oldest is None or oldest > since + 1)):
+            return {'changes': [], 'seq': latest, 'more': False, 'reset': True}
+        
+        more = len(rows) > limit
+        rows = rows[:limit]
+        # Several changes to one file collapse into its current state
+        changes = {}
+        for row in rows:
+            file_id = row[1]
+            changes.pop(file_id, None)
+            changes[file_id] = None if row[2] is None else self._file_record(row[2:])
+        return {
+            'changes': [{'id': file_id, 'file': file} for file_id, file in changes.items()],
+            'seq': rows[-1][0] if more else latest,
+            'more': more,
+            'reset': False
+        }
+    
+    def prune_changes(self, older_than_hours=None):
+        """Drop change feed entries older than the retention period"""
+        if older_than_hours is None:
+            older_than_hours = config.CHANGES_RETENTION_HOURS
+        cutoff = (datetime.now() - timedelta(hours=older_than_hours)).strftime('%Y-%m-%d %H:%M:%S')
+        with self.pool.connection() as conn:
+            count = conn.execute('DELETE FROM file_changes WHERE changed_at < ?', (cutoff,)).rowcount
+            conn.commit()
+        return count
+    
+    def _release_blob(self, cursor, sha256):
+        """Drop one reference to a blob inside the caller's write transaction.
+
+        Returns True when none remain. The row stays at zero until
+        ``remove_unreferenced_blobs`` deletes the bytes after the commit.
+        """
+        cursor.execute(
+            'UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = ? RETURNING ref_count',
+            (sha256,)
+        )
+        row = cursor.fetchone()
+        return row is not None and row[0] <= 0
+    
+    def remove_unreferenced_blobs(self, shas=None):
+        """Delete blobs nothing refers to; returns how many were removed.
+
+        Each blob is claimed first by setting its count to -1 in a short
+        transaction, which uploads refuse to re-reference; one referenced
+        again since its release has a positive count and is skipped. The
+        storage call runs with no lock held, then the row goes. ``shas``
+        limits the sweep; None covers every unreferenced blob, e.g. ones
+        left behind by a crash.
+        """
+        if shas is None:
+            with self.pool.connection() as conn:
+                shas = [row[0] for row in conn.execute('SELECT sha256 FROM blobs WHERE ref_count <= 0')]
+        removed = 0
+        for sha256 in shas:
+            with self.pool.connection() as conn:
+                claimed = conn.execute(
+                    'UPDATE blobs SET ref_count = -1 WHERE sha256 = ? AND ref_count <= 0',
+                    (sha256,)
+                ).rowcount
+                conn.commit()
+            if not claimed:
+                continue
+            try:
+                self.blobs.remove(sha256)
+            except Exception as e:
+                print(f"Error removing blob {sha256}: {e}")
+                # Unclaim, so uploads of the same content work until a later sweep
+                with self.pool.connection() as conn:
+                    conn.execute('UPDATE blobs SET ref_count = 0 WHERE sha256 = ? AND ref_count = -1',
+                                 (sha256,))
+                    conn.commit()
+                continue
+            with self.pool.connection() as conn:
+                conn.execute('DELETE FROM blobs WHERE sha256 = ? AND ref_count = -1', (sha256,))
+                conn.commit()
+            removed += 1
+        return removed
     
-    def search_files(self, user_email, query):
-        """Search files by filename"""
+    def search_files(self, user_email, query, limit=None):
+        """Search filenames and document text, best matches first"""
+        limit = limit or config.SEARCH_RESULT_LIMIT
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Search for files with filename containing the query
-            cursor.execute('''
-                SELECT id, filename, upload_date, file_size
-                FROM files 
-                WHERE user_email = ? AND filename LIKE ?
-                ORDER BY upload_date DESC
-            ''', (user_email, f'%{query}%'))
+            files = self.cache.get_or_load(
+                user_email, 'search', (query, limit),
+                lambda: self.search_index.search(user_email, query, limit)
+            )
             
-            files = cursor.fetchall()
-            conn.close()
+            # Filenames that only match with a typo come after the exact hits
+            if len(files) < limit:
+                found = {file_data[0] for file_data in files}
+                files = list(files) + [
+                    (file_id, filename, upload_date, file_size, '')
+                    for _, file_id, filename, upload_date, file_size
+                    in self.filenames.search(user_email, query, limit)
+                    if file_id not in found
+                ][:limit - len(files)]
             
             # Convert to list of dictionaries
             file_list = []
@@ -173,7 +760,8 @@ class FileManager:
                     'id': file_data[0],
                     'filename': file_data[1],
                     'upload_date': file_data[2],
-                    'file_size': self.format_file_size(file_data[3])
+                    'file_size': self.format_file_size(file_data[3]),
+                    'snippet': file_data[4]
                 })
             
             return file_list
@@ -182,6 +770,20 @@ class FileManager:
             print(f"Error searching files: {e}")
             return []
     
+    def suggest_files(self, user_email, query, limit=None):
+        """Typo-tolerant filename matches for search-as-you-type"""
+        limit = limit or config.AUTOCOMPLETE_LIMIT
+        try:
+            return [{
+                'id': file_id,
+                'filename': filename,
+                'score': score
+            } for score, file_id, filename, _, _ in self.filenames.search(user_email, query, limit)]
+        
+        except Exception as e:
+            print(f"Error suggesting files: {e}")
+            return []
+    
     def format_file_size(self, size_bytes):
         """Format file size in human readable format"""
         if size_bytes == 0:
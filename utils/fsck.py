@@ -0,0 +1,424 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import config
+
+PHASES = ('files', 'blobs', 'disk', 'staging')
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+_SHARD_RE = re.compile(r'^[0-9a-f]{2}$')
+
+def _stat(path):
+    """``(size, mtime)`` of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime
+
+class StorageChecker:
+    """Consistency check between the database and blob storage.
+
+    Works in four phases, each streamed in fixed-size batches so memory use
+    does not grow with the number of files:
+
+    - ``files``: every file row has its bytes (legacy path or blob row)
+    - ``blobs``: every blob row has a file of the right size, and its
+      reference count matches the rows using it
+    - ``disk``: every object under the blob shards is known to ``blobs``
+    - ``staging``: abandoned staging files and unreferenced legacy files
+
+    Stats and hashes run on a thread pool. With a checkpoint file the scan
+    can stop after a time budget and resume from the same place next run.
+    """
+
+    def __init__(self, file_manager, workers=None, batch_size=None, verify=False,
+                 repair=False, prune_missing=False, report=None, grace_seconds=None):
+        self.fm = file_manager
+        self.pool = file_manager.pool
+        self.blobs = file_manager.blobs
+        self.workers = workers or config.FSCK_WORKERS
+        self.batch_size = batch_size or config.FSCK_BATCH_SIZE
+        self.verify = verify
+        self.repair = repair
+        self.prune_missing = prune_missing
+        self.report = report
+        # Files younger than this may belong to an upload still in progress
+        self.grace_seconds = config.STALE_UPLOAD_SECONDS if grace_seconds is None else grace_seconds
+        self.counts = {}
+        self.examples = {}
+        self.checked = 0
+        self._now = time.time()
+
+    # Findings
+
+    def _finding(self, kind, repaired=False, **detail):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if repaired:
+            self.counts['repaired'] = self.counts.get('repaired', 0) + 1
+        entry = dict(kind=kind, repaired=repaired, **detail)
+        examples = self.examples.setdefault(kind, [])
+        if len(examples) < 10:
+            examples.append(entry)
+        if self.report:
+            self.report.write(json.dumps(entry) + '\n')
+
+    def _stat_all(self, executor, paths):
+        return list(executor.map(_stat, paths))
+
+    def _verify_all(self, executor, shas):
+        """Recompute blob digests; returns the ones whose content differs."""
+        def check(sha256):
+            try:
+                actual, _ = self.blobs.hash_blob(sha256)
+            except OSError:
+                return None
+            return sha256 if actual != sha256 else None
+        return [sha for sha in executor.map(check, shas) if sha]
+
+    # Phase: file rows
+
+    def _check_files(self, executor, cursor):
+        last_id = cursor or 0
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, user_email, file_path, file_size, blob_sha256
+                FROM files WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, self.batch_size)).fetchall()
+        if not rows:
+            return None
+
+        legacy = [row for row in rows if not row[4]]
+        stats = self._stat_all(executor, [row[2] for row in legacy])
+        for (file_id, user_email, path, size, _), stat in zip(legacy, stats):
+            if stat is None:
+                repaired = self.prune_missing and self.fm.purge_file(file_id, user_email)[0]
+                self._finding('missing_file', repaired, file_id=file_id, path=path)
+            elif stat[0] != size:
+                self._finding('size_mismatch', file_id=file_id, path=path,
+                              expected=size, actual=stat[0])
+
+        shas = sorted({row[4] for row in rows if row[4]})
+        if shas:
+            with self.pool.connection() as conn:
+                known = {row[0] for row in conn.execute(
+                    f'SELECT sha256 FROM blobs WHERE sha256 IN ({",".join("?" * len(shas))})', shas
+                )}
+            for sha256 in shas:
+                if sha256 in known:
+                    continue
+                # The blobs phase cannot see this one; handle it here
+                stat = self.blobs.stat(sha256)
+                if stat is not None:
+                    repaired = self.repair and self._register_blob(sha256, stat[0])
+                    self._finding('unregistered_blob', repaired, sha256=sha256)
+                else:
+                    repaired = self.prune_missing and self._prune_blob_rows(sha256)
+                    self._finding('missing_blob', repaired, sha256=sha256)
+
+        self.checked += len(rows)
+        return rows[-1][0]
+
+    def _register_blob(self, sha256, size):
+        """Recreate a lost blob row from the file on disk."""
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                INSERT OR IGNORE INTO blobs (sha256, size, ref_count, created_at)
+                SELECT ?, ?, COUNT(*), datetime('now') FROM files WHERE blob_sha256 = ?
+            ''', (sha256, size, sha256))
+            conn.commit()
+        return True
+
+    def _prune_blob_rows(self, sha256):
+        """Delete every file row whose bytes are gone."""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT id, user_email FROM files WHERE blob_sha256 = ?', (sha256,)
+            ).fetchall()
+        ok = True
+        for file_id, user_email in rows:
+            ok = self.fm.purge_file(file_id, user_email)[0] and ok
+        # Normally gone with the last reference, unless the count was off
+        with self.pool.connection() as conn:
+            conn.execute('''
+                DELETE FROM blobs WHERE sha256 = ?
+                AND NOT EXISTS (SELECT 1 FROM files WHERE blob_sha256 = ?)
+            ''', (sha256, sha256))
+            conn.commit()
+        return ok
+
+    # Phase: blob rows
+
+    def _check_blobs(self, executor, cursor):
+        last_sha = cursor or ''
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT sha256, size, ref_count FROM blobs
+                WHERE sha256 > ? ORDER BY sha256 LIMIT ?
+            ''', (last_sha, self.batch_size)).fetchall()
+            if not rows:
+                return None
+            shas = [row[0] for row in rows]
+            refs = dict(conn.execute(f'''
+                SELECT blob_sha256, COUNT(*) FROM files
+                WHERE blob_sha256 IN ({",".join("?" * len(shas))})
+                GROUP BY blob_sha256
+            ''', shas).fetchall())
+
+        stats = list(executor.map(self.blobs.stat, shas))
+        present = []
+        for (sha256, size, ref_count), stat in zip(rows, stats):
+            if stat is None:
+                repaired = self.prune_missing and self._prune_blob_rows(sha256)
+                self._finding('missing_blob', repaired, sha256=sha256)
+                continue
+            if stat[0] != size:
+                self._finding('size_mismatch', sha256=sha256, expected=size, actual=stat[0])
+            else:
+                present.append(sha256)
+            actual_refs = refs.get(sha256, 0)
+            if actual_refs != ref_count:
+                repaired = self.repair and self._fix_ref_count(sha256)
+                self._finding('ref_count_mismatch', repaired, sha256=sha256,
+                              expected=actual_refs, actual=ref_count)
+
+        if self.verify:
+            for sha256 in self._verify_all(executor, present):
+                self._finding('corrupt_blob', sha256=sha256)
+
+        self.checked += len(rows)
+        return rows[-1][0]
+
+    def _fix_ref_count(self, sha256):
+        """Reset a blob's count from the file rows; drop it if none remain."""
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            count = conn.execute(
+                'SELECT COUNT(*) FROM files WHERE blob_sha256 = ?', (sha256,)
+            ).fetchone()[0]
+            conn.execute('UPDATE blobs SET ref_count = ? WHERE sha256 = ?', (count, sha256))
+            conn.commit()
+        if not count:
+            # Deleted after the commit, as when the last file is purged
+            self.fm.remove_unreferenced_blobs([sha256])
+        return True
+
+    # Phase: blob objects in storage
+
+    def _shards(self, after):
+        """Second-level shard prefixes (``ab/cd``) in order, after ``after``."""
+        storage = self.blobs.storage
+        top = [name for name in storage.list_prefixes('') if _SHARD_RE.match(name)]
+        for first in top:
+            if after and first < after[:2]:
+                continue
+            second = [name for name in storage.list_prefixes(first + '/') if _SHARD_RE.match(name)]
+            for name in second:
+                shard = f'{first}/{name}'
+                if after and shard <= after:
+                    continue
+                yield shard
+
+    def _check_disk(self, executor, cursor):
+        """Check one shard; the cursor is the last shard done."""
+        shard = next(self._shards(cursor), None)
+        if shard is None:
+            return None
+
+        batch = []
+        for item in self.blobs.storage.list_objects(shard + '/'):
+            name = item.key.rsplit('/', 1)[-1]
+            if not _SHA256_RE.match(name) or name[:2] + '/' + name[2:4] != shard:
+                self._finding('unexpected_file', path=item.key)
+                continue
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._check_disk_batch(batch)
+                batch = []
+        if batch:
+            self._check_disk_batch(batch)
+        return shard
+
+    def _check_disk_batch(self, items):
+        names = [item.key.rsplit('/', 1)[-1] for item in items]
+        with self.pool.connection() as conn:
+            known = {row[0] for row in conn.execute(
+                f'SELECT sha256 FROM blobs WHERE sha256 IN ({",".join("?" * len(names))})', names
+            )}
+            unknown = [name for name in names if name not in known]
+            if unknown:
+                # Still used by file rows: reported by the files phase instead
+                known.update(row[0] for row in conn.execute(
+                    f'SELECT DISTINCT blob_sha256 FROM files '
+                    f'WHERE blob_sha256 IN ({",".join("?" * len(unknown))})', unknown
+                ))
+        for name, item in zip(names, items):
+            if name in known or self._now - item.mtime < self.grace_seconds:
+                continue
+            repaired = self.repair and self._reap_blob(name)
+            self._finding('orphan_blob', repaired, sha256=name, path=self.blobs.path_for(name))
+        self.checked += len(items)
+
+    def _reap_blob(self, sha256):
+        """Unlink an unreferenced blob under the write lock.
+
+        Uploads ingest blobs while holding the same lock, so a blob whose
+        row is about to be committed cannot be removed by mistake.
+        """
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('''
+                SELECT 1 FROM blobs WHERE sha256 = ?
+                UNION ALL
+                SELECT 1 FROM files WHERE blob_sha256 = ?
+            ''', (sha256, sha256)).fetchone()
+            if row is None:
+                self.blobs.remove(sha256)
+            conn.commit()
+        return row is None
+
+    # Phase: staging and legacy files
+
+    def _check_staging(self, executor, cursor):
+        """Stale staging files and legacy uploads no row refers to (single pass)."""
+        if cursor:
+            return None
+        try:
+            with os.scandir(self.blobs.staging_dir) as entries:
+                for entry in entries:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        age = self._now - entry.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if age < self.grace_seconds:
+                        continue
+                    repaired = False
+                    if self.repair:
+                        try:
+                            os.remove(entry.path)
+                            repaired = True
+                        except FileNotFoundError:
+                            pass
+                    self._finding('stale_staging_file', repaired, path=entry.path)
+        except FileNotFoundError:
+            pass
+
+        if self.repair:
+            from utils.uploads import ChunkedUploads
+            removed = ChunkedUploads().cleanup_stale()
+            if removed:
+                self.counts['stale_partial_uploads_removed'] = removed
+
+        # Files stored before the blob store sit directly in the upload folder
+        batch = []
+        with os.scandir(config.UPLOAD_FOLDER) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                    continue
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    self._check_legacy_batch(batch)
+                    batch = []
+        if batch:
+            self._check_legacy_batch(batch)
+        return 'done'
+
+    def _check_legacy_batch(self, entries):
+        candidates = {}
+        for entry in entries:
+            for path in (os.path.join(config.UPLOAD_FOLDER, entry.name), os.path.abspath(entry.path)):
+                candidates[path] = entry
+        paths = list(candidates)
+        with self.pool.connection() as conn:
+            referenced = {candidates[row[0]].path for row in conn.execute(
+                f'SELECT file_path FROM files WHERE file_path IN ({",".join("?" * len(paths))})', paths
+            )}
+        for entry in entries:
+            if entry.path in referenced:
+                continue
+            repaired = self.repair and self._reap_legacy(entry)
+            self._finding('orphan_file', repaired, path=entry.path)
+        self.checked += len(entries)
+
+    def _reap_legacy(self, entry):
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT 1 FROM files WHERE file_path IN (?, ?)',
+                (os.path.join(config.UPLOAD_FOLDER, entry.name), os.path.abspath(entry.path))
+            ).fetchone()
+            if row is None:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+            conn.commit()
+        return row is None
+
+    # Driver
+
+    def run(self, state=None, time_limit=None, progress=None):
+        """Run the check, optionally resuming from and updating ``state``.
+
+        ``state`` is a dict with ``phase`` and ``cursor`` (see load_state);
+        with ``time_limit`` seconds the run stops at the next batch boundary
+        and ``state`` records where to continue. Returns a summary dict.
+        """
+        state = state if state is not None else {}
+        phase = state.get('phase') or PHASES[0]
+        cursor = state.get('cursor')
+        started = time.monotonic()
+        handlers = {
+            'files': self._check_files,
+            'blobs': self._check_blobs,
+            'disk': self._check_disk,
+            'staging': self._check_staging,
+        }
+
+        complete = False
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                cursor = handlers[phase](executor, cursor)
+                if progress:
+                    progress(phase, self.checked)
+                if cursor is None or phase == 'staging':
+                    index = PHASES.index(phase)
+                    if index + 1 == len(PHASES):
+                        complete = True
+                        break
+                    phase, cursor = PHASES[index + 1], None
+                if time_limit is not None and time.monotonic() - started >= time_limit:
+                    break
+
+        if complete:
+            state.update(phase=None, cursor=None, completed_at=time.time())
+        else:
+            state.update(phase=phase, cursor=cursor)
+        return {
+            'complete': complete,
+            'checked': self.checked,
+            'elapsed_s': round(time.monotonic() - started, 3),
+            'findings': dict(self.counts),
+            'examples': self.examples,
+            'resume': None if complete else {'phase': phase, 'cursor': cursor},
+        }
+
+def load_state(path):
+    """Read a checkpoint written by save_state (empty when starting fresh)."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
@@ -0,0 +1,311 @@
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+
+from utils import config
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Share of the query's trigrams a filename must contain to match at all
+MIN_SHARED = 0.5
+
+# Candidates per requested result that get the full (bonus) scoring
+RERANK_FACTOR = 5
+
+# Query words this short share too few trigrams with a typo'd name, so they
+# are also matched by edit distance (one insertion, deletion, substitution
+# or swap of adjacent letters); shorter than EDIT_MIN_LENGTH would match
+# almost anything
+EDIT_MIN_LENGTH = 3
+EDIT_MAX_LENGTH = 6
+
+# Score of an edit-distance match, halved per edit
+EDIT_SCORE = 0.5
+
+def normalize(text):
+    """Lower-case words of a filename or query, accents and ``.pdf`` removed."""
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    if text.endswith('.pdf'):
+        text = text[:-4]
+    return _WORD_RE.findall(text.replace('_', ' '))
+
+def edits(a, b):
+    """0 or 1 if ``a`` and ``b`` are at most one edit apart, else None.
+
+    An edit is an insertion, deletion, substitution or transposition of
+    adjacent characters (restricted Damerau-Levenshtein distance).
+    """
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > 1:
+        return None
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        if a[i + 1:] == b[i + 1:]:
+            return 1
+        if a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2] and a[i + 2:] == b[i + 2:]:
+            return 1
+        return None
+    shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+    return 1 if shorter[i:] == longer[i + 1:] else None
+
+def word_edits(query_word, word, prefix=False):
+    """Edits between a query word and a filename word, or None if too far.
+
+    With ``prefix`` the query word may be the start of ``word``.
+    """
+    if not prefix or len(word) <= len(query_word):
+        return edits(query_word, word)
+    n = len(query_word)
+    found = [d for d in (edits(query_word, word[:m]) for m in (n - 1, n, n + 1)) if d is not None]
+    return min(found) if found else None
+
+def trigrams(words, prefix=False):
+    """Set of padded trigrams of each word (``'  a', ' ab', 'abc', ..., 'yz '``).
+
+    With ``prefix`` the last word is treated as unfinished and gets no
+    trailing pad, so ``'inv'`` matches ``'invoice'`` while typing.
+    """
+    grams = set()
+    for i, word in enumerate(words):
+        last = prefix and i == len(words) - 1
+        padded = f'  {word}' if last else f'  {word} '
+        grams.update([padded[j:j + 3] for j in range(len(padded) - 2)])
+    return grams
+
+class FilenameIndex:
+    """Trigram index over one user's filenames.
+
+    Candidates come from the postings of the query's rarest trigrams only:
+    a name sharing at least ``t`` of the query's ``n`` trigrams must contain
+    one of its ``n - t + 1`` rarest. Shared trigrams are then counted set
+    by set, and only the leading candidates get the more expensive
+    prefix and substring checks. When that finds too few names, short
+    query words are compared with the index's words by edit distance, so
+    ``tset`` still finds ``test.pdf``.
+
+    ``lock`` serializes searches and updates of this index; FilenameSearch
+    holds it rather than a lock shared by every user.
+    """
+
+    def __init__(self, rows=()):
+        self.entries = {}   # id -> (filename, upload_date, file_size, words, grams)
+        self.postings = {}  # trigram -> set of ids
+        self.words = {}     # word -> set of ids
+        self.lock = threading.Lock()
+        for row in rows:
+            self.add(*row)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, file_id, filename, upload_date, file_size):
+        self.remove(file_id)
+        words = normalize(filename)
+        grams = tuple(trigrams(words))
+        postings = self.postings
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = set()
+            posting.add(file_id)
+        for word in words:
+            ids = self.words.get(word)
+            if ids is None:
+                ids = self.words[word] = set()
+            ids.add(file_id)
+        self.entries[file_id] = (filename, upload_date, file_size, tuple(words), grams)
+
+    def remove(self, file_id):
+        entry = self.entries.pop(file_id, None)
+        if entry is None:
+            return
+        for gram in entry[4]:
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(file_id)
+                if not posting:
+                    del self.postings[gram]
+        for word in entry[3]:
+            ids = self.words.get(word)
+            if ids is not None:
+                ids.discard(file_id)
+                if not ids:
+                    del self.words[word]
+
+    def search(self, query, limit=10):
+        """Best matches as ``(score, id, filename, upload_date, file_size)``."""
+        words = normalize(query)
+        if not words:
+            return []
+        results = self._search_trigrams(words, limit)
+        if len(results) < limit:
+            found = {result[1] for result in results}
+            results += [result for result in self._search_edits(words, limit)
+                        if result[1] not in found][:limit - len(results)]
+        return results
+
+    def _search_trigrams(self, words, limit):
+        wanted = trigrams(words, prefix=True)
+        needed = max(1, math.ceil(len(wanted) * MIN_SHARED))
+
+        rare = sorted(wanted, key=lambda gram: len(self.postings.get(gram, ())))
+        candidates = set()
+        for gram in rare[:len(wanted) - needed + 1]:
+            candidates.update(self.postings.get(gram, ()))
+        if not candidates:
+            return []
+
+        # Shared trigrams per candidate, counted in C over the posting sets
+        shared = Counter()
+        for gram in wanted:
+            posting = self.postings.get(gram)
+            if posting:
+                shared.update(candidates & posting if len(posting) > len(candidates) else posting)
+
+        # Coverage of the query, then of the name (shorter names win ties)
+        entries = self.entries
+        coarse = heapq.nlargest(limit * RERANK_FACTOR, (
+            (count / len(wanted) + 0.2 * count / len(entries[file_id][4]), file_id)
+            for file_id, count in shared.items()
+            if count >= needed and file_id in candidates
+        ))
+
+        # Word-prefix and substring bonuses only for the leading candidates
+        phrase = ' '.join(words)
+        scored = []
+        for score, file_id in coarse:
+            filename, upload_date, file_size, name_words, _ = entries[file_id]
+            if any(word.startswith(words[-1]) for word in name_words):
+                score += 0.2
+            if phrase in ' '.join(name_words):
+                score += 0.3
+            scored.append((score, upload_date, file_id, filename, file_size))
+
+        scored.sort(reverse=True)
+        return [(round(score, 3), file_id, filename, upload_date, file_size)
+                for score, upload_date, file_id, filename, file_size in scored[:limit]]
+
+    def _search_edits(self, words, limit):
+        """Names with a word within one edit of every query word.
+
+        Only runs if some query word is short enough to need it; longer
+        words must then appear as they are (the last one as a prefix).
+        """
+        if not any(EDIT_MIN_LENGTH <= len(word) <= EDIT_MAX_LENGTH for word in words):
+            return []
+        total = Counter()
+        matched = None
+        for i, query_word in enumerate(words):
+            prefix = i == len(words) - 1
+            fuzzy = EDIT_MIN_LENGTH <= len(query_word) <= EDIT_MAX_LENGTH
+            best = {}  # id -> fewest edits for this query word
+            for word, ids in self.words.items():
+                if fuzzy:
+                    distance = word_edits(query_word, word, prefix)
+                elif word == query_word or (prefix and word.startswith(query_word)):
+                    distance = 0
+                else:
+                    distance = None
+                if distance is None:
+                    continue
+                for file_id in ids:
+                    if distance < best.get(file_id, 2):
+                        best[file_id] = distance
+            matched = set(best) if matched is None else matched & set(best)
+            if not matched:
+                return []
+            total.update(best)
+
+        entries = self.entries
+        scored = sorted(((EDIT_SCORE / (1 + total[file_id]), entries[file_id][1], file_id)
+                         for file_id in matched), reverse=True)
+        return [(round(score, 3), file_id, entries[file_id][0], upload_date, entries[file_id][2])
+                for score, upload_date, file_id in scored[:limit]]
+
+class FilenameSearch:
+    """Lazily built per-user FilenameIndexes, kept in a bounded LRU.
+
+    Each index remembers the listing-cache version it reflects. Changes
+    made by this process are applied in place; a version bumped by another
+    worker makes the next lookup rebuild the index from the database.
+    ``_lock`` only guards the LRU; each index has its own lock, so one
+    user's search never waits for another's.
+    """
+
+    def __init__(self, pool, cache, max_users=None):
+        self.pool = pool
+        self.cache = cache
+        self.max_users = config.FUZZY_MAX_USERS if max_users is None else max_users
+        self._indexes = OrderedDict()  # user -> (version, FilenameIndex)
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _build(self, user_email):
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, filename, upload_date, file_size FROM files
+                WHERE user_email = ? AND deleted_at IS NULL
+            ''', (user_email,)).fetchall()
+        self.builds += 1
+        return FilenameIndex(rows)
+
+    def index_for(self, user_email):
+        version = self.cache.versions.get(user_email)
+        with self._lock:
+            entry = self._indexes.get(user_email)
+            if entry is not None and entry[0] == version:
+                self._indexes.move_to_end(user_email)
+                return entry[1]
+        index = self._build(user_email)
+        with self._lock:
+            self._indexes[user_email] = (version, index)
+            self._indexes.move_to_end(user_email)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def changed(self, user_email, version, added=(), removed=()):
+        """Apply this process's own change, made as ``version``, in place.
+
+        ``added`` holds ``(id, filename, upload_date, file_size)`` rows. If
+        the index missed an intermediate version it is left stale and will
+        be rebuilt on next use.
+        """
+        with self._lock:
+            entry = self._indexes.get(user_email)
+            if entry is None or entry[0] != version - 1:
+                return
+            index = entry[1]
+            # Taken before the LRU lock is released, so consecutive versions
+            # are applied in order
+            index.lock.acquire()
+            self._indexes[user_email] = (version, index)
+        try:
+            for file_id in removed:
+                index.remove(file_id)
+            for row in added:
+                index.add(*row)
+        finally:
+            index.lock.release()
+
+    def search(self, user_email, query, limit=10):
+        index = self.index_for(user_email)
+        with index.lock:
+            return index.search(query, limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._indexes),
+                'files': sum(len(index) for _, index in self._indexes.values()),
+                'builds': self.builds,
+            }
@@ -0,0 +1,203 @@
+import mimetypes
+import os
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, is_resource_modified, parse_if_range_header, quote_etag, unquote_etag
+from werkzeug.wsgi import wrap_file
+
+from utils import config
+
+MAX_RANGES = 64
+
+SERVE_MODES = ('direct', 'x-accel', 'x-sendfile')
+
+def offload_headers(path, mode=None):
+    """Headers that hand a file transfer to the reverse proxy.
+
+    Returns None in direct mode, or when the file lies outside the upload
+    folder the proxy is configured to serve, so the caller streams it itself.
+    """
+    mode = mode or config.FILE_SERVE_MODE
+    if mode not in SERVE_MODES:
+        raise ValueError(f"Unknown file serve mode: {mode}")
+    if mode == 'direct':
+        return None
+
+    root = os.path.realpath(config.UPLOAD_FOLDER)
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([root, real_path]) != root:
+        return None
+
+    if mode == 'x-sendfile':
+        return {'X-Sendfile': real_path}
+    relative = os.path.relpath(real_path, root).replace(os.sep, '/')
+    return {'X-Accel-Redirect': config.ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(relative)}
+
+def parse_ranges(header, size):
+    """Parse a ``Range: bytes=...`` header against a resource of ``size`` bytes.
+
+    Returns ``None`` when the header is absent or malformed (serve the whole
+    file), an empty list when no range is satisfiable (416), or a sorted list
+    of inclusive ``(start, end)`` pairs with overlapping ranges merged.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition('-')
+        if not dash:
+            return None
+        first, last = first.strip(), last.strip()
+        try:
+            if not first:
+                # Suffix range: the final N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                if last:
+                    end = int(last)
+                    if end < start:
+                        return None
+                    end = min(end, size - 1)
+                else:
+                    end = size - 1
+        except ValueError:
+            return None
+        if start < 0:
+            return None
+        if start < size:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _if_range_matches(etag_header, last_modified):
+    """Whether an If-Range precondition (if any) allows a partial response."""
+    if_range = parse_if_range_header(request.headers.get('If-Range'))
+    if if_range.etag is not None:
+        # If-Range requires a strong comparison
+        etag, weak = unquote_etag(etag_header)
+        return not weak and if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified is not None and int(last_modified.timestamp()) == int(if_range.date.timestamp())
+    return True
+
+def send_stored_file(storage, key, etag=None, mimetype=None, as_attachment=False,
+                     download_name=None, cache_control=None, serve_mode=None):
+    """Serve a stored object with validators, conditional GET and byte ranges.
+
+    The bytes come from ``storage`` (a StorageBackend) and are streamed, a
+    ranged read at a time, so no object is ever buffered whole. Returns None
+    when the object does not exist.
+
+    ``etag`` is the content hash recorded at upload time and is sent as a
+    strong validator; without it a weak validator is derived from size and
+    mtime. Handles If-None-Match / If-Modified-Since (304), If-Range, single
+    ranges (206) and multiple ranges (206 multipart/byteranges).
+
+    In an offload ``serve_mode`` the body (and range handling) is left to the
+    reverse proxy for objects on local disk; revalidation is still answered
+    here since it is cheap.
+    """
+    stat = storage.stat(key)
+    if stat is None:
+        return None
+    size = stat.size
+    last_modified = datetime.fromtimestamp(int(stat.mtime), tz=timezone.utc)
+    if etag:
+        etag_header = quote_etag(etag)
+    else:
+        etag_header = quote_etag(f'{int(stat.mtime)}-{size}', weak=True)
+    mimetype = mimetype or mimetypes.guess_type(download_name or key)[0] or 'application/octet-stream'
+
+    headers = {
+        'ETag': etag_header,
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': cache_control or config.FILE_CACHE_CONTROL,
+    }
+    if download_name:
+        disposition = 'attachment' if as_attachment else 'inline'
+        headers['Content-Disposition'] = f'{disposition}; filename="{download_name}"'
+
+    if not is_resource_modified(request.environ, etag=etag_header, last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    path = storage.local_path(key)
+    offload = path and offload_headers(path, serve_mode)
+    if offload:
+        headers.update(offload)
+        return Response(status=200, mimetype=mimetype, headers=headers)
+
+    buffer_size = config.CHUNK_BUFFER_SIZE
+    ranges = None
+    if _if_range_matches(etag_header, last_modified):
+        ranges = parse_ranges(request.headers.get('Range'), size)
+
+    if ranges is not None and not ranges:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if not ranges:
+        if path is not None:
+            # A real file lets the server use wsgi.file_wrapper (sendfile)
+            body = wrap_file(request.environ, open(path, 'rb'), buffer_size)
+        else:
+            body = storage.get(key)
+        response = Response(body, status=200, mimetype=mimetype, headers=headers,
+                            direct_passthrough=True)
+        response.content_length = size
+        return response
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response = Response(storage.get(key, start, end),
+                            status=206, mimetype=mimetype, headers=headers,
+                            direct_passthrough=True)
+        response.content_length = end - start + 1
+        return response
+
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (f'\r\n--{boundary}\r\n'
+         f'Content-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+        for start, end in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode()
+    length = sum(len(h) for h in part_headers) + len(closing)
+    length += sum(end - start + 1 for start, end in ranges)
+
+    def generate():
+        for part_header, (start, end) in zip(part_headers, ranges):
+            yield part_header
+            yield from storage.get(key, start, end)
+        yield closing
+
+    response = Response(generate(), status=206, headers=headers,
+                        content_type=f'multipart/byteranges; boundary={boundary}',
+                        direct_passthrough=True)
+    response.content_length = length
+    return response
@@ -0,0 +1,412 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are merged but never archived
+    fcntl = None
+
+from utils import config
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+# Counters and histograms of exited processes, folded into one file
+ARCHIVE_NAME = 'archived.json'
+
+_SQL_OPERATIONS = {
+    'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'BEGIN', 'COMMIT', 'ROLLBACK',
+    'SAVEPOINT', 'RELEASE', 'PRAGMA', 'CREATE', 'DROP', 'ALTER',
+}
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            values = self.registry.values(self.name)
+            values[key] = values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            values = self.registry.values(self.name)
+            values[key] = values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.registry.values(self.name)[key] = value
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            values = self.registry.values(self.name)
+            # Per-bucket (non-cumulative) counts, then sum and count
+            state = values.get(key)
+            if state is None:
+                state = values[key] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+class Registry:
+    """Process-local metric values, optionally shared through a directory.
+
+    With ``directory`` set, every process writes its values to
+    ``<directory>/<pid>.json`` (at most once per ``flush_interval`` seconds
+    and at exit) and a scrape merges all of them, so any gunicorn worker
+    can answer ``/metrics`` for the whole server. Counters and histograms
+    of exited workers keep counting towards the totals: a scrape folds
+    their files into ``archived.json`` and removes them, so dead or
+    recycled workers do not pile up. Gauges only include live processes.
+    """
+
+    def __init__(self, directory=None, flush_interval=None):
+        self.directory = config.METRICS_DIR if directory is None else directory
+        self.flush_interval = config.METRICS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._values = {}
+        self._pid = os.getpid()
+        self._last_flush = 0.0
+        self._flushed = False
+
+    def _register(self, cls, name, help_text, labelnames, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self, name, help_text, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def values(self, name):
+        """Value map of one metric; call with ``lock`` held."""
+        if self._pid != os.getpid():
+            # Forked worker: the parent's values are its own, not ours
+            self._pid = os.getpid()
+            self._values = {}
+            self._last_flush = 0.0
+            self._flushed = False
+        values = self._values.get(name)
+        if values is None:
+            values = self._values[name] = {}
+        return values
+
+    def snapshot(self):
+        """This process's values in a JSON-friendly form."""
+        with self.lock:
+            if self._pid != os.getpid():
+                return {}
+            return {
+                name: [[list(key), list(value) if isinstance(value, list) else value]
+                       for key, value in values.items()]
+                for name, values in self._values.items()
+            }
+
+    def flush(self, force=False):
+        """Write this process's values for the other workers to read."""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            if not self._flushed and os.path.exists(path):
+                # Left by an exited process whose pid we were given
+                self._archive([path])
+            self._flushed = True
+            temp_path = f'{path}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+    @contextmanager
+    def _directory_lock(self, exclusive):
+        """Readers share the directory; archiving has it to itself."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'archive.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _snapshots(self):
+        """Yield ``(pid, snapshot)`` for every known process; the archive has pid None."""
+        pid = os.getpid()
+        yield pid, self.snapshot()
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        with self._directory_lock(exclusive=False):
+            archived = self._read(os.path.join(self.directory, ARCHIVE_NAME))
+            others = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    other = int(entry.name[:-5])
+                except ValueError:
+                    continue
+                if other == pid:
+                    continue
+                snapshot = self._read(entry.path)
+                if snapshot is not None:
+                    others.append((other, snapshot))
+        if archived is not None:
+            yield None, archived
+        yield from others
+
+    def _merge(self, merged, snapshot, gauges=True):
+        """Add one snapshot's values to ``merged`` (``{name: {label_key: value}}``)."""
+        for name, samples in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.kind == 'gauge' and not gauges):
+                continue
+            target = merged.setdefault(name, {})
+            for key, value in samples:
+                key = tuple(key)
+                if metric.kind == 'histogram':
+                    current = target.get(key)
+                    target[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target[key] = target.get(key, 0) + value
+
+    def _archive(self, paths):
+        """Fold the snapshot files of exited processes into ``archived.json``."""
+        if fcntl is None or not paths:
+            return
+        archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+        try:
+            with self._directory_lock(exclusive=True):
+                merged = {}
+                self._merge(merged, self._read(archive_path) or {}, gauges=False)
+                done = []
+                for path in paths:
+                    # Gone if another worker archived it first
+                    snapshot = self._read(path)
+                    if snapshot is not None:
+                        self._merge(merged, snapshot, gauges=False)
+                        done.append(path)
+                if not done:
+                    return
+                temp_path = f'{archive_path}.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump({name: [[list(key), value] for key, value in values.items()]
+                               for name, values in merged.items()}, f)
+                os.replace(temp_path, archive_path)
+                for path in done:
+                    os.remove(path)
+        except OSError as e:
+            print(f"Error archiving metrics: {e}")
+
+    def collect(self):
+        """Merge every process's values: ``{name: {label_key: value}}``."""
+        merged = {}
+        exited = []
+        for pid, snapshot in self._snapshots():
+            alive = pid is not None and _pid_alive(pid)
+            self._merge(merged, snapshot, gauges=alive)
+            if pid is not None and not alive:
+                exited.append(os.path.join(self.directory, f'{pid}.json'))
+        # Already counted above; later scrapes read them from the archive
+        self._archive(exited)
+        return merged
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        self.flush(force=True)
+        merged = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, key))
+                if metric.kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels + [("le", _format_value(bound))])} {cumulative}')
+                cumulative += value[len(metric.buckets)]
+                lines.append(f'{name}_bucket{_format_labels(labels + [("le", "+Inf")])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+REGISTRY = Registry()
+atexit.register(lambda: REGISTRY.flush(force=True))
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'localdrive_http_requests_total', 'HTTP requests handled.', ('route', 'method', 'status'))
+HTTP_DURATION = REGISTRY.histogram(
+    'localdrive_http_request_duration_seconds', 'Time to handle a request, including the response body.',
+    ('route', 'method'))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'localdrive_http_requests_in_flight', 'Requests currently being handled.')
+HTTP_RECEIVED_BYTES = REGISTRY.counter(
+    'localdrive_http_request_bytes_total', 'Request body bytes received.', ('route',))
+HTTP_SENT_BYTES = REGISTRY.counter(
+    'localdrive_http_response_bytes_total', 'Response body bytes sent.', ('route',))
+SQL_DURATION = REGISTRY.histogram(
+    'localdrive_sql_query_duration_seconds', 'SQLite statement execution time.',
+    ('db', 'operation'), buckets=SQL_BUCKETS)
+TRANSFER_BYTES = REGISTRY.counter(
+    'localdrive_transfer_bytes_total', 'File bytes uploaded or downloaded.', ('direction',))
+TRANSFER_FILES = REGISTRY.counter(
+    'localdrive_transfer_files_total', 'Files uploaded or downloaded.', ('direction',))
+KDF_DURATION = REGISTRY.histogram(
+    'localdrive_kdf_duration_seconds', 'Password hashing and verification time.', ('operation',))
+KDF_REJECTED = REGISTRY.counter(
+    'localdrive_kdf_rejected_total', 'Password hashing requests shed under overload.')
+UPLOADS_ACTIVE = REGISTRY.gauge(
+    'localdrive_uploads_in_progress', 'Uploads admitted and still running.')
+UPLOADS_QUEUED = REGISTRY.gauge(
+    'localdrive_uploads_queued', 'Uploads waiting for an upload slot.')
+UPLOAD_QUEUE_WAIT = REGISTRY.histogram(
+    'localdrive_upload_queue_wait_seconds', 'Time uploads waited for an upload slot.')
+UPLOADS_REJECTED = REGISTRY.counter(
+    'localdrive_uploads_rejected_total', 'Uploads refused before their body was read.', ('reason',))
+
+def record_sql(db, sql, seconds):
+    """Time one statement, logging it when it crosses the slow-query threshold."""
+    words = sql.lstrip().split(None, 1)
+    operation = words[0].upper() if words else 'OTHER'
+    if operation not in _SQL_OPERATIONS:
+        operation = 'OTHER'
+    SQL_DURATION.observe(seconds, db=db, operation=operation)
+    if config.SLOW_QUERY_MS and seconds * 1000 >= config.SLOW_QUERY_MS:
+        print(f"Slow query ({seconds * 1000:.1f} ms, {db}): {' '.join(sql.split())}")
+
+def record_transfer(direction, size):
+    TRANSFER_BYTES.inc(size, direction=direction)
+    TRANSFER_FILES.inc(direction=direction)
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports the execution time of each statement."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_sql(self.connection.metrics_db, sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_sql(self.connection.metrics_db, sql, time.perf_counter() - start)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection factory whose statements and commits are timed.
+
+    Timing covers execution up to the first result row; fetching the rest
+    of a large result set is not included.
+    """
+
+    metrics_db = 'unknown'
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            record_sql(self.metrics_db, 'COMMIT', time.perf_counter() - start)
@@ -0,0 +1,209 @@
+import os
+import sqlite3
+
+from utils.search import index_filenames
+
+class Migration:
+    """A single schema change, applied once and recorded in PRAGMA user_version."""
+
+    def __init__(self, version, description, steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+    def apply(self, conn):
+        for step in self.steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(step)
+
+def _dedupe_filenames(conn):
+    """Rename duplicate (user_email, filename) rows so the unique index can be built."""
+    duplicates = conn.execute('''
+        SELECT f.id, f.filename
+        FROM files f
+        WHERE EXISTS (
+            SELECT 1 FROM files o
+            WHERE o.user_email = f.user_email
+              AND o.filename = f.filename
+              AND o.id < f.id
+        )
+    ''').fetchall()
+    for file_id, filename in duplicates:
+        stem, ext = os.path.splitext(filename)
+        conn.execute(
+            'UPDATE files SET filename = ? WHERE id = ?',
+            (f'{stem} ({file_id}){ext}', file_id)
+        )
+
+FILES_MIGRATIONS = [
+    Migration(1, 'create files table', [
+        '''
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_email TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            upload_date TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            FOREIGN KEY (user_email) REFERENCES users (email)
+        )
+        ''',
+    ]),
+    Migration(2, 'index files by owner and enforce unique filenames per user', [
+        _dedupe_filenames,
+        'CREATE INDEX IF NOT EXISTS idx_files_user_date ON files (user_email, upload_date)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_files_user_filename ON files (user_email, filename)',
+    ]),
+    Migration(3, 'content-addressed blobs with reference counts', [
+        '''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'ALTER TABLE files ADD COLUMN blob_sha256 TEXT REFERENCES blobs (sha256)',
+        'CREATE INDEX IF NOT EXISTS idx_files_blob ON files (blob_sha256)',
+    ]),
+    Migration(4, 'full-text index over filenames and PDF contents', [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS file_text USING fts5 (
+            owner, filename, content,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        ''',
+        index_filenames,
+    ]),
+    Migration(5, 'per-user storage quotas and usage counters', [
+        '''
+        CREATE TABLE IF NOT EXISTS user_usage (
+            user_email TEXT PRIMARY KEY,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            files INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_quotas (
+            user_email TEXT PRIMARY KEY,
+            max_bytes INTEGER,
+            max_files INTEGER
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT OR REPLACE INTO user_usage (user_email, bytes, files)
+        SELECT user_email, SUM(file_size), COUNT(*) FROM files GROUP BY user_email
+        ''',
+    ]),
+    Migration(6, 'soft delete with a trash', [
+        'ALTER TABLE files ADD COLUMN deleted_at TEXT',
+        # Live listings and name uniqueness only cover files not in the trash
+        'DROP INDEX IF EXISTS idx_files_user_date',
+        'CREATE INDEX idx_files_user_date ON files (user_email, upload_date) WHERE deleted_at IS NULL',
+        'DROP INDEX IF EXISTS idx_files_user_filename',
+        'CREATE UNIQUE INDEX idx_files_user_filename ON files (user_email, filename) WHERE deleted_at IS NULL',
+        'CREATE INDEX idx_files_user_trash ON files (user_email, deleted_at) WHERE deleted_at IS NOT NULL',
+        'CREATE INDEX idx_files_deleted_at ON files (deleted_at) WHERE deleted_at IS NOT NULL',
+    ]),
+    Migration(7, 'per-user change feed for live listings', [
+        # AUTOINCREMENT keeps sequence numbers from being reused after pruning
+        '''
+        CREATE TABLE file_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_email TEXT NOT NULL,
+            file_id INTEGER NOT NULL,
+            changed_at TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX idx_file_changes_user_seq ON file_changes (user_email, seq)',
+    ]),
+    Migration(8, 'PDF metadata extracted after upload', [
+        'ALTER TABLE files ADD COLUMN page_count INTEGER',
+        'ALTER TABLE files ADD COLUMN title TEXT',
+        'ALTER TABLE files ADD COLUMN author TEXT',
+        # Finds files still waiting for processing without a scan
+        'CREATE INDEX idx_files_unprocessed ON files (id) WHERE page_count IS NULL',
+    ]),
+    Migration(9, 'find unreferenced blobs without a scan', [
+        'CREATE INDEX idx_blobs_unreferenced ON blobs (sha256) WHERE ref_count <= 0',
+    ]),
+]
+
+USERS_MIGRATIONS = [
+    Migration(1, 'create users table', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    Migration(2, 'index users by creation date', [
+        'CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)',
+    ]),
+    Migration(3, 'server-side sessions', [
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_email TEXT,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_email)',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)',
+    ]),
+]
+
+def get_version(conn):
+    """Return the schema version recorded in the database."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def latest_version(migrations):
+    return max((m.version for m in migrations), default=0)
+
+def pending(conn, migrations):
+    """Migrations that have not been applied yet."""
+    current = get_version(conn)
+    return [m for m in sorted(migrations, key=lambda m: m.version) if m.version > current]
+
+def migrate(pool, migrations):
+    """Apply pending migrations in order, each in its own write transaction.
+
+    Safe to call from several processes at once: the version is re-read after
+    taking the write lock, so a migration applied by another worker is skipped.
+    Returns the list of migrations applied by this call.
+    """
+    applied = []
+    with pool.connection() as conn:
+        if not pending(conn, migrations):
+            return applied
+        for migration in sorted(migrations, key=lambda m: m.version):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if migration.version <= get_version(conn):
+                    conn.rollback()
+                    continue
+                migration.apply(conn)
+                conn.execute(f'PRAGMA user_version = {int(migration.version)}')
+                conn.commit()
+                applied.append(migration)
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+    return applied
+
+def status(pool, migrations):
+    """Describe the schema state of a database without changing it."""
+    with pool.connection() as conn:
+        return {
+            'db_path': pool.db_path,
+            'version': get_version(conn),
+            'latest': latest_version(migrations),
+            'pending': [(m.version, m.description) for m in pending(conn, migrations)],
+        }
@@ -0,0 +1,212 @@
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from utils import config, metrics
+
+SCHEMES = ('scrypt', 'pbkdf2-sha256')
+
+_LEGACY_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+_SALT_BYTES = 16
+_KEY_BYTES = 32
+
+class HasherBusy(Exception):
+    """Raised when password hashing is saturated and the request should back off."""
+
+    def __init__(self, retry_after=1):
+        super().__init__("The server is busy processing sign-ins, please try again shortly")
+        self.retry_after = retry_after
+
+def _b64encode(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt needs 128 * n * r bytes; leave headroom over hashlib's 32 MB default
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=_KEY_BYTES)
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, dklen=_KEY_BYTES)
+
+def hash_password(password, scheme=None):
+    """Hash a password with the configured KDF and a random salt.
+
+    Hashes are self-describing (``$scheme$params$salt$key``), so the cost
+    can be raised later without invalidating existing ones.
+    """
+    scheme = scheme or config.PASSWORD_SCHEME
+    salt = os.urandom(_SALT_BYTES)
+    if scheme == 'scrypt':
+        n, r, p = config.SCRYPT_N, config.SCRYPT_R, config.SCRYPT_P
+        key = _scrypt(password, salt, n, r, p)
+        return f'$scrypt$n={n},r={r},p={p}${_b64encode(salt)}${_b64encode(key)}'
+    if scheme == 'pbkdf2-sha256':
+        iterations = config.PBKDF2_ITERATIONS
+        key = _pbkdf2(password, salt, iterations)
+        return f'$pbkdf2-sha256$i={iterations}${_b64encode(salt)}${_b64encode(key)}'
+    raise ValueError(f"Unknown password scheme: {scheme}")
+
+def _parse(stored_hash):
+    """Split a versioned hash into ``(scheme, params, salt, key)``."""
+    _, scheme, params, salt, key = stored_hash.split('$')
+    params = dict(item.split('=', 1) for item in params.split(','))
+    return scheme, {name: int(value) for name, value in params.items()}, _b64decode(salt), _b64decode(key)
+
+def verify_password(password, stored_hash):
+    """Check a password against a versioned or legacy SHA-256 hash."""
+    if not stored_hash:
+        return False
+    if _LEGACY_SHA256_RE.match(stored_hash):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored_hash)
+    try:
+        scheme, params, salt, key = _parse(stored_hash)
+        if scheme == 'scrypt':
+            candidate = _scrypt(password, salt, params['n'], params['r'], params['p'])
+        elif scheme == 'pbkdf2-sha256':
+            candidate = _pbkdf2(password, salt, params['i'])
+        else:
+            return False
+    except (ValueError, KeyError):
+        return False
+    return hmac.compare_digest(candidate, key)
+
+def is_supported_hash(stored_hash):
+    """Whether a stored hash (e.g. from an export) is in a format ``verify_password`` accepts."""
+    if not stored_hash:
+        return False
+    if _LEGACY_SHA256_RE.match(stored_hash):
+        return True
+    try:
+        scheme, params, _, _ = _parse(stored_hash)
+    except (ValueError, KeyError):
+        return False
+    if scheme == 'scrypt':
+        return {'n', 'r', 'p'} <= params.keys()
+    return scheme == 'pbkdf2-sha256' and 'i' in params
+
+def needs_rehash(stored_hash):
+    """Whether a hash uses a legacy format or other than the configured cost."""
+    if not stored_hash or _LEGACY_SHA256_RE.match(stored_hash):
+        return True
+    try:
+        scheme, params, _, _ = _parse(stored_hash)
+    except (ValueError, KeyError):
+        return True
+    if scheme != config.PASSWORD_SCHEME:
+        return True
+    if scheme == 'scrypt':
+        return params != {'n': config.SCRYPT_N, 'r': config.SCRYPT_R, 'p': config.SCRYPT_P}
+    return params != {'i': config.PBKDF2_ITERATIONS}
+
+class HashingPool:
+    """Bounded executor for KDF work with admission control.
+
+    At most ``workers`` hashes run at once (hashlib's KDFs release the GIL,
+    so they overlap with request handling) and at most ``max_queue`` wait.
+    Anything beyond that, or a wait longer than ``timeout`` seconds, raises
+    HasherBusy immediately instead of tying up the calling worker thread.
+    """
+
+    def __init__(self, workers=None, max_queue=None, timeout=None):
+        self.workers = workers or config.KDF_WORKERS
+        self.max_queue = config.KDF_MAX_QUEUE if max_queue is None else max_queue
+        self.timeout = (config.KDF_TIMEOUT_MS if timeout is None else timeout * 1000) / 1000.0
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        # Recreated after fork so each gunicorn worker has its own threads
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='kdf')
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, fn, *args):
+        """Run ``fn(*args)`` on the pool, or raise HasherBusy under overload."""
+        if not self._slots.acquire(blocking=False):
+            self._reject()
+        try:
+            future = self._get_executor().submit(self._timed, fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Let it finish in the background; its slot frees when it does
+            future.cancel()
+            self._reject()
+        self.completed += 1
+        return result
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            metrics.KDF_DURATION.observe(time.perf_counter() - start, operation=fn.__name__)
+
+    def _reject(self):
+        self.rejected += 1
+        metrics.KDF_REJECTED.inc()
+        raise HasherBusy(retry_after=max(1, round(self.timeout)))
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+hashing_pool = HashingPool()
+
+def calibrate(target_ms, scheme=None, samples=3):
+    """Find the KDF cost whose hash takes about ``target_ms`` on this machine.
+
+    Returns ``(params, measured_ms)``: scrypt doubles ``n`` (keeping r and p
+    from the config) until the target is reached; PBKDF2 scales iterations
+    linearly from a short probe.
+    """
+    scheme = scheme or config.PASSWORD_SCHEME
+    salt = os.urandom(_SALT_BYTES)
+
+    def timed(fn, *args):
+        best = None
+        for _ in range(samples):
+            start = time.perf_counter()
+            fn(*args)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    if scheme == 'scrypt':
+        r, p = config.SCRYPT_R, config.SCRYPT_P
+        n = 2 ** 10
+        elapsed = timed(_scrypt, 'calibration', salt, n, r, p)
+        while elapsed < target_ms and n < 2 ** 22:
+            n *= 2
+            elapsed = timed(_scrypt, 'calibration', salt, n, r, p)
+        return {'n': n, 'r': r, 'p': p}, elapsed
+    if scheme == 'pbkdf2-sha256':
+        probe = 50000
+        per_iteration = timed(_pbkdf2, 'calibration', salt, probe) / probe
+        iterations = max(100000, int(target_ms / per_iteration) // 1000 * 1000)
+        return {'i': iterations}, timed(_pbkdf2, 'calibration', salt, iterations)
+    raise ValueError(f"Unknown password scheme: {scheme}")
@@ -0,0 +1,69 @@
+import os
+import random
+import threading
+import time
+
+from utils import config
+
+class TrashPurger:
+    """Daemon thread that permanently deletes expired trash.
+
+    Every ``interval`` seconds it runs ``FileManager.purge_deleted``, which
+    removes rows and blobs in short batched transactions, so the unlinking
+    never happens on a request thread. Started lazily and restarted after a
+    fork; with several workers each one runs a purger, and the batches are
+    safe to race because a row is only released by whoever deletes it.
+    """
+
+    def __init__(self, file_manager, interval=None):
+        self.file_manager = file_manager
+        self.interval = config.PURGE_INTERVAL if interval is None else interval
+        self.last_run = None
+        self.last_purged = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the thread in this process if it is not running yet."""
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='trash-purger', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def run_once(self):
+        """Purge everything past the retention period; returns the count.
+
+        Old entries of the listing change feed, and blobs left unreferenced
+        by an interrupted purge, are dropped on the same schedule.
+        """
+        purged = self.file_manager.purge_deleted()
+        self.file_manager.remove_unreferenced_blobs()
+        self.file_manager.prune_changes()
+        self.last_run = time.time()
+        self.last_purged = purged
+        return purged
+
+    def _run(self):
+        # Spread workers out so they do not all purge at the same moment
+        time.sleep(random.uniform(0, min(self.interval, 60)))
+        while True:
+            try:
+                purged = self.run_once()
+                if purged:
+                    print(f"Purged {purged} files from the trash")
+            except Exception as e:
+                print(f"Error purging trash: {e}")
+            time.sleep(self.interval)
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'retention_days': config.TRASH_RETENTION_DAYS,
+            'last_run': self.last_run,
+            'last_purged': self.last_purged,
+        }
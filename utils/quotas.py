@@ -0,0 +1,140 @@
+import re
+
+from utils import config
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)I?B?\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+QUOTA_EXCEEDED = "Storage quota exceeded"
+FILE_LIMIT_REACHED = "File limit reached"
+
+def parse_size(text):
+    """Parse ``'500MB'``, ``'2 GB'``, ``'1048576'`` etc. into bytes."""
+    match = _SIZE_RE.match(text)
+    if not match:
+        raise ValueError(f"Invalid size: {text}")
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.upper()])
+
+def is_quota_error(message):
+    """Whether a failure message came from a quota check."""
+    return message == QUOTA_EXCEEDED or message.startswith(FILE_LIMIT_REACHED)
+
+class QuotaManager:
+    """Per-user storage limits backed by incrementally maintained counters.
+
+    ``user_usage`` holds each user's byte and file totals and is updated by
+    FileManager in the same transaction that adds or removes a file row, so
+    checking a quota is a primary-key lookup rather than a scan of
+    ``files``. Limits live in ``user_quotas``; a NULL limit falls back to
+    the configured default, and 0 means unlimited.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def charge(self, cursor, user_email, size, files=1):
+        """Adjust a user's usage inside the caller's transaction."""
+        cursor.execute('''
+            INSERT INTO user_usage (user_email, bytes, files) VALUES (?, ?, ?)
+            ON CONFLICT (user_email) DO UPDATE SET
+                bytes = bytes + excluded.bytes,
+                files = files + excluded.files
+        ''', (user_email, size, files))
+
+    def _limits(self, cursor, user_email):
+        cursor.execute('''
+            SELECT COALESCE(u.bytes, 0), COALESCE(u.files, 0), q.max_bytes, q.max_files
+            FROM (SELECT ? AS user_email) k
+            LEFT JOIN user_usage u ON u.user_email = k.user_email
+            LEFT JOIN user_quotas q ON q.user_email = k.user_email
+        ''', (user_email,))
+        used_bytes, used_files, max_bytes, max_files = cursor.fetchone()
+        if max_bytes is None:
+            max_bytes = config.DEFAULT_QUOTA_BYTES
+        if max_files is None:
+            max_files = config.DEFAULT_QUOTA_FILES
+        return used_bytes, used_files, max_bytes, max_files
+
+    def check(self, cursor, user_email, size, files=1):
+        """Whether ``files`` more files totalling ``size`` bytes fit.
+
+        Returns ``(ok, message)``. Called with the write lock held during
+        inserts, so concurrent uploads cannot overshoot the limit together.
+        """
+        used_bytes, used_files, max_bytes, max_files = self._limits(cursor, user_email)
+        if max_files and used_files + files > max_files:
+            return False, f"{FILE_LIMIT_REACHED} ({max_files} files)"
+        if max_bytes and used_bytes + size > max_bytes:
+            return False, QUOTA_EXCEEDED
+        return True, "OK"
+
+    def precheck(self, user_email, size, files=1):
+        """Cheap check before an upload's bytes are accepted."""
+        with self.pool.connection() as conn:
+            return self.check(conn.cursor(), user_email, size, files)
+
+    def usage(self, user_email):
+        """Usage and limits for display; a limit of 0 means unlimited."""
+        with self.pool.connection() as conn:
+            used_bytes, used_files, max_bytes, max_files = self._limits(conn.cursor(), user_email)
+        return {
+            'bytes': used_bytes,
+            'files': used_files,
+            'max_bytes': max_bytes,
+            'max_files': max_files,
+        }
+
+    def set_quota(self, user_email, max_bytes=None, max_files=None):
+        """Set a user's limits; None restores the default, 0 is unlimited."""
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO user_quotas (user_email, max_bytes, max_files) VALUES (?, ?, ?)
+                ON CONFLICT (user_email) DO UPDATE SET
+                    max_bytes = excluded.max_bytes,
+                    max_files = excluded.max_files
+            ''', (user_email, max_bytes, max_files))
+            conn.commit()
+
+    def recompute(self, batch_size=100, progress=None):
+        """Rebuild every usage counter from ``files``, a batch of users at a time.
+
+        Each batch is its own short write transaction, so uploads are only
+        held up briefly. Returns the number of users recomputed.
+        """
+        done = 0
+        last_user = ''
+        while True:
+            with self.pool.connection() as conn:
+                users = [row[0] for row in conn.execute('''
+                    SELECT DISTINCT user_email FROM files
+                    WHERE user_email > ? ORDER BY user_email LIMIT ?
+                ''', (last_user, batch_size))]
+                if not users:
+                    break
+                last_user = users[-1]
+
+                conn.execute('BEGIN IMMEDIATE')
+                for user_email in users:
+                    conn.execute('''
+                        INSERT INTO user_usage (user_email, bytes, files)
+                        SELECT ?, COALESCE(SUM(file_size), 0), COUNT(*)
+                        FROM files WHERE user_email = ?
+                        ON CONFLICT (user_email) DO UPDATE SET
+                            bytes = excluded.bytes,
+                            files = excluded.files
+                    ''', (user_email, user_email))
+                conn.commit()
+
+            done += len(users)
+            if progress:
+                progress(done)
+
+        # Counters for users who no longer own anything
+        with self.pool.connection() as conn:
+            conn.execute('''
+                DELETE FROM user_usage
+                WHERE NOT EXISTS (SELECT 1 FROM files f WHERE f.user_email = user_usage.user_email)
+            ''')
+            conn.commit()
+        return done
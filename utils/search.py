@@ -0,0 +1,232 @@
+import hashlib
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from markupsafe import escape
+
+from utils import config
+
+# Sentinels wrapped around matches by snippet(); replaced after HTML-escaping
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def owner_token(user_email):
+    """Opaque per-user token stored in the FTS owner column.
+
+    Matching on it lets FTS5 intersect a user's documents with the query
+    terms inside the index instead of filtering rows afterwards.
+    """
+    return 'u' + hashlib.sha1(user_email.lower().encode()).hexdigest()[:20]
+
+def build_match_query(user_email, query):
+    """Turn free text into an FTS5 MATCH expression scoped to one user.
+
+    Every word must match; the last one is treated as a prefix so results
+    update while the user is still typing.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens[:-1]]
+    terms.append(f'"{tokens[-1]}"*')
+    return f'owner:"{owner_token(user_email)}" AND {{filename content}}: ({" ".join(terms)})'
+
+def index_filenames(conn):
+    """Index every file's name (content is filled in by extraction)."""
+    conn.create_function('owner_token', 1, owner_token, deterministic=True)
+    conn.execute('''
+        INSERT OR REPLACE INTO file_text (rowid, owner, filename, content)
+        SELECT id, owner_token(user_email), filename, '' FROM files
+    ''')
+
+def highlight(snippet):
+    """HTML-escape a snippet and turn match sentinels into <mark> tags."""
+    if not snippet or _MARK_START not in snippet:
+        return ''
+    html = str(escape(snippet))
+    return html.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+def extract_pdf_text(path, max_chars=None):
+    """Extract plain text from a PDF (runs in a worker process).
+
+    Returns an empty string when pypdf is not installed or the document
+    cannot be parsed; the file stays searchable by name either way.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return ''
+
+    max_chars = max_chars or config.SEARCH_MAX_CHARS
+    parts = []
+    total = 0
+    try:
+        reader = PdfReader(path)
+        for page in reader.pages:
+            text = page.extract_text() or ''
+            parts.append(text)
+            total += len(text)
+            if total >= max_chars:
+                break
+    except Exception:
+        return ''
+    return '\n'.join(parts)[:max_chars]
+
+def extract_stored_text(file_path, storage_key=None, max_chars=None):
+    """Extract text from a local file, or from a blob fetched from the
+    configured storage backend when ``storage_key`` is given (worker process).
+    """
+    if storage_key is None:
+        return extract_pdf_text(file_path, max_chars)
+    from utils.storage import get_storage
+    try:
+        with get_storage().local_copy(storage_key) as path:
+            return extract_pdf_text(path, max_chars)
+    except Exception:
+        return ''
+
+class SearchIndex:
+    """FTS5 index over filenames and extracted PDF text.
+
+    Filenames are indexed synchronously with the file row; document text
+    is extracted in a process pool after the upload returns and written to
+    the index when the worker finishes.
+    """
+
+    def __init__(self, pool, workers=None, on_indexed=None, locate=None):
+        self.pool = pool
+        self.workers = workers or config.SEARCH_WORKERS
+        self.on_indexed = on_indexed
+        # Maps a row's (file_path, blob_sha256) to extract_stored_text arguments
+        self.locate = locate or (lambda file_path, sha256: (file_path, None))
+        # Bulk loaders turn this off and run a reindex afterwards
+        self.extract_on_add = config.SEARCH_EXTRACT_ON_ADD
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so each gunicorn worker gets its own pool after fork
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def add(self, cursor, file_id, user_email, filename):
+        """Index a filename inside the caller's transaction."""
+        cursor.execute(
+            'INSERT OR REPLACE INTO file_text (rowid, owner, filename, content) VALUES (?, ?, ?, ?)',
+            (file_id, owner_token(user_email), filename, '')
+        )
+
+    def remove(self, cursor, file_id):
+        """Drop a file's index entry inside the caller's transaction."""
+        cursor.execute('DELETE FROM file_text WHERE rowid = ?', (file_id,))
+
+    def schedule_extraction(self, file_id, file_path, storage_key=None):
+        """Extract a document's text in the background."""
+        if not self.extract_on_add:
+            return None
+        try:
+            future = self._get_executor().submit(extract_stored_text, file_path, storage_key)
+        except (BrokenProcessPool, RuntimeError):
+            self._reset_executor()
+            future = self._get_executor().submit(extract_stored_text, file_path, storage_key)
+        future.add_done_callback(lambda f: self._store_text(file_id, f))
+        return future
+
+    def _store_text(self, file_id, future):
+        try:
+            text = future.result()
+        except Exception as e:
+            print(f"Error extracting text for file {file_id}: {e}")
+            return
+        if not text:
+            return
+        self.set_text(file_id, text)
+
+    def set_text(self, file_id, text):
+        """Store extracted text; a no-op if the file was deleted meanwhile."""
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('UPDATE file_text SET content = ? WHERE rowid = ?', (text, file_id))
+                conn.commit()
+            if self.on_indexed:
+                self.on_indexed(file_id)
+        except Exception as e:
+            print(f"Error indexing file {file_id}: {e}")
+
+    def search(self, user_email, query, limit=50):
+        """Ranked matches for a user's query.
+
+        Returns rows of ``(id, filename, upload_date, file_size, snippet_html)``.
+        """
+        match = build_match_query(user_email, query)
+        if not match:
+            return []
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT f.id, f.filename, f.upload_date, f.file_size,
+                       snippet(file_text, 2, '{_MARK_START}', '{_MARK_END}', '…', 16)
+                FROM file_text
+                JOIN files f ON f.id = file_text.rowid
+                WHERE file_text MATCH ? AND f.deleted_at IS NULL
+                ORDER BY bm25(file_text, 0.0, 10.0, 1.0)
+                LIMIT ?
+            ''', (match, limit)).fetchall()
+        return [row[:4] + (highlight(row[4]),) for row in rows]
+
+    def reindex(self, batch_size=200, progress=None):
+        """Rebuild the whole index, extracting text in the worker pool.
+
+        Returns the number of files indexed.
+        """
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM file_text')
+            index_filenames(conn)
+            conn.commit()
+            total = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+        executor = self._get_executor()
+        done = 0
+        last_id = 0
+        while True:
+            with self.pool.connection() as conn:
+                batch = conn.execute('''
+                    SELECT id, file_path, blob_sha256 FROM files
+                    WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_id, batch_size)).fetchall()
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            sources = [self.locate(row[1], row[2]) for row in batch]
+            texts = executor.map(extract_stored_text, *zip(*sources))
+            with self.pool.connection() as conn:
+                for (file_id, _, _), text in zip(batch, texts):
+                    conn.execute(
+                        'UPDATE file_text SET content = ? WHERE rowid = ?',
+                        (text, file_id)
+                    )
+                conn.commit()
+
+            done += len(batch)
+            if progress:
+                progress(done, total)
+        return done
+
+    def shutdown(self):
+        self._reset_executor()
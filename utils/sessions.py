@@ -0,0 +1,330 @@
+import hashlib
+import json
+import secrets
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from utils import config
+from utils.db import get_pool
+
+BACKENDS = ('sqlite', 'redis', 'memory', 'cookie')
+
+def _digest(token):
+    """Stores only see a hash of the cookie value, so a leaked table is no use."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class SQLiteSessionStore:
+    """Sessions in the users database, shared by every worker process."""
+
+    def __init__(self, db_path=None):
+        self.pool = get_pool(db_path or config.USERS_DATABASE_PATH)
+        self._last_cleanup = 0.0
+
+    def load(self, sid):
+        """``(data, expires_at)`` of a live session, or None."""
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?',
+                (sid, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save(self, sid, user_email, data, expires_at):
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO sessions (id, user_email, data, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    user_email = excluded.user_email,
+                    data = excluded.data,
+                    expires_at = excluded.expires_at
+            ''', (sid, user_email, json.dumps(data), now, expires_at))
+            conn.commit()
+        self.cleanup_if_due()
+
+    def touch(self, sid, expires_at):
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE sessions SET expires_at = ? WHERE id = ?', (expires_at, sid))
+            conn.commit()
+
+    def delete(self, sid):
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+            conn.commit()
+
+    def revoke_user(self, user_email):
+        """End every session of a user; returns how many there were."""
+        with self.pool.connection() as conn:
+            count = conn.execute('DELETE FROM sessions WHERE user_email = ?', (user_email,)).rowcount
+            conn.commit()
+        return count
+
+    def list_user(self, user_email):
+        """``(id, created_at, expires_at)`` of a user's live sessions."""
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT id, created_at, expires_at FROM sessions
+                WHERE user_email = ? AND expires_at > ?
+                ORDER BY created_at DESC
+            ''', (user_email, time.time())).fetchall()
+
+    def cleanup(self):
+        """Delete expired sessions; returns how many were removed."""
+        with self.pool.connection() as conn:
+            count = conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+            conn.commit()
+        return count
+
+    def cleanup_if_due(self):
+        """Run ``cleanup`` at most once an hour per process."""
+        now = time.monotonic()
+        if now - self._last_cleanup < 3600:
+            return
+        self._last_cleanup = now
+        try:
+            self.cleanup()
+        except Exception as e:
+            print(f"Error cleaning up sessions: {e}")
+
+class RedisSessionStore:
+    """Sessions in Redis (or any server speaking its protocol).
+
+    Each session is a key with a TTL, so expiry needs no cleanup; a set per
+    user tracks session ids for revocation.
+    """
+
+    def __init__(self, url=None, prefix='localdrive:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis session backend requires redis (pip install redis)")
+        self.client = redis.Redis.from_url(url or config.SESSION_REDIS_URL)
+        self.prefix = prefix
+
+    def _key(self, sid):
+        return f'{self.prefix}session:{sid}'
+
+    def _user_key(self, user_email):
+        return f'{self.prefix}user-sessions:{user_email}'
+
+    def load(self, sid):
+        raw = self.client.get(self._key(sid))
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        return record['data'], record['expires_at']
+
+    def save(self, sid, user_email, data, expires_at):
+        record = {'user': user_email, 'data': data, 'created_at': time.time(), 'expires_at': expires_at}
+        ttl = max(1, int(expires_at - time.time()))
+        pipe = self.client.pipeline()
+        pipe.set(self._key(sid), json.dumps(record), ex=ttl)
+        if user_email:
+            pipe.sadd(self._user_key(user_email), sid)
+            pipe.expire(self._user_key(user_email), ttl)
+        pipe.execute()
+
+    def touch(self, sid, expires_at):
+        raw = self.client.get(self._key(sid))
+        if raw is None:
+            return
+        record = json.loads(raw)
+        record['expires_at'] = expires_at
+        self.client.set(self._key(sid), json.dumps(record), ex=max(1, int(expires_at - time.time())))
+
+    def delete(self, sid):
+        self.client.delete(self._key(sid))
+
+    def revoke_user(self, user_email):
+        sids = [sid.decode() for sid in self.client.smembers(self._user_key(user_email))]
+        count = self.client.delete(*[self._key(sid) for sid in sids]) if sids else 0
+        self.client.delete(self._user_key(user_email))
+        return count
+
+    def list_user(self, user_email):
+        sessions = []
+        for sid in self.client.smembers(self._user_key(user_email)):
+            sid = sid.decode()
+            raw = self.client.get(self._key(sid))
+            if raw is None:
+                self.client.srem(self._user_key(user_email), sid)
+                continue
+            record = json.loads(raw)
+            sessions.append((sid, record['created_at'], record['expires_at']))
+        return sorted(sessions, key=lambda s: s[1], reverse=True)
+
+    def cleanup(self):
+        return 0
+
+class MemorySessionStore:
+    """In-process store with the same behaviour, for tests and single-process runs."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        record = self._sessions.get(sid)
+        if record is None or record['expires_at'] <= time.time():
+            return None
+        return json.loads(record['data']), record['expires_at']
+
+    def save(self, sid, user_email, data, expires_at):
+        with self._lock:
+            created_at = self._sessions.get(sid, {}).get('created_at', time.time())
+            self._sessions[sid] = {'user': user_email, 'data': json.dumps(data),
+                                   'created_at': created_at, 'expires_at': expires_at}
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            if sid in self._sessions:
+                self._sessions[sid]['expires_at'] = expires_at
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def revoke_user(self, user_email):
+        with self._lock:
+            sids = [sid for sid, record in self._sessions.items() if record['user'] == user_email]
+            for sid in sids:
+                del self._sessions[sid]
+        return len(sids)
+
+    def list_user(self, user_email):
+        now = time.time()
+        return sorted(((sid, r['created_at'], r['expires_at']) for sid, r in list(self._sessions.items())
+                       if r['user'] == user_email and r['expires_at'] > now),
+                      key=lambda s: s[1], reverse=True)
+
+    def cleanup(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, record in self._sessions.items() if record['expires_at'] <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+def create_session_store(backend=None):
+    """A new store for ``backend`` (None for cookies); most callers want ``get_session_store``."""
+    backend = backend or config.SESSION_BACKEND
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    if backend == 'redis':
+        return RedisSessionStore()
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'cookie':
+        return None
+    raise ValueError(f"Unknown session backend: {backend}")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_session_store(backend=None):
+    """The process-wide store selected by ``LOCALDRIVE_SESSION_BACKEND`` (None for cookies).
+
+    Created on first use and shared by the session interface, revocation
+    and db_manager, so the memory backend sees the sessions it issued and
+    Redis keeps a single client per process.
+    """
+    backend = backend or config.SESSION_BACKEND
+    if backend not in _stores:
+        with _stores_lock:
+            if backend not in _stores:
+                _stores[backend] = create_session_store(backend)
+    return _stores[backend]
+
+def revoke_user_sessions(user_email):
+    """End every session of a user in the configured store; returns the count."""
+    store = get_session_store()
+    return store.revoke_user(user_email) if store is not None else 0
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data loaded from a store; the cookie only carries its id."""
+
+    def __init__(self, initial=None, token=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.token = token
+        self.expires_at = expires_at
+        self.modified = False
+        self.rotate = False
+
+    def regenerate(self):
+        """Move the data to a fresh id (call on login and logout)."""
+        self.rotate = True
+        self.modified = True
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by a session store.
+
+    Sessions can be revoked server-side (logout everywhere, password
+    change) and any worker process sharing the store can serve any request.
+    Unchanged sessions are not rewritten; their expiry slides forward at
+    most once per ``refresh_interval`` seconds.
+    """
+
+    def __init__(self, store, lifetime=None, refresh_interval=None):
+        self.store = store
+        self.lifetime = config.SESSION_LIFETIME if lifetime is None else lifetime
+        self.refresh_interval = (config.SESSION_REFRESH_INTERVAL
+                                 if refresh_interval is None else refresh_interval)
+
+    # Public static files never need the session, so skip the store lookup
+    # (sessions are opened before routing, hence paths rather than endpoints)
+    SESSIONLESS_PREFIXES = ('/static/', '/assets/')
+
+    def open_session(self, app, request):
+        if request.path.startswith(self.SESSIONLESS_PREFIXES):
+            return self.make_null_session(app)
+        token = request.cookies.get(self.get_cookie_name(app))
+        if token:
+            record = self.store.load(_digest(token))
+            if record is not None:
+                data, expires_at = record
+                return ServerSession(data, token=token, expires_at=expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.token and (session.rotate or not session):
+            self.store.delete(_digest(session.token))
+            if not session:
+                response.delete_cookie(name, domain=domain, path=path)
+                return
+            session.token = None
+        if not session:
+            return
+
+        response.vary.add('Cookie')
+        now = time.time()
+        expires_at = now + self.lifetime
+        new_token = session.token is None
+        if new_token:
+            session.token = secrets.token_urlsafe(32)
+
+        if session.modified:
+            self.store.save(_digest(session.token), session.get('user'), dict(session), expires_at)
+        elif session.expires_at is not None and expires_at - session.expires_at >= self.refresh_interval:
+            self.store.touch(_digest(session.token), expires_at)
+
+        if new_token:
+            response.set_cookie(
+                name, session.token,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
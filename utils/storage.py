@@ -0,0 +1,336 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+from utils import config
+
+BACKENDS = ('local', 's3')
+
+ObjectStat = namedtuple('ObjectStat', 'size mtime')
+ObjectInfo = namedtuple('ObjectInfo', 'key size mtime')
+
+def _read_full(stream, size):
+    """Read up to ``size`` bytes, looping over short reads."""
+    parts = []
+    remaining = size
+    while remaining > 0:
+        block = stream.read(remaining)
+        if not block:
+            break
+        parts.append(block)
+        remaining -= len(block)
+    return b''.join(parts)
+
+class StorageBackend:
+    """Where blob bytes live, addressed by ``/``-separated keys.
+
+    Backends stream in both directions: ``put_stream`` reads its source in
+    bounded pieces and ``get`` yields bytes of an object (or of one byte
+    range of it) without loading the whole object. A missing object is a
+    FileNotFoundError from ``open``/``get`` and None from ``stat``.
+    """
+
+    def put_stream(self, key, stream):
+        """Store everything read from ``stream``; returns the size."""
+        raise NotImplementedError
+
+    def put_file(self, key, source_path):
+        """Store a local file and remove it."""
+        with open(source_path, 'rb') as f:
+            self.put_stream(key, f)
+        os.remove(source_path)
+
+    def open(self, key, start=0):
+        """Readable file-like object positioned at ``start``."""
+        raise NotImplementedError
+
+    def get(self, key, start=0, end=None):
+        """Yield the bytes ``start..end`` (inclusive; None = to the end)."""
+        raise NotImplementedError
+
+    def stat(self, key):
+        """``ObjectStat`` of an object, or None if it does not exist."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove an object; missing objects are ignored."""
+        raise NotImplementedError
+
+    def list_prefixes(self, prefix=''):
+        """Sorted names of the "directories" directly under ``prefix``."""
+        raise NotImplementedError
+
+    def list_objects(self, prefix=''):
+        """``ObjectInfo`` for each object directly under ``prefix``."""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Filesystem path of an object, or None for remote backends."""
+        return None
+
+    def describe(self, key):
+        """Human-readable location, recorded in ``files.file_path``."""
+        raise NotImplementedError
+
+    @contextmanager
+    def local_copy(self, key):
+        """A filesystem path with the object's bytes for the duration of the block."""
+        path = self.local_path(key)
+        if path is not None:
+            yield path
+            return
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in self.get(key):
+                    f.write(block)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+class LocalStorage(StorageBackend):
+    """Objects as files under ``root``; keys map directly onto paths."""
+
+    def __init__(self, root, buffer_size=None):
+        self.root = root
+        self.buffer_size = buffer_size or config.CHUNK_BUFFER_SIZE
+
+    def local_path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def describe(self, key):
+        return self.local_path(key)
+
+    def put_stream(self, key, stream):
+        dest = self.local_path(key)
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        # Written beside the destination and renamed, so readers never see a partial file
+        temp_path = f'{dest}.{uuid.uuid4().hex}.tmp'
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                while True:
+                    block = stream.read(self.buffer_size)
+                    if not block:
+                        break
+                    f.write(block)
+                    size += len(block)
+            os.replace(temp_path, dest)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return size
+
+    def put_file(self, key, source_path):
+        dest = self.local_path(key)
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        try:
+            os.replace(source_path, dest)
+        except OSError:
+            # Staged on another filesystem: copy next to the destination, then rename
+            temp_path = f'{dest}.{uuid.uuid4().hex}.tmp'
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, dest)
+            os.remove(source_path)
+
+    def open(self, key, start=0):
+        f = open(self.local_path(key), 'rb')
+        if start:
+            f.seek(start)
+        return f
+
+    def get(self, key, start=0, end=None):
+        with self.open(key, start) as f:
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = self.buffer_size if remaining is None else min(self.buffer_size, remaining)
+                block = f.read(size)
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+
+    def stat(self, key):
+        try:
+            st = os.stat(self.local_path(key))
+        except FileNotFoundError:
+            return None
+        return ObjectStat(st.st_size, st.st_mtime)
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def list_prefixes(self, prefix=''):
+        try:
+            with os.scandir(self.local_path(prefix)) as entries:
+                return sorted(e.name for e in entries if e.is_dir(follow_symlinks=False))
+        except FileNotFoundError:
+            return []
+
+    def list_objects(self, prefix=''):
+        try:
+            with os.scandir(self.local_path(prefix)) as entries:
+                for entry in entries:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield ObjectInfo(prefix + entry.name, st.st_size, st.st_mtime)
+        except FileNotFoundError:
+            return
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS, MinIO, Ceph, moto).
+
+    Uploads larger than ``part_size`` use a multipart upload, so at most
+    one part is held in memory; downloads and byte ranges are ranged GETs
+    streamed in ``buffer_size`` pieces. Credentials come from the usual
+    boto3 sources (environment, shared config, instance role).
+    """
+
+    def __init__(self, bucket=None, prefix=None, endpoint_url=None, region=None,
+                 part_size=None, buffer_size=None):
+        try:
+            import boto3  # noqa: F401
+        except ImportError:
+            raise RuntimeError("The s3 storage backend requires boto3 (pip install boto3)")
+        self.bucket = bucket or config.S3_BUCKET
+        if not self.bucket:
+            raise RuntimeError("LOCALDRIVE_S3_BUCKET must be set for the s3 storage backend")
+        self.prefix = config.S3_PREFIX if prefix is None else prefix
+        self.endpoint_url = endpoint_url or config.S3_ENDPOINT_URL
+        self.region = region or config.S3_REGION
+        # S3 rejects multipart parts under 5 MB (except the last)
+        self.part_size = max(part_size or config.S3_PART_SIZE, 5 * 1024 * 1024)
+        self.buffer_size = buffer_size or config.CHUNK_BUFFER_SIZE
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # boto3 clients are thread-safe but must not cross a fork
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    import boto3
+                    session = boto3.session.Session()
+                    self._client = session.client('s3', endpoint_url=self.endpoint_url,
+                                                  region_name=self.region)
+                    self._pid = os.getpid()
+        return self._client
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def _missing(self, error):
+        code = error.response.get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def describe(self, key):
+        return f's3://{self.bucket}/{self._key(key)}'
+
+    def put_stream(self, key, stream):
+        first = _read_full(stream, self.part_size)
+        if len(first) < self.part_size:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=first)
+            return len(first)
+
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self._key(key)
+        )['UploadId']
+        parts = []
+        size = 0
+        try:
+            block = first
+            while block:
+                number = len(parts) + 1
+                response = self.client.upload_part(
+                    Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                    PartNumber=number, Body=block
+                )
+                parts.append({'ETag': response['ETag'], 'PartNumber': number})
+                size += len(block)
+                block = _read_full(stream, self.part_size)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key),
+                                               UploadId=upload_id)
+            raise
+        return size
+
+    def _get_object(self, key, start=0, end=None):
+        from botocore.exceptions import ClientError
+        kwargs = {}
+        if start or end is not None:
+            kwargs['Range'] = f'bytes={start}-{"" if end is None else end}'
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key), **kwargs)['Body']
+        except ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(self.describe(key))
+            raise
+
+    def open(self, key, start=0):
+        return self._get_object(key, start)
+
+    def get(self, key, start=0, end=None):
+        body = self._get_object(key, start, end)
+        try:
+            yield from body.iter_chunks(self.buffer_size)
+        finally:
+            body.close()
+
+    def stat(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+        return ObjectStat(head['ContentLength'], head['LastModified'].timestamp())
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def _list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        return paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix), Delimiter='/')
+
+    def list_prefixes(self, prefix=''):
+        start = len(self._key(prefix))
+        names = []
+        for page in self._list(prefix):
+            for common in page.get('CommonPrefixes', ()):
+                names.append(common['Prefix'][start:].rstrip('/'))
+        return sorted(names)
+
+    def list_objects(self, prefix=''):
+        strip = len(self.prefix)
+        for page in self._list(prefix):
+            for item in page.get('Contents', ()):
+                yield ObjectInfo(item['Key'][strip:], item['Size'], item['LastModified'].timestamp())
+
+def get_storage(backend=None):
+    """The blob storage backend selected by ``LOCALDRIVE_STORAGE_BACKEND``."""
+    backend = backend or config.STORAGE_BACKEND
+    if backend == 'local':
+        return LocalStorage(config.BLOB_FOLDER)
+    if backend == 's3':
+        return S3Storage()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from utils import config
+
+class ChunkedUploads:
+    """Resumable uploads staged on disk and assembled chunk by chunk.
+
+    Each upload is a ``<id>.part`` data file plus a ``<id>.json`` descriptor in
+    the staging directory. The size of the part file is the resume offset, so a
+    client that lost its connection asks for the offset and continues from
+    there. The SHA-256 is updated as bytes are written; if the running digest
+    is lost (restart or another worker) it is rebuilt from the part file once.
+    """
+
+    def __init__(self, staging_dir=None, buffer_size=None, max_chunk_size=None,
+                 max_upload_size=None, stale_after=None):
+        self.staging_dir = staging_dir or os.path.join(config.UPLOAD_FOLDER, '.partial')
+        self.buffer_size = buffer_size or config.CHUNK_BUFFER_SIZE
+        self.max_chunk_size = max_chunk_size or config.MAX_CHUNK_SIZE
+        self.max_upload_size = max_upload_size or config.MAX_UPLOAD_SIZE
+        self.stale_after = stale_after or config.STALE_UPLOAD_SECONDS
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+        self._hashers = {}  # upload_id -> (offset, hasher)
+        self._last_cleanup = 0.0
+
+    def _paths(self, upload_id):
+        base = os.path.join(self.staging_dir, upload_id)
+        return base + '.part', base + '.json'
+
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            lock = self._upload_locks.get(upload_id)
+            if lock is None:
+                lock = self._upload_locks[upload_id] = threading.Lock()
+            return lock
+
+    def _forget(self, upload_id):
+        with self._lock:
+            self._upload_locks.pop(upload_id, None)
+            self._hashers.pop(upload_id, None)
+
+    def _valid_id(self, upload_id):
+        try:
+            return uuid.UUID(upload_id).hex == upload_id
+        except (ValueError, AttributeError, TypeError):
+            return False
+
+    def create(self, user_email, filename, total_size):
+        """Start a new upload session and return its descriptor."""
+        if total_size < 0 or total_size > self.max_upload_size:
+            return False, "File is too large", None
+
+        self.cleanup_stale_if_due()
+
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        meta = {
+            'upload_id': upload_id,
+            'user_email': user_email,
+            'filename': filename,
+            'size': total_size,
+            'created_at': time.time(),
+        }
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+        with self._lock:
+            self._hashers[upload_id] = (0, hashlib.sha256())
+        return True, "Upload started", self._describe(meta, 0)
+
+    def _describe(self, meta, offset):
+        return {
+            'upload_id': meta['upload_id'],
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'offset': offset,
+            'chunk_size': self.max_chunk_size,
+        }
+
+    def _load(self, upload_id, user_email):
+        """Load an upload's descriptor, checking ownership."""
+        if not self._valid_id(upload_id):
+            return None
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('user_email') != user_email or not os.path.exists(part_path):
+            return None
+        return meta
+
+    def status(self, upload_id, user_email):
+        """Return the upload descriptor with the current resume offset."""
+        meta = self._load(upload_id, user_email)
+        if not meta:
+            return None
+        part_path, _ = self._paths(upload_id)
+        return self._describe(meta, os.path.getsize(part_path))
+
+    def _hasher_at(self, upload_id, part_path, offset):
+        """Running SHA-256 for the first ``offset`` bytes of the part file."""
+        with self._lock:
+            state = self._hashers.get(upload_id)
+        if state and state[0] == offset:
+            return state[1]
+
+        hasher = hashlib.sha256()
+        remaining = offset
+        with open(part_path, 'rb') as f:
+            while remaining > 0:
+                block = f.read(min(self.buffer_size, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    def write_chunk(self, upload_id, user_email, offset, stream, length):
+        """Append ``length`` bytes from ``stream`` at ``offset``.
+
+        Returns ``(status, message, descriptor)`` where status is one of
+        ``'ok'``, ``'not_found'``, ``'conflict'`` or ``'invalid'``. On an offset
+        mismatch the descriptor carries the offset the client should resume from.
+        """
+        meta = self._load(upload_id, user_email)
+        if not meta:
+            return 'not_found', "Upload not found", None
+        if length is None or length <= 0:
+            return 'invalid', "Chunk length required", None
+        if length > self.max_chunk_size:
+            return 'invalid', "Chunk is too large", None
+
+        part_path, _ = self._paths(upload_id)
+        with self._upload_lock(upload_id):
+            current = os.path.getsize(part_path)
+            if offset != current:
+                return 'conflict', "Offset does not match upload progress", self._describe(meta, current)
+            if current + length > meta['size']:
+                return 'invalid', "Chunk exceeds declared file size", self._describe(meta, current)
+
+            hasher = self._hasher_at(upload_id, part_path, current)
+            written = current
+            try:
+                with open(part_path, 'r+b') as f:
+                    f.seek(current)
+                    remaining = length
+                    while remaining > 0:
+                        block = stream.read(min(self.buffer_size, remaining))
+                        if not block:
+                            break
+                        f.write(block)
+                        hasher.update(block)
+                        written += len(block)
+                        remaining -= len(block)
+            finally:
+                # Whatever reached the disk is kept, so a dropped connection
+                # resumes from the last full buffer instead of the chunk start.
+                with self._lock:
+                    self._hashers[upload_id] = (written, hasher)
+
+        return 'ok', "Chunk stored", self._describe(meta, written)
+
+    def finalize(self, upload_id, user_email, expected_sha256=None):
+        """Verify a complete upload and hand back its staged file.
+
+        Returns ``(success, message, info)``; ``info`` holds the part file
+        path, original filename, size and SHA-256. The caller moves or
+        registers the part file and then calls :meth:`discard`.
+        """
+        meta = self._load(upload_id, user_email)
+        if not meta:
+            return False, "Upload not found", None
+
+        part_path, _ = self._paths(upload_id)
+        with self._upload_lock(upload_id):
+            size = os.path.getsize(part_path)
+            if size != meta['size']:
+                return False, f"Upload incomplete: {size} of {meta['size']} bytes received", None
+
+            sha256 = self._hasher_at(upload_id, part_path, size).hexdigest()
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                return False, "Checksum mismatch", None
+
+        return True, "Upload complete", {
+            'path': part_path,
+            'filename': meta['filename'],
+            'size': size,
+            'sha256': sha256,
+        }
+
+    def discard(self, upload_id):
+        """Remove an upload's staging files."""
+        if not self._valid_id(upload_id):
+            return
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._forget(upload_id)
+
+    def abort(self, upload_id, user_email):
+        """Cancel an upload owned by ``user_email``."""
+        if not self._load(upload_id, user_email):
+            return False, "Upload not found"
+        self.discard(upload_id)
+        return True, "Upload cancelled"
+
+    def cleanup_stale(self, now=None):
+        """Delete partial uploads that have not received data recently."""
+        now = now or time.time()
+        removed = 0
+        with os.scandir(self.staging_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                upload_id = entry.name[:-len('.json')]
+                part_path, meta_path = self._paths(upload_id)
+                try:
+                    last_activity = max(
+                        os.path.getmtime(meta_path),
+                        os.path.getmtime(part_path) if os.path.exists(part_path) else 0
+                    )
+                except OSError:
+                    continue
+                if now - last_activity > self.stale_after:
+                    self.discard(upload_id)
+                    removed += 1
+        return removed
+
+    def cleanup_stale_if_due(self):
+        """Run garbage collection at most once per hour per process."""
+        now = time.time()
+        if now - self._last_cleanup < 3600:
+            return 0
+        self._last_cleanup = now
+        try:
+            return self.cleanup_stale(now)
+        except OSError as e:
+            print(f"Error cleaning up stale uploads: {e}")
+            return 0
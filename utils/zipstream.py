@@ -0,0 +1,68 @@
+import io
+import zipfile
+from datetime import datetime
+
+from utils import config
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable sink that collects bytes until drained.
+
+    Handing this to ZipFile makes it emit data descriptors instead of
+    seeking back to patch local headers, so the archive can be streamed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _zip_date(upload_date):
+    try:
+        moment = datetime.strptime(upload_date, '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        moment = datetime.now()
+    return max(moment, datetime(1980, 1, 1)).timetuple()[:6]
+
+def stream_zip(entries, buffer_size=None):
+    """Yield a ZIP archive of ``entries`` chunk by chunk.
+
+    ``entries`` is an iterable of ``(arcname, open_source, size, upload_date)``
+    where ``open_source()`` returns a readable binary file-like object.
+    Members are STORED (PDFs do not compress) and nothing is buffered
+    beyond one read buffer, so memory use is independent of archive size
+    and the first bytes go out as soon as the first file is opened.
+    """
+    buffer_size = buffer_size or config.CHUNK_BUFFER_SIZE
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, open_source, size, upload_date in entries:
+            try:
+                source = open_source()
+            except Exception as e:
+                print(f"Skipping {arcname} in archive: {e}")
+                continue
+            with source:
+                info = zipfile.ZipInfo(arcname, date_time=_zip_date(upload_date))
+                info.compress_type = zipfile.ZIP_STORED
+                info.file_size = size
+                with archive.open(info, mode='w', force_zip64=size >= zipfile.ZIP64_LIMIT) as member:
+                    while True:
+                        block = source.read(buffer_size)
+                        if not block:
+                            break
+                        member.write(block)
+                        yield sink.drain()
+            yield sink.drain()
+    # Central directory, written when the archive closes
+    yield sink.drain()